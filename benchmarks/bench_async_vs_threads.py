@@ -0,0 +1,106 @@
+"""
+Бенчмарк: синхронный бот (main.py, пул потоков) против asyncio-бота (main_async.py).
+Оба получают одну и ту же пачку /ask от разных пользователей и отвечают через
+локальные заглушки Telegram и OpenRouter; меряем время до последнего ответа.
+
+Запуск:
+    python benchmarks/bench_async_vs_threads.py [кол-во /ask] [задержка модели, с] [потоков синхронного бота]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+DELAY_S = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+THREADS = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DB_PATH"] = os.path.join(_tmp.name, "bench.db")
+os.environ.setdefault("TOKEN", "123456:bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+# очередь к LLM не должна быть узким местом ни в одном режиме
+for name in ("LLM_CONCURRENCY", "LLM_MODEL_CONCURRENCY", "LLM_QUEUE_DEPTH"):
+    os.environ[name] = str(N)
+# потоки синхронного бота — полосы ChatLanes
+os.environ["CHAT_LANES"] = str(THREADS)
+# Оба режима отвечают через одну и ту же очередь отправки main.bot.outbox. С настоящими
+# лимитами (30 сообщений/с) время упирается в лимит Telegram, а не в обработку, причём
+# синхронный бот по ходу потока ещё и правит ответ, тратя больше отправок. Поэтому по
+# умолчанию лимиты сняты; SEND_GLOBAL_PER_S=30 SEND_CHAT_PER_S=1 в окружении вернут их.
+os.environ.setdefault("SEND_GLOBAL_PER_S", str(10 * N))
+os.environ.setdefault("SEND_CHAT_PER_S", str(10 * N))
+os.environ.setdefault("SEND_WORKERS", str(THREADS))
+
+import telebot  # noqa: E402
+from telebot import asyncio_helper, types  # noqa: E402
+
+import main  # noqa: E402
+import main_async  # noqa: E402
+import openrouter_client  # noqa: E402
+from fake_openrouter import FakeOpenRouter  # noqa: E402
+from fake_telegram import FakeTelegram  # noqa: E402
+
+
+def _updates(first_user: int, label: str) -> list:
+    updates = []
+    for i in range(N):
+        text = f"/ask {label}: вопрос номер {i}"  # разные вопросы — кэш и склейка не помогают
+        updates.append(types.Update.de_json({
+            "update_id": first_user + i,
+            "message": {
+                "message_id": i + 1,
+                "date": int(time.time()),
+                "chat": {"id": first_user + i, "type": "private"},
+                "from": {"id": first_user + i, "is_bot": False, "first_name": "bench"},
+                "text": text,
+                "entities": [{"type": "bot_command", "offset": 0, "length": 4}],
+            },
+        }))
+    return updates
+
+
+def bench_threads(tg: FakeTelegram) -> tuple[float, int]:
+    updates = _updates(1_000_000, "threads")
+    tg.reset()
+    t0 = time.perf_counter()
+    main.bot.process_new_updates(updates)
+    if not tg.wait_answers(N, timeout_s=N * DELAY_S + 60):
+        raise RuntimeError(f"синхронный бот ответил только на {len(tg.answers)} из {N}")
+    return time.perf_counter() - t0, THREADS
+
+
+async def _bench_async(tg: FakeTelegram) -> float:
+    updates = _updates(2_000_000, "asyncio")
+    tg.reset()
+    t0 = time.perf_counter()
+    await main_async.bot.process_new_updates(updates)
+    if not await asyncio.to_thread(tg.wait_answers, N, N * DELAY_S + 60):
+        raise RuntimeError(f"asyncio-бот ответил только на {len(tg.answers)} из {N}")
+    elapsed = time.perf_counter() - t0
+    await main_async.shutdown()  # заодно останавливает полосы и очередь отправки main.bot
+    return elapsed
+
+
+def main_bench() -> None:
+    with FakeTelegram() as tg, FakeOpenRouter(delay_s=DELAY_S) as llm:
+        telebot.apihelper.API_URL = tg.api_url
+        asyncio_helper.API_URL = tg.api_url
+        openrouter_client.OPENROUTER_API = llm.url
+
+        threads_s, threads = bench_threads(tg)
+        openrouter_client.response_cache.clear()
+        async_s = asyncio.run(_bench_async(tg))
+
+    print(f"/ask: {N}, задержка модели: {DELAY_S} с")
+    print(f"threads (пул {threads}):     {threads_s:7.2f} с, {N / threads_s:7.1f} ответов/с")
+    print(f"asyncio (пул БД {main_async.DB_EXECUTOR_WORKERS}):    {async_s:7.2f} с, {N / async_s:7.1f} ответов/с")
+    print(f"ускорение: x{threads_s / async_s:.1f}")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,95 @@
+"""
+Бенчмарк: база при рассылке гороскопа по next_fire_utc.
+  * выборка наступивших (одна минута рассылки) — диапазон по idx_users_next_fire
+    против полного скана users;
+  * пик нагрузки: сколько сообщений приходится на самую загруженную минуту, если
+    все живут по времени сервера (старая схема: час без поясов и разброса) и если
+    у каждого свой пояс и сдвиг внутри часа;
+  * перенос next_fire_utc 100k пользователям: UPDATE на каждого против reschedule_users пачками.
+
+Запуск:
+    python benchmarks/bench_broadcast_db.py [кол-во подписчиков]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db3  # noqa: E402
+
+NOW = datetime(2026, 10, 18, 0, 0, tzinfo=timezone.utc)
+ZONES = ["Europe/Moscow", "Europe/Kaliningrad", "Europe/Samara", "Asia/Yekaterinburg", "Asia/Omsk",
+         "Asia/Novosibirsk", "Asia/Krasnoyarsk", "Asia/Irkutsk", "Asia/Vladivostok", "Europe/Berlin",
+         "America/New_York", "Asia/Almaty"]
+MORNING_HOURS = [7, 8, 8, 9, 9, 9, 10, 10, 11, 20, 21]  # подписчики любят утро
+RESCHEDULE_USERS = 100_000
+PER_USER_SAMPLE = 2000  # поштучные транзакции медленные — меряем на выборке и пересчитываем
+
+
+def fill(n: int) -> list[tuple]:
+    rnd = random.Random(1)
+    rows = []
+    for uid in range(1, n + 1):
+        hour, tz = rnd.choice(MORNING_HOURS), rnd.choice(ZONES)
+        rows.append((uid, hour, tz, db3.next_fire_utc(uid, hour, tz, NOW)))
+    with db3._connect() as conn:
+        conn.executemany(
+            "INSERT INTO users(user_id, sign, notify_hour, tz, next_fire_utc) VALUES (?, 'лев', ?, ?, ?)", rows)
+    return rows
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    with tempfile.TemporaryDirectory() as tmp:
+        db3.DB_PATH = os.path.join(tmp, "bench.db")
+        db3.init_db()
+        rows = fill(n)
+
+        # самая загруженная минута — именно её планировщик выбирает за одно пробуждение
+        per_minute = Counter(fire // 60 for _, _, _, fire in rows)
+        busiest, peak_new = per_minute.most_common(1)[0]
+        peak_old = Counter(hour for _, hour, _, _ in rows).most_common(1)[0][1]
+
+        with db3._connect() as conn:
+            conn.execute("UPDATE users SET next_fire_utc = next_fire_utc + 86400 WHERE next_fire_utc < ?",
+                         (busiest * 60,))  # эти уже «разосланы»
+            now_ts = busiest * 60 + 59
+            t0 = time.perf_counter()
+            indexed = conn.execute(db3._DUE_USERS_SQL, (now_ts,)).fetchall()
+            indexed_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            scanned = conn.execute(db3._DUE_USERS_SQL.replace("FROM users", "FROM users NOT INDEXED"),
+                                   (now_ts,)).fetchall()
+            scan_s = time.perf_counter() - t0
+        assert len(indexed) == len(scanned) == peak_new
+
+        updates = [(fire + 86400, uid) for uid, _, _, fire in rows[:RESCHEDULE_USERS]]
+        t0 = time.perf_counter()
+        for fire, uid in updates[:PER_USER_SAMPLE]:
+            with db3._connect() as conn:
+                conn.execute("UPDATE users SET next_fire_utc=? WHERE user_id=?", (fire, uid))
+        per_user_s = (time.perf_counter() - t0) * len(updates) / PER_USER_SAMPLE
+
+        t0 = time.perf_counter()
+        for i in range(0, len(updates), db3.DUE_CHUNK_SIZE):
+            db3.reschedule_users(updates[i:i + db3.DUE_CHUNK_SIZE])
+        bulk_s = time.perf_counter() - t0
+
+    batches = -(-len(updates) // db3.DUE_CHUNK_SIZE)
+    print(f"подписчиков: {n}")
+    print(f"пик в минуту, время сервера без разброса: {peak_old}")
+    print(f"пик в минуту, пояса + сдвиг внутри часа:  {peak_new}")
+    print(f"выборка минуты по idx_users_next_fire: {indexed_s * 1000:9.2f} мс")
+    print(f"выборка минуты полным сканом:          {scan_s * 1000:9.2f} мс")
+    print(f"перенос {len(updates)}: по одному (оценка) {per_user_s * 1000:9.1f} мс, "
+          f"reschedule_users ({batches} транзакций) {bulk_s * 1000:9.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Бенчмарк: тексты рассылки гороскопа на 100k подписчиков —
+make_daily_text на каждого получателя против готовых текстов DailyTexts.
+
+Запуск:
+    python benchmarks/bench_daily_texts.py [кол-во подписчиков]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db3  # noqa: E402
+from horoscope3 import CANON_SIGNS, DailyTexts, make_daily_text  # noqa: E402
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rnd = random.Random(1)
+    signs = [rnd.choice(CANON_SIGNS) for _ in range(n)]
+    today = date.today()
+
+    t0 = time.perf_counter()
+    for sign in signs:
+        make_daily_text(sign, today)
+    per_user_s = time.perf_counter() - t0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db3.DB_PATH = os.path.join(tmp, "bench.db")
+        db3.init_db()
+
+        texts = DailyTexts()
+        t0 = time.perf_counter()
+        texts.warm_ahead(today)
+        warm_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for sign in signs:
+            texts.get(sign, today)
+        cached_s = time.perf_counter() - t0
+
+        # «перезапуск»: новый кэш поднимает тексты из базы, а не рендерит
+        restarted = DailyTexts()
+        t0 = time.perf_counter()
+        restarted.for_date(today)
+        restart_s = time.perf_counter() - t0
+        assert restarted.stats()["renders"] == 0
+
+    print(f"подписчиков: {n}")
+    print(f"make_daily_text на каждого: {per_user_s * 1000:9.1f} мс")
+    print(f"DailyTexts.get:             {cached_s * 1000:9.1f} мс (x{per_user_s / cached_s:.0f})")
+    print(f"прогрев (2 дня, 24 текста): {warm_s * 1000:9.1f} мс")
+    print(f"после перезапуска из базы:  {restart_s * 1000:9.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
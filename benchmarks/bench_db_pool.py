@@ -0,0 +1,62 @@
+"""
+Микробенчмарк: соединение на каждый вызов против пула соединений db.py.
+
+Запуск:
+    python benchmarks/bench_db_pool.py [кол-во вызовов]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+def _old_connect():
+    # так db._connect() работал до пула: новое соединение и три PRAGMA на каждый вызов
+    conn = sqlite3.connect(db.DB_PATH, timeout=5.0)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA busy_timeout = 5000")
+    return conn
+
+
+def _old_list_notes(user_id: int, limit: int = 50):
+    with _old_connect() as conn:
+        return conn.execute(
+            "SELECT id, text, created_at FROM notes WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (user_id, limit)
+        ).fetchall()
+
+
+def _measure(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn(1)
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        for i in range(20):
+            db.add_note(1, f"заметка {i}")
+
+        old_us = _measure(_old_list_notes, n)
+        new_us = _measure(db.list_notes, n)
+        db.close_all()
+
+    print(f"connect-per-call: {old_us:8.1f} мкс/вызов")
+    print(f"pooled:           {new_us:8.1f} мкс/вызов")
+    print(f"экономия:         {old_us - new_us:8.1f} мкс/вызов (x{old_us / new_us:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+broadcast3.py — доставка ежедневной рассылки гороскопа (для main3.py).
+
+DailyScheduler решает, кому и когда отправить, Broadcaster — доставляет и учитывает:
+  * сообщения идут через SendQueue бота: пул SEND_WORKERS потоков с лимитами Telegram,
+    429 и временные сбои (5xx, обрыв соединения) повторяются там же;
+  * в полёте не больше MAX_IN_FLIGHT сообщений — submit придерживает планировщик,
+    а не раздувает очередь отправки на весь час;
+  * итог по каждому получателю копится и пишется пачкой (db3.record_deliveries):
+    отправка отмечается только после успешной доставки, 403 и «chat not found» уходят
+    в dead_letters с автоматической отпиской, прочие ошибки получают статус failed —
+    «пропущен за день»: повторы уже были в SendQueue, следующая попытка — завтрашняя рассылка;
+  * stats() — отправлено/ошибок, скорость за последнюю минуту и оценка оставшегося времени:
+    в остаток входят и те, кого планировщик ещё не передал в submit (set_backlog).
+"""
+
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from datetime import date
+from typing import Callable
+
+import db3 as db
+
+log = logging.getLogger(__name__)
+
+MAX_IN_FLIGHT = int(os.getenv("BROADCAST_MAX_IN_FLIGHT", "1000"))
+RECORD_BATCH = int(os.getenv("BROADCAST_RECORD_BATCH", str(db.DUE_CHUNK_SIZE)))
+RECORD_FLUSH_S = float(os.getenv("BROADCAST_RECORD_FLUSH_S", "10"))
+RATE_WINDOW_S = 60.0
+
+# 400 с таким описанием — получателя больше нет, повторять бессмысленно
+_DEAD_DESCRIPTIONS = ("chat not found", "user not found", "user is deactivated", "peer_id_invalid")
+
+
+def dead_letter_reason(error: BaseException) -> str | None:
+    """Причина, по которой получателю доставить нельзя никогда; None — ошибка не окончательная."""
+    code = getattr(error, "error_code", None)
+    description = str(getattr(error, "description", None) or error)
+    if code == 403 or (code == 400 and any(d in description.lower() for d in _DEAD_DESCRIPTIONS)):
+        return description
+    return None
+
+
+class Broadcaster:
+    """
+    send(chat_id, text) ставит сообщение в очередь и возвращает Future (QueuedTeleBot.send_message_nowait);
+    record(for_date, outcomes) записывает пачку итогов (user_id, status, error_code, error).
+    """
+
+    def __init__(self, send: Callable[[int, str], Future],
+                 record: Callable[[str, list], None] = db.record_deliveries,
+                 max_in_flight: int = MAX_IN_FLIGHT, record_batch: int = RECORD_BATCH,
+                 record_flush_s: float = RECORD_FLUSH_S, clock: Callable[[], float] = time.monotonic):
+        self.send = send
+        self.record = record
+        self.record_batch = record_batch
+        self.record_flush_s = record_flush_s
+        self._clock = clock
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._record_lock = threading.Lock()  # пачки пишутся по одной и по порядку
+        self._outcomes: dict[date, list[tuple]] = {}  # итоги, ещё не записанные в базу
+        self._unrecorded_since: float | None = None
+        self._in_flight = 0
+        self._backlog = 0  # получатели, которых планировщик ещё не передал в submit
+        self._sent_at: deque[float] = deque()  # моменты доставок за последние RATE_WINDOW_S
+        self._started_at: float | None = None
+        self._stats = {"submitted": 0, "sent": 0, "failed": 0, "dead": 0,
+                       "record_batches": 0, "record_errors": 0}
+
+    def submit(self, user_id: int, text: str, for_date: date) -> Future | None:
+        """Отправляет text пользователю; блокирует, пока в полёте MAX_IN_FLIGHT сообщений."""
+        self._slots.acquire()
+        with self._lock:
+            if self._started_at is None:
+                self._started_at = self._clock()
+            self._in_flight += 1
+            self._backlog = max(self._backlog - 1, 0)
+            self._stats["submitted"] += 1
+        try:
+            future = self.send(user_id, text)
+        except Exception as e:
+            # очередь не приняла сообщение (например, закрыта) — это тоже итог доставки
+            self._finish(user_id, for_date, e)
+            return None
+        future.add_done_callback(lambda f: self._finish(user_id, for_date, _error_of(f)))
+        return future
+
+    def _finish(self, user_id: int, for_date: date, error: BaseException | None) -> None:
+        self._slots.release()
+        if error is None:
+            outcome = (user_id, "sent", None, None)
+        else:
+            reason = dead_letter_reason(error)
+            code = getattr(error, "error_code", None)
+            outcome = (user_id, "failed", code, repr(error)[:200]) if reason is None else (user_id, "dead", code, reason)
+            if reason is None:
+                log.warning("Daily message to %s failed: %r", user_id, error)
+        now = self._clock()
+        with self._lock:
+            self._in_flight -= 1
+            self._stats[outcome[1]] += 1
+            if error is None:
+                self._sent_at.append(now)
+            self._outcomes.setdefault(for_date, []).append(outcome)
+            if self._unrecorded_since is None:
+                self._unrecorded_since = now
+            unrecorded = sum(len(o) for o in self._outcomes.values())
+            due = (unrecorded >= self.record_batch or self._in_flight == 0
+                   or now - self._unrecorded_since >= self.record_flush_s)
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """Пишет накопленные итоги — одна транзакция на дату; при ошибке они остаются до следующего раза."""
+        with self._record_lock:
+            with self._lock:
+                batches, self._outcomes = self._outcomes, {}
+                self._unrecorded_since = None
+            failed: dict[date, list[tuple]] = {}
+            for day in sorted(batches):
+                try:
+                    self.record(day.isoformat(), batches[day])
+                except Exception as e:
+                    failed[day] = batches[day]
+                    log.warning("Recording %d deliveries failed: %r", len(batches[day]), e)
+                    continue
+                with self._lock:
+                    self._stats["record_batches"] += 1
+            with self._lock:
+                for day, outcomes in failed.items():
+                    self._stats["record_errors"] += 1
+                    self._outcomes[day] = outcomes + self._outcomes.get(day, [])
+                if self._outcomes and self._unrecorded_since is None:
+                    self._unrecorded_since = self._clock()
+        if batches:
+            log.info("Broadcast progress: %s", self.stats())
+
+    def set_backlog(self, count: int) -> None:
+        """Сколько получателей ещё будет передано в submit; каждый submit уменьшает это число."""
+        with self._lock:
+            self._backlog = count
+
+    def stats(self, backlog: int | None = None) -> dict:
+        """
+        Итоги, скорость доставки (в секунду, за последнюю минуту) и ETA для in_flight + backlog
+        сообщений; по умолчанию backlog — то, что сообщил планировщик через set_backlog.
+        """
+        now = self._clock()
+        with self._lock:
+            while self._sent_at and now - self._sent_at[0] > RATE_WINDOW_S:
+                self._sent_at.popleft()
+            stats = dict(self._stats, in_flight=self._in_flight,
+                         unrecorded=sum(len(o) for o in self._outcomes.values()))
+            if backlog is None:
+                backlog = self._backlog
+            window = min(RATE_WINDOW_S, now - self._started_at) if self._started_at is not None else 0.0
+            rate = len(self._sent_at) / window if window > 0 else 0.0
+        remaining = stats["in_flight"] + backlog
+        stats["backlog"] = backlog
+        stats["sent_per_s"] = round(rate, 2)
+        stats["eta_s"] = round(remaining / rate) if rate else (0 if not remaining else None)
+        return stats
+
+
+def _error_of(future: Future) -> BaseException | None:
+    if future.cancelled():
+        return RuntimeError("отправка отменена")
+    return future.exception()
@@ -0,0 +1,178 @@
+"""
+chat_dispatch.py — диспетчер обновлений: порядок внутри чата, параллельность между чатами.
+
+Во встроенном threaded-режиме telebot два обновления одного чата (например,
+/note_add и сразу /note_list) могут выполниться не по порядку, а без потоков всё
+выполняется строго по одному. ChatLanes раскладывает обновления по N «полосам»
+по chat.id: у каждой полосы один поток и своя ограниченная очередь, поэтому чат
+всегда попадает в одну полосу и обрабатывается по порядку, а разные чаты — параллельно.
+
+Когда очередь полосы заполнена, submit ждёт — это давление назад на polling/webhook,
+а не рост памяти. Настройка: CHAT_LANES (8), CHAT_LANE_DEPTH (50).
+"""
+
+from __future__ import annotations
+import os
+import queue
+import threading
+import time
+from typing import Callable, List
+
+CHAT_LANES = int(os.getenv("CHAT_LANES", "8"))
+CHAT_LANE_DEPTH = int(os.getenv("CHAT_LANE_DEPTH", "50"))
+
+# типы обновлений, у которых есть чат, и те, где известен только пользователь
+_CHAT_FIELDS = ("message", "edited_message", "channel_post", "edited_channel_post", "business_message",
+                "edited_business_message", "my_chat_member", "chat_member", "chat_join_request")
+_USER_FIELDS = ("inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query")
+
+
+def chat_key(update) -> int:
+    """Ключ упорядочивания: id чата, для событий без чата — id пользователя, иначе update_id."""
+    for name in _CHAT_FIELDS:
+        event = getattr(update, name, None)
+        if event is not None:
+            return event.chat.id
+    call = getattr(update, "callback_query", None)
+    if call is not None:
+        # кнопка под сообщением относится к его чату — в одну полосу с командами этого чата
+        return call.message.chat.id if call.message is not None else call.from_user.id
+    for name in _USER_FIELDS:
+        event = getattr(update, name, None)
+        if event is not None:
+            return event.from_user.id
+    return update.update_id
+
+
+class _Lane:
+    def __init__(self, depth: int):
+        self.queue: queue.Queue = queue.Queue(maxsize=depth)
+        self.max_depth = 0
+        self.processed = 0
+        self.errors = 0
+        self.rejected = 0
+        self.wait_ms_total = 0
+        self.wait_ms_max = 0
+        self.handler_ms_total = 0
+        self.handler_ms_max = 0
+
+    def snapshot(self) -> dict:
+        done = max(self.processed, 1)
+        return {
+            "depth": self.queue.qsize(),
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "wait_ms_avg": self.wait_ms_total // done,
+            "wait_ms_max": self.wait_ms_max,
+            "handler_ms_avg": self.handler_ms_total // done,
+            "handler_ms_max": self.handler_ms_max,
+        }
+
+
+class ChatLanes:
+    """
+    process получает список из одного обновления (обычно обработка telebot без
+    собственных потоков) и вызывается из потока полосы. lanes — число полос и
+    потоков, depth — сколько обновлений может ждать в одной полосе.
+    """
+
+    def __init__(self, process: Callable[[List], None], lanes: int = CHAT_LANES, depth: int = CHAT_LANE_DEPTH):
+        self.process = process
+        self._lanes = [_Lane(depth) for _ in range(lanes)]
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._threads = [threading.Thread(target=self._work, args=(lane,), name=f"chat-lane-{i}", daemon=True)
+                         for i, lane in enumerate(self._lanes)]
+        self._started = False
+
+    def lane_for(self, update) -> int:
+        return chat_key(update) % len(self._lanes)
+
+    def submit(self, update, timeout_s: float | None = None) -> bool:
+        """
+        Ставит обновление в полосу его чата. Если полоса заполнена — ждёт места
+        (не дольше timeout_s, если он задан). False — не дождались или диспетчер остановлен.
+        """
+        if not self._started:
+            self.start()
+        lane = self._lanes[self.lane_for(update)]
+        deadline = None if timeout_s is None else time.monotonic() + timeout_s
+        item = (time.monotonic(), update)
+        while not self._stopping.is_set():
+            wait = 0.5 if deadline is None else min(0.5, deadline - time.monotonic())
+            try:
+                lane.queue.put(item, timeout=max(wait, 0))
+            except queue.Full:
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                continue
+            with self._lock:
+                lane.max_depth = max(lane.max_depth, lane.queue.qsize())
+            return True
+        with self._lock:
+            lane.rejected += 1
+        return False
+
+    def submit_all(self, updates: List) -> None:
+        for update in updates:
+            self.submit(update)
+
+    def _work(self, lane: _Lane) -> None:
+        while True:
+            try:
+                queued_at, update = lane.queue.get(timeout=0.2)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            started = time.monotonic()
+            ok = True
+            try:
+                self.process([update])
+            except Exception as e:
+                ok = False
+                print(f"Ошибка обработки обновления {update.update_id}: {e}")
+            finished = time.monotonic()
+            wait_ms, handler_ms = int((started - queued_at) * 1000), int((finished - started) * 1000)
+            with self._lock:
+                lane.processed += 1
+                lane.errors += not ok
+                lane.wait_ms_total += wait_ms
+                lane.wait_ms_max = max(lane.wait_ms_max, wait_ms)
+                lane.handler_ms_total += handler_ms
+                lane.handler_ms_max = max(lane.handler_ms_max, handler_ms)
+            lane.queue.task_done()
+
+    def start(self) -> "ChatLanes":
+        """Запускает потоки полос; submit делает это сам при первом обновлении."""
+        with self._lock:
+            if not self._started:
+                for thread in self._threads:
+                    thread.start()
+                self._started = True
+        return self
+
+    def stop(self, drain_timeout_s: float = 30.0) -> bool:
+        """Перестаёт принимать обновления и дорабатывает уже поставленные; True — успели всё."""
+        self._stopping.set()
+        if not self._started:
+            return True
+        deadline = time.monotonic() + drain_timeout_s
+        for thread in self._threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        return not any(t.is_alive() for t in self._threads)
+
+    def stats(self) -> dict:
+        """Метрики по полосам и итог: глубина очередей, ожидание в очереди и время обработчика."""
+        with self._lock:
+            lanes = [lane.snapshot() for lane in self._lanes]
+        return {
+            "lanes": lanes,
+            "depth": sum(l["depth"] for l in lanes),
+            "processed": sum(l["processed"] for l in lanes),
+            "rejected": sum(l["rejected"] for l in lanes),
+            "wait_ms_max": max(l["wait_ms_max"] for l in lanes),
+            "handler_ms_max": max(l["handler_ms_max"] for l in lanes),
+        }
@@ -1,11 +1,21 @@
 import os
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 
 DB_PATH = os.getenv("DB_PATH", "bot.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_HEALTH_CHECK_S = float(os.getenv("DB_POOL_HEALTH_CHECK_S", "30"))
+USER_CHARACTER_CACHE_SIZE = int(os.getenv("USER_CHARACTER_CACHE_SIZE", "10000"))
 
 
-def _connect():
-    conn = sqlite3.connect(DB_PATH, timeout=5.0)
+def _open_connection(path: str) -> sqlite3.Connection:
+    # check_same_thread=False нужен только для close_all() из главного потока:
+    # пул сам гарантирует, что соединением пользуется один поток.
+    conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
     conn.execute("PRAGMA journal_mode = WAL")
@@ -13,6 +23,113 @@ def _connect():
     return conn
 
 
+class ConnectionPool:
+    """
+    Пул соединений SQLite с привязкой к потоку: каждый рабочий поток
+    получает своё соединение и переиспользует его, PRAGMA выполняются один раз.
+    Если потоков больше, чем max_size, лишние получают временное соединение,
+    которое закрывается после использования.
+    """
+
+    def __init__(self, max_size: int = DB_POOL_SIZE, health_check_s: float = DB_POOL_HEALTH_CHECK_S):
+        self.max_size = max_size
+        self.health_check_s = health_check_s
+        self._lock = threading.Lock()
+        self._conns: dict[int, tuple[sqlite3.Connection, str]] = {}
+        self._last_used: dict[int, float] = {}
+        self.opened = 0
+
+    def acquire(self) -> tuple[sqlite3.Connection, bool]:
+        """Возвращает (соединение, pooled). Непуловое соединение нужно закрыть самому."""
+        tid = threading.get_ident()
+        path = DB_PATH
+        with self._lock:
+            entry = self._conns.get(tid)
+            last_used = self._last_used.get(tid, 0.0)
+        if entry is not None:
+            conn, conn_path = entry
+            if conn_path == path and self._healthy(conn, last_used):
+                with self._lock:
+                    self._last_used[tid] = time.monotonic()
+                return conn, True
+            self._discard(tid)
+
+        conn = _open_connection(path)
+        with self._lock:
+            self.opened += 1
+            if len(self._conns) >= self.max_size:
+                self._evict_dead_threads()
+            if len(self._conns) >= self.max_size:
+                return conn, False
+            self._conns[tid] = (conn, path)
+            self._last_used[tid] = time.monotonic()
+        return conn, True
+
+    def _healthy(self, conn: sqlite3.Connection, last_used: float) -> bool:
+        if time.monotonic() - last_used < self.health_check_s:
+            return True
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, tid: int) -> None:
+        with self._lock:
+            entry = self._conns.pop(tid, None)
+            self._last_used.pop(tid, None)
+        if entry is not None:
+            try:
+                entry[0].close()
+            except sqlite3.Error:
+                pass
+
+    def _evict_dead_threads(self) -> None:
+        # вызывается под self._lock
+        alive = {t.ident for t in threading.enumerate()}
+        for tid in [t for t in self._conns if t not in alive]:
+            conn, _ = self._conns.pop(tid)
+            self._last_used.pop(tid, None)
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._conns)
+
+    def close_all(self) -> None:
+        """Закрывает все соединения пула (вызывать при остановке бота)."""
+        with self._lock:
+            entries = list(self._conns.values())
+            self._conns.clear()
+            self._last_used.clear()
+        for conn, _ in entries:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+
+_pool = ConnectionPool()
+
+
+@contextmanager
+def _connect():
+    conn, pooled = _pool.acquire()
+    try:
+        with conn:  # commit при успехе, rollback при исключении
+            yield conn
+    finally:
+        if not pooled:
+            conn.close()
+
+
+def close_all() -> None:
+    _pool.close_all()
+
+
 def init_db():
     schema = """
     CREATE TABLE IF NOT EXISTS notes (
@@ -22,9 +139,6 @@ def init_db():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
 
-    CREATE INDEX IF NOT EXISTS idx_user_id ON notes(user_id);
-    CREATE INDEX IF NOT EXISTS idx_created_at ON notes(created_at);
-
     CREATE TABLE IF NOT EXISTS models (
         id INTEGER PRIMARY KEY,
         key TEXT NOT NULL UNIQUE,
@@ -76,32 +190,285 @@ def init_db():
     """
     with _connect() as conn:
         conn.executescript(schema)
+        _apply_migrations(conn)
+
+
+# ---------- миграции схемы (номер хранится в PRAGMA user_version) ----------
+def _fold_sql(expr: str) -> str:
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+MIGRATIONS: list[tuple[int, str]] = [
+    # 1: полнотекстовый индекс заметок. unicode61 не сворачивает ё в е,
+    # поэтому индексируем уже нормализованный текст.
+    (1, f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+        text,
+        tokenize = 'unicode61 remove_diacritics 2'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS notes_fts_ai AFTER INSERT ON notes BEGIN
+        INSERT INTO notes_fts(rowid, text) VALUES (new.id, {_fold_sql('new.text')});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS notes_fts_ad AFTER DELETE ON notes BEGIN
+        DELETE FROM notes_fts WHERE rowid = old.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS notes_fts_au AFTER UPDATE OF text ON notes BEGIN
+        UPDATE notes_fts SET text = {_fold_sql('new.text')} WHERE rowid = new.id;
+    END;
+
+    -- заметки с id <= target_id появились до триггеров: их дозаливает backfill_notes_fts()
+    CREATE TABLE IF NOT EXISTS fts_backfill (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_id INTEGER NOT NULL DEFAULT 0,
+        target_id INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO fts_backfill(id, last_id, target_id)
+        SELECT 1, 0, COALESCE(MAX(id), 0) FROM notes;
+    """),
+    # 2: счётчик заметок на пользователя — count_notes() без чтения строк
+    (2, """
+    CREATE TABLE IF NOT EXISTS note_counts (
+        user_id INTEGER PRIMARY KEY,
+        cnt INTEGER NOT NULL DEFAULT 0
+    );
+
+    INSERT OR REPLACE INTO note_counts(user_id, cnt)
+        SELECT user_id, COUNT(*) FROM notes GROUP BY user_id;
+
+    CREATE TRIGGER IF NOT EXISTS notes_count_ai AFTER INSERT ON notes BEGIN
+        INSERT INTO note_counts(user_id, cnt) VALUES (new.user_id, 1)
+            ON CONFLICT(user_id) DO UPDATE SET cnt = cnt + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS notes_count_ad AFTER DELETE ON notes BEGIN
+        UPDATE note_counts SET cnt = cnt - 1 WHERE user_id = old.user_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS notes_count_au AFTER UPDATE OF user_id ON notes
+    WHEN old.user_id <> new.user_id BEGIN
+        UPDATE note_counts SET cnt = cnt - 1 WHERE user_id = old.user_id;
+        INSERT INTO note_counts(user_id, cnt) VALUES (new.user_id, 1)
+            ON CONFLICT(user_id) DO UPDATE SET cnt = cnt + 1;
+    END;
+    """),
+    # 3: составной индекс под постраничный вывод заметок (keyset-пагинация)
+    (3, """
+    CREATE INDEX IF NOT EXISTS idx_notes_user_id_desc ON notes(user_id, id DESC);
+    """),
+    # 4: одиночные индексы заменены составными. idx_user_id — префикс
+    # idx_notes_user_id_desc, а по одному created_at ни один запрос не фильтрует.
+    (4, """
+    DROP INDEX IF EXISTS idx_user_id;
+    DROP INDEX IF EXISTS idx_created_at;
+    CREATE INDEX IF NOT EXISTS idx_notes_user_created ON notes(user_id, created_at);
+    """),
+    # 5: версии справочников для кэшей в памяти (см. _TableCache)
+    (5, """
+    CREATE TABLE IF NOT EXISTS cache_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    );
+    INSERT OR IGNORE INTO cache_versions(name, version) VALUES ('models', 0);
+
+    CREATE TRIGGER IF NOT EXISTS models_version_ai AFTER INSERT ON models BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE name = 'models';
+    END;
+    CREATE TRIGGER IF NOT EXISTS models_version_au AFTER UPDATE ON models BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE name = 'models';
+    END;
+    CREATE TRIGGER IF NOT EXISTS models_version_ad AFTER DELETE ON models BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE name = 'models';
+    END;
+    """),
+    # 6: то же для каталога персонажей
+    (6, """
+    INSERT OR IGNORE INTO cache_versions(name, version) VALUES ('characters', 0);
+
+    CREATE TRIGGER IF NOT EXISTS characters_version_ai AFTER INSERT ON characters BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE name = 'characters';
+    END;
+    CREATE TRIGGER IF NOT EXISTS characters_version_au AFTER UPDATE ON characters BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE name = 'characters';
+    END;
+    CREATE TRIGGER IF NOT EXISTS characters_version_ad AFTER DELETE ON characters BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE name = 'characters';
+    END;
+    """),
+    # 7: цепочка запасных моделей для /ask: при недоступности активной
+    # пробуем модели с fallback_order по возрастанию (NULL — не участвует)
+    (7, """
+    ALTER TABLE models ADD COLUMN fallback_order INTEGER;
+    UPDATE models SET fallback_order = 1 WHERE key = 'google/gemini-2.5-flash-lite-preview-06-17';
+    UPDATE models SET fallback_order = 2 WHERE key = 'deepseek/deepseek-v3.2-exp';
+    UPDATE models SET fallback_order = 3 WHERE key = 'mistralai/mistral-small-24b-instruct-2501:free';
+    """),
+]
+
+
+def _apply_migrations(conn) -> None:
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, script in MIGRATIONS:
+        if number <= version:
+            continue
+        # executescript сам по себе не транзакционный — оборачиваем вручную
+        conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {number};\nCOMMIT;")
+
+
+def backfill_notes_fts(chunk_size: int = 500, pause_s: float = 0.05) -> int:
+    """
+    Дозаливает в notes_fts заметки, созданные до миграции.
+    Работает короткими транзакциями по chunk_size строк, чтобы не блокировать бота.
+    Возвращает количество проиндексированных заметок.
+    """
+    total = 0
+    while True:
+        with _connect() as conn:
+            state = conn.execute("SELECT last_id, target_id FROM fts_backfill WHERE id = 1").fetchone()
+            if state is None or state["last_id"] >= state["target_id"]:
+                return total
+            last_id, target_id = state["last_id"], state["target_id"]
+            row = conn.execute(
+                """SELECT MAX(id) FROM (
+                    SELECT id FROM notes WHERE id > ? AND id <= ? ORDER BY id LIMIT ?
+                )""",
+                (last_id, target_id, chunk_size)
+            ).fetchone()
+            upper = row[0] if row[0] is not None else target_id
+            cur = conn.execute(
+                f"""INSERT INTO notes_fts(rowid, text)
+                SELECT id, {_fold_sql('text')} FROM notes
+                WHERE id > ? AND id <= ? AND id NOT IN (SELECT rowid FROM notes_fts)""",
+                (last_id, upper)
+            )
+            conn.execute("UPDATE fts_backfill SET last_id = ? WHERE id = 1", (upper,))
+            total += cur.rowcount
+        time.sleep(pause_s)
+
+
+_fts_ready_paths: set[str] = set()
+
+
+def _fts_ready(conn) -> bool:
+    if DB_PATH in _fts_ready_paths:
+        return True
+    state = conn.execute("SELECT last_id, target_id FROM fts_backfill WHERE id = 1").fetchone()
+    if state is not None and state["last_id"] < state["target_id"]:
+        return False
+    _fts_ready_paths.add(DB_PATH)
+    return True
+
+
+def _fts_query(query: str) -> str:
+    """Превращает пользовательский запрос в запрос FTS5: все слова, поиск по префиксу."""
+    words = re.findall(r"\w+", query.replace("ё", "е").replace("Ё", "Е"))
+    return " ".join(f'"{w}"*' for w in words)
+
+
+class _TableCache:
+    """
+    Кэш небольшой таблицы-справочника в памяти процесса.
+    Перечитывается, только если таблицу изменили: PRAGMA data_version
+    (не читает с диска) показывает, что кто-то другой сделал commit, и тогда
+    сверяется счётчик из cache_versions, который поднимают триггеры.
+    Свои изменения процесс сбрасывает явно через invalidate().
+    """
+
+    def __init__(self, name: str, loader):
+        self.name = name
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._data = None
+        self._path = None
+        self._version = None
+        self._seen: dict[int, tuple[sqlite3.Connection, int]] = {}
+        self.loads = 0
+
+    def get(self):
+        tid = threading.get_ident()
+        with _connect() as conn:
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            with self._lock:
+                seen = self._seen.get(tid)
+                if (self._data is not None and self._path == DB_PATH and seen is not None
+                        and seen[0] is conn and seen[1] == data_version):
+                    return self._data
+
+            row = conn.execute("SELECT version FROM cache_versions WHERE name = ?", (self.name,)).fetchone()
+            version = row["version"] if row else 0
+            with self._lock:
+                if self._data is None or self._path != DB_PATH or self._version != version:
+                    self._data = self._loader(conn)
+                    self._path = DB_PATH
+                    self._version = version
+                    self.loads += 1
+                self._seen[tid] = (conn, data_version)
+                return self._data
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._data = None
+            self._seen.clear()
+
+
+def _load_models(conn) -> dict:
+    rows = conn.execute("SELECT id,key,label,active,fallback_order FROM models ORDER BY id").fetchall()
+    items = [{"id": r["id"], "key": r["key"], "label": r["label"], "active": bool(r["active"])} for r in rows]
+    order = {r["id"]: r["fallback_order"] for r in rows if r["fallback_order"] is not None}
+    return {
+        "list": items,
+        "by_id": {m["id"]: m for m in items},
+        "active": next((m for m in items if m["active"]), None),
+        "fallbacks": sorted((m for m in items if m["id"] in order), key=lambda m: (order[m["id"]], m["id"])),
+    }
+
+
+_models_cache = _TableCache("models", _load_models)
 
 
 def list_models() -> list[dict]:
-    with _connect() as conn:
-        rows = conn.execute("SELECT id,key,label,active FROM models ORDER BY id").fetchall()
-        return [{"id": r["id"], "key": r["key"], "label": r["label"], "active": bool(r["active"])} for r in rows]
+    return [dict(m) for m in _models_cache.get()["list"]]
 
 
 def get_active_model() -> dict:
-    with _connect() as conn:
-        row = conn.execute("SELECT id,key,label FROM models WHERE active=1").fetchone()
-        if row:
-            return {"id": row["id"], "key": row["key"], "label": row["label"], "active": True}
-        row = conn.execute("SELECT id,key,label FROM models ORDER BY id LIMIT 1").fetchone()
-        if not row:
+    registry = _models_cache.get()
+    active = registry["active"]
+    if active is None:
+        if not registry["list"]:
             raise RuntimeError("В реестре моделей нет записей")
-        conn.execute("UPDATE models SET active=CASE WHEN id=? THEN 1 ELSE 0 END", (row["id"],))
-        return {"id": row["id"], "key": row["key"], "label": row["label"], "active": True}
+        # активной нет — назначаем первую по id отдельной пишущей транзакцией
+        return set_active_model(registry["list"][0]["id"])
+    return {"id": active["id"], "key": active["key"], "label": active["label"], "active": True}
+
+def get_fallback_chain() -> list[dict]:
+    """Активная модель, за ней запасные по fallback_order (без повторов ключей)"""
+    registry = _models_cache.get()
+    chain = [get_active_model()]
+    seen = {chain[0]["key"]}
+    for m in registry["fallbacks"]:
+        if m["key"] not in seen:
+            seen.add(m["key"])
+            chain.append({"id": m["id"], "key": m["key"], "label": m["label"]})
+    return chain
+
+
+def set_model_fallback(model_id: int, position: int | None) -> None:
+    """Место модели в цепочке запасных; None — исключить из цепочки"""
+    with _connect() as conn:
+        cur = conn.execute("UPDATE models SET fallback_order=? WHERE id=?", (position, model_id))
+        if cur.rowcount == 0:
+            raise ValueError("Неизвестный ID модели")
+    _models_cache.invalidate()
+
 
 def get_model_by_id(model_id: int) -> dict:
     """Получить модель по ID"""
-    with _connect() as conn:
-        row = conn.execute("SELECT id, key, label FROM models WHERE id = ?", (model_id,)).fetchone()
-        if not row:
-            raise ValueError(f"Модель с ID {model_id} не найдена")
-        return {"id": row["id"], "key": row["key"], "label": row["label"]}
+    m = _models_cache.get()["by_id"].get(model_id)
+    if not m:
+        raise ValueError(f"Модель с ID {model_id} не найдена")
+    return {"id": m["id"], "key": m["key"], "label": m["label"]}
 
 def set_active_model(model_id: int) -> dict:
     with _connect() as conn:
@@ -115,22 +482,93 @@ def set_active_model(model_id: int) -> dict:
         # 2) затем включаем активность целевой модели
         conn.execute("UPDATE models SET active=1 WHERE id=?", (model_id,))
         conn.commit()
-        return get_active_model()
+    _models_cache.invalidate()
+    return get_active_model()
+
+def _load_characters(conn) -> dict:
+    rows = conn.execute("SELECT id,name,prompt FROM characters ORDER BY id").fetchall()
+    items = [{"id": r["id"], "name": r["name"], "prompt": r["prompt"]} for r in rows]
+    return {"list": items, "by_id": {c["id"]: c for c in items}}
+
+
+_characters_cache = _TableCache("characters", _load_characters)
+
+
+class _UserCharacterLRU:
+    """
+    Ограниченный LRU: telegram_user_id -> character_id (None — персонаж не выбран).
+    Промах заполняется через generation() до чтения из базы и put_loaded() после:
+    если за это время ключ записали или кэш сбросили, прочитанное уже устарело и не кладётся.
+    """
+
+    _MISS = object()
+
+    def __init__(self, max_size: int = USER_CHARACTER_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._items: OrderedDict[int, int | None] = OrderedDict()
+        self._loading: OrderedDict[int, int] = OrderedDict()  # ключ -> поколение идущего чтения
+        self._generation = 0
+        self._path = None
+
+    def get(self, user_id: int):
+        with self._lock:
+            if self._path != DB_PATH:
+                self._items.clear()
+                self._loading.clear()
+                self._path = DB_PATH
+            value = self._items.get(user_id, self._MISS)
+            if value is not self._MISS:
+                self._items.move_to_end(user_id)
+            return value
+
+    def generation(self, user_id: int) -> int:
+        """Поколение ключа перед чтением из базы — для put_loaded."""
+        with self._lock:
+            self._generation += 1
+            self._loading[user_id] = self._generation
+            self._loading.move_to_end(user_id)
+            # брошенные (упавшие) чтения не копятся: забытое поколение просто не заполнит кэш
+            while len(self._loading) > self.max_size:
+                self._loading.popitem(last=False)
+            return self._generation
+
+    def put_loaded(self, user_id: int, character_id: int | None, generation: int) -> None:
+        """Кладёт прочитанное из базы, только если с generation() ключ не меняли."""
+        with self._lock:
+            if self._loading.get(user_id) != generation:
+                return
+            del self._loading[user_id]
+            self._store(user_id, character_id)
+
+    def put(self, user_id: int, character_id: int | None) -> None:
+        with self._lock:
+            self._loading.pop(user_id, None)
+            self._store(user_id, character_id)
+
+    def _store(self, user_id: int, character_id: int | None) -> None:
+        self._items[user_id] = character_id
+        self._items.move_to_end(user_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._loading.clear()
+
+
+_user_characters = _UserCharacterLRU()
+
 
 def list_characters()-> list[dict]:
-    with _connect() as conn:
-        rows =conn.execute("SELECT id,name FROM characters ORDER BY id").fetchall()
-    return [{"id":r["id"], "name":r["name"]} for r in rows]
+    return [{"id": c["id"], "name": c["name"]} for c in _characters_cache.get()["list"]]
 
 
 
 def get_character_by_id(character_id: int) -> dict | None:
-    with _connect() as conn:
-        row = conn.execute(
-            "SELECT id,name,prompt FROM characters WHERE id=?",
-            (character_id,)
-        ).fetchone()
-    return {"id":row["id"], "name":row["name"], "prompt":row["prompt"]} if row else None
+    c = _characters_cache.get()["by_id"].get(character_id)
+    return dict(c) if c else None
 
 def set_user_character(user_id: int, character_id: int) -> dict:
     character = get_character_by_id(character_id)
@@ -142,25 +580,29 @@ def set_user_character(user_id: int, character_id: int) -> dict:
             VALUES(?, ?)
             ON CONFLICT(telegram_user_id) DO UPDATE SET character_id=excluded.character_id
         """, (user_id, character_id))
+    _user_characters.put(user_id, character_id)
     return character
 
 def get_user_character(user_id: int) -> dict:
-    with _connect() as conn:
-        row = conn.execute("""
-            SELECT p.id, p.name, p.prompt
-            FROM user_character up
-            JOIN characters p ON p.id = up.character_id
-            WHERE up.telegram_user_id = ?
-        """, (user_id,)).fetchone()
-        if row:
-            return {"id":row["id"], "name":row["name"], "prompt":row["prompt"]}
-        row = conn.execute("SELECT id,name,prompt FROM characters WHERE id=1").fetchone()
-        if row:
-            return {"id":row["id"], "name":row["name"], "prompt":row["prompt"]}
-        row = conn.execute("SELECT id,name,prompt FROM characters ORDER BY id LIMIT 1").fetchone()
-        if not row:
+    character_id = _user_characters.get(user_id)
+    if character_id is _UserCharacterLRU._MISS:
+        generation = _user_characters.generation(user_id)
+        with _connect() as conn:
+            row = conn.execute(
+                "SELECT character_id FROM user_character WHERE telegram_user_id = ?",
+                (user_id,)
+            ).fetchone()
+        character_id = row["character_id"] if row else None
+        _user_characters.put_loaded(user_id, character_id, generation)
+
+    catalogue = _characters_cache.get()
+    # выбранный персонаж, иначе персонаж №1, иначе первый по id
+    c = catalogue["by_id"].get(character_id) or catalogue["by_id"].get(1)
+    if c is None:
+        if not catalogue["list"]:
             raise RuntimeError("Таблица characters пуста")
-        return {"id": row["id"], "name":row["name"], "prompt": row["prompt"]}
+        c = catalogue["list"][0]
+    return dict(c)
 
 def get_character_prompt_for_user(user_id: int) -> str:
     return get_user_character(user_id)["prompt"]
@@ -176,6 +618,33 @@ def add_note(user_id: int, text: str) -> int:
     return cur.lastrowid
 
 
+def add_note_limited(user_id: int, text: str, limit: int) -> tuple[int | None, int]:
+    """
+    Проверяет лимит и добавляет заметку в одной транзакции.
+    Возвращает (id новой заметки, количество заметок после вставки);
+    если лимит уже достигнут — (None, текущее количество).
+    """
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT cnt FROM note_counts WHERE user_id = ?", (user_id,)).fetchone()
+        count = row["cnt"] if row else 0
+        if count >= limit:
+            conn.rollback()
+            return None, count
+        cur = conn.execute(
+            "INSERT INTO notes(user_id, text) VALUES (?, ?)",
+            (user_id, text)
+        )
+        conn.commit()
+    return cur.lastrowid, count + 1
+
+
+def count_notes(user_id: int) -> int:
+    with _connect() as conn:
+        row = conn.execute("SELECT cnt FROM note_counts WHERE user_id = ?", (user_id,)).fetchone()
+    return row["cnt"] if row else 0
+
+
 def list_notes(user_id: int, limit: int = 50):
     with _connect() as conn:
         cur = conn.execute(
@@ -186,20 +655,124 @@ def list_notes(user_id: int, limit: int = 50):
             LIMIT ?""",
             (user_id, limit)
         )
-    return cur.fetchall()
+        return cur.fetchall()
 
 
-def find_notes(user_id: int, query: str, limit: int = 50):
+def list_notes_page(user_id: int, before_id: int | None = None, page_size: int = 10,
+                    after_id: int | None = None) -> tuple[list, bool]:
+    """
+    Одна страница заметок (новые сверху) без OFFSET: курсор — id заметки.
+    before_id — страница старше этого id, after_id — страница новее этого id.
+    Возвращает (заметки, есть ли ещё заметки в направлении листания).
+    """
     with _connect() as conn:
-        cur = conn.execute(
-            """SELECT id, text, created_at
+        if after_id is not None:
+            rows = conn.execute(
+                """SELECT id, text, created_at
+                FROM notes
+                WHERE user_id = ? AND id > ?
+                ORDER BY id ASC
+                LIMIT ?""",
+                (user_id, after_id, page_size + 1)
+            ).fetchall()
+            has_more = len(rows) > page_size
+            return list(reversed(rows[:page_size])), has_more
+        if before_id is not None:
+            rows = conn.execute(
+                """SELECT id, text, created_at
+                FROM notes
+                WHERE user_id = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ?""",
+                (user_id, before_id, page_size + 1)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                """SELECT id, text, created_at
+                FROM notes
+                WHERE user_id = ?
+                ORDER BY id DESC
+                LIMIT ?""",
+                (user_id, page_size + 1)
+            ).fetchall()
+    return rows[:page_size], len(rows) > page_size
+
+
+def list_note_dates(user_id: int, limit: int = 50) -> list[str]:
+    """Даты создания заметок пользователя (покрывающий индекс, без чтения текста)."""
+    with _connect() as conn:
+        rows = conn.execute(
+            """SELECT created_at
             FROM notes
-            WHERE user_id = ? AND text LIKE ?
-            ORDER BY id DESC
+            WHERE user_id = ?
+            ORDER BY created_at DESC
             LIMIT ?""",
-            (user_id, f'%{query}%', limit)
-        )
-    return cur.fetchall()
+            (user_id, limit)
+        ).fetchall()
+    return [r["created_at"] for r in rows]
+
+
+# служебные метки snippet(): в тексте заметок их не бывает, поэтому их легко отличить от текста
+_SNIPPET_OPEN, _SNIPPET_CLOSE, _SNIPPET_ELLIPSIS = "\x02", "\x03", "\x01"
+_SNIPPET_MARKS = {_SNIPPET_OPEN: "[", _SNIPPET_CLOSE: "]", _SNIPPET_ELLIPSIS: "…"}
+
+
+def _unfold_snippet(snippet: str, text: str) -> str:
+    """
+    snippet() строится по свёрнутому (ё -> е) тексту из notes_fts. Свёртка не меняет длину,
+    поэтому фрагмент — это подстрока свёрнутого текста: находим её и берём те же символы оригинала.
+    """
+    plain = "".join(ch for ch in snippet if ch not in _SNIPPET_MARKS)
+    folded = text.replace("ё", "е").replace("Ё", "Е")
+    if not snippet.startswith(_SNIPPET_ELLIPSIS):
+        start = 0
+    elif not snippet.endswith(_SNIPPET_ELLIPSIS):
+        start = len(folded) - len(plain)
+    else:
+        start = folded.find(plain)
+    if start < 0 or folded[start:start + len(plain)] != plain:
+        return "".join(_SNIPPET_MARKS.get(ch, ch) for ch in snippet)  # текст успели поменять
+    out, i = [], start
+    for ch in snippet:
+        if ch in _SNIPPET_MARKS:
+            out.append(_SNIPPET_MARKS[ch])
+        else:
+            out.append(text[i])
+            i += 1
+    return "".join(out)
+
+
+def find_notes(user_id: int, query: str, limit: int = 50) -> list[dict]:
+    """
+    Поиск по заметкам через FTS5: сортировка по rank (BM25), в поле snippet —
+    фрагмент исходного текста (с ё, как писал пользователь) с найденными словами
+    в [квадратных скобках].
+    Пока идёт backfill (или в запросе нет слов), работает старый поиск через LIKE.
+    """
+    fts_query = _fts_query(query)
+    with _connect() as conn:
+        if fts_query and _fts_ready(conn):
+            cur = conn.execute(
+                """SELECT n.id, n.text, n.created_at,
+                    snippet(notes_fts, 0, ?, ?, ?, 12) AS snippet
+                FROM notes_fts
+                JOIN notes n ON n.id = notes_fts.rowid
+                WHERE notes_fts MATCH ? AND n.user_id = ?
+                ORDER BY notes_fts.rank
+                LIMIT ?""",
+                (_SNIPPET_OPEN, _SNIPPET_CLOSE, _SNIPPET_ELLIPSIS, fts_query, user_id, limit)
+            )
+            return [dict(r, snippet=_unfold_snippet(r["snippet"], r["text"])) for r in cur.fetchall()]
+        else:
+            cur = conn.execute(
+                """SELECT id, text, created_at, text AS snippet
+                FROM notes
+                WHERE user_id = ? AND text LIKE ?
+                ORDER BY id DESC
+                LIMIT ?""",
+                (user_id, f'%{query}%', limit)
+            )
+        return [dict(r) for r in cur.fetchall()]
 
 
 def update_note(user_id: int, note_id: int, text: str) -> bool:
@@ -224,10 +797,36 @@ def delete_note(user_id: int, note_id: int) -> bool:
     return cur.rowcount > 0
 
 
+def update_note_counted(user_id: int, note_id: int, text: str) -> int | None:
+    """
+    Меняет текст заметки и в той же транзакции читает число заметок пользователя.
+    Возвращает это число; None — заметка не найдена или чужая.
+    """
+    return _write_note_counted(user_id, "UPDATE notes SET text = ? WHERE user_id = ? AND id = ?",
+                               (text, user_id, note_id))
+
+
+def delete_note_counted(user_id: int, note_id: int) -> int | None:
+    """Удаляет заметку и в той же транзакции читает, сколько заметок осталось; None — не найдена."""
+    return _write_note_counted(user_id, "DELETE FROM notes WHERE user_id = ? AND id = ?", (user_id, note_id))
+
+
+def _write_note_counted(user_id: int, sql: str, params: tuple) -> int | None:
+    # счётчик из той же транзакции, что и запись: как в add_note_limited
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute(sql, params).rowcount == 0:
+            conn.rollback()
+            return None
+        row = conn.execute("SELECT cnt FROM note_counts WHERE user_id = ?", (user_id,)).fetchone()
+        conn.commit()
+    return row["cnt"] if row else 0
+
+
 def get_note(user_id: int, note_id: int):
     with _connect() as conn:
         cur = conn.execute(
             "SELECT id, text, created_at FROM notes WHERE user_id = ? AND id = ?",
             (user_id, note_id)
         )
-    return cur.fetchone()
\ No newline at end of file
+        return cur.fetchone()
\ No newline at end of file
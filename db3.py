@@ -1,7 +1,25 @@
 import os
 import sqlite3
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterator
+from zoneinfo import ZoneInfo
+
+
+def _zone_name(name: str) -> str:
+    # опечатка в DEFAULT_TZ должна остановить запуск, а не всплыть в рассылке на первом же подписчике
+    try:
+        ZoneInfo(name)
+    except (ValueError, KeyError):
+        raise ValueError(f"DEFAULT_TZ: неизвестный часовой пояс {name!r}") from None
+    return name
+
 
 DB_PATH = os.getenv("DB_PATH", "bot.db")
+DEFAULT_NOTIFY_HOUR = int(os.getenv("DEFAULT_NOTIFY_HOUR", "9"))
+# единственный источник пояса по умолчанию: в схеме у tz нет DEFAULT, его всегда пишет код
+DEFAULT_TZ = _zone_name(os.getenv("DEFAULT_TZ", "Europe/Moscow"))
+# рассылка часа растягивается на 50 минут: у каждого пользователя свой постоянный сдвиг
+NOTIFY_SPREAD_S = int(os.getenv("SCHEDULER_SPREAD_S", str(50 * 60)))
 
 
 def _connect():
@@ -34,6 +52,44 @@ def init_db():
 
     CREATE UNIQUE INDEX IF NOT EXISTS ux_models_single_active ON models(active) WHERE active=1;
 
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        sign TEXT,
+        notify_hour INTEGER NOT NULL DEFAULT 9 CHECK (notify_hour BETWEEN 0 AND 23),
+        subscribed INTEGER NOT NULL DEFAULT 1 CHECK (subscribed IN (0, 1)),
+        last_sent_date TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        tz TEXT NOT NULL,
+        next_fire_utc INTEGER
+    );
+
+    CREATE TABLE IF NOT EXISTS daily_texts (
+        for_date TEXT NOT NULL,
+        sign TEXT NOT NULL,
+        text TEXT NOT NULL,
+        PRIMARY KEY (for_date, sign)
+    ) WITHOUT ROWID;
+
+    -- итог доставки рассылки каждому получателю за дату
+    CREATE TABLE IF NOT EXISTS deliveries (
+        for_date TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        status TEXT NOT NULL CHECK (status IN ('sent', 'failed', 'dead')),
+        error_code INTEGER,
+        error TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (for_date, user_id)
+    ) WITHOUT ROWID;
+
+    -- получатели, которым доставить нельзя (бот заблокирован, чат не найден): отписаны автоматически
+    CREATE TABLE IF NOT EXISTS dead_letters (
+        user_id INTEGER PRIMARY KEY,
+        for_date TEXT NOT NULL,
+        error_code INTEGER,
+        reason TEXT NOT NULL,
+        failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
     INSERT OR IGNORE INTO models(id, key, label, active) VALUES
         (1, 'inception/mercury', 'Inception: Mercury', 1),
         (2, 'google/gemini-2.5-flash-lite-preview-06-17', 'google/gemini-2.5-flash-lite-preview-06-17', 0),
@@ -43,6 +99,31 @@ def init_db():
     """
     with _connect() as conn:
         conn.executescript(schema)
+        _migrate_users(conn)
+
+
+def _migrate_users(conn) -> None:
+    """
+    Часовые пояса: базам, созданным до них, добавляем tz и next_fire_utc, считаем next_fire_utc
+    тем, у кого его нет, и меняем индекс «час + дата» на индекс по одному next_fire_utc.
+    """
+    columns = {r["name"] for r in conn.execute("PRAGMA table_info(users)")}
+    if "tz" not in columns:
+        # раньше час считался по времени сервера — переносим всех в DEFAULT_TZ; NOT NULL без
+        # DEFAULT в ALTER не добавить, а пустой tz user_zone всё равно читает как DEFAULT_TZ
+        conn.execute("ALTER TABLE users ADD COLUMN tz TEXT")
+        conn.execute("UPDATE users SET tz=? WHERE tz IS NULL", (DEFAULT_TZ,))
+    if "next_fire_utc" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN next_fire_utc INTEGER")
+    conn.execute("DROP INDEX IF EXISTS idx_users_due")
+    # выборка рассылки — диапазон next_fire_utc <= сейчас по подписчикам
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_next_fire ON users(next_fire_utc) WHERE subscribed=1")
+    now = _utcnow()
+    rows = conn.execute("SELECT user_id, notify_hour, tz FROM users WHERE next_fire_utc IS NULL").fetchall()
+    conn.executemany(
+        "UPDATE users SET next_fire_utc=? WHERE user_id=?",
+        [(next_fire_utc(r["user_id"], r["notify_hour"], r["tz"], now), r["user_id"]) for r in rows]
+    )
 
 
 def list_models() -> list[dict]:
@@ -73,3 +154,221 @@ def set_active_model(model_id: int) -> dict:
         conn.execute("UPDATE models SET active=CASE WHEN id=? THEN 1 ELSE 0 END", (model_id,))
         conn.commit()
     return get_active_model()
+
+
+# ---------- подписчики и расписание рассылки ----------
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def user_zone(tz: str | None) -> ZoneInfo:
+    """Часовой пояс пользователя; неизвестное имя — DEFAULT_TZ (рассылка не должна ломаться)."""
+    try:
+        return ZoneInfo(tz or DEFAULT_TZ)
+    except (ValueError, KeyError):
+        return ZoneInfo(DEFAULT_TZ)
+
+
+def next_fire_utc(user_id: int, hour: int, tz: str, after: datetime) -> int:
+    """
+    Ближайший после after момент рассылки, unix-время: hour:00 по местному времени tz
+    плюс постоянный для user_id сдвиг внутри NOTIFY_SPREAD_S.
+    """
+    zone = user_zone(tz)
+    offset = timedelta(seconds=(user_id * 2654435761) % NOTIFY_SPREAD_S if NOTIFY_SPREAD_S > 0 else 0)
+    local_day = after.astimezone(zone).date()
+    fire = datetime.combine(local_day, time(hour), tzinfo=zone) + offset
+    if fire <= after:
+        # арифметика по местным часам: при переходе на летнее время час рассылки не сдвигается
+        fire = datetime.combine(local_day + timedelta(days=1), time(hour), tzinfo=zone) + offset
+    return int(fire.timestamp())
+
+
+def local_date(tz: str, at: datetime) -> date:
+    return at.astimezone(user_zone(tz)).date()
+
+
+def ensure_user(user_id: int) -> None:
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO users(user_id, notify_hour, tz, next_fire_utc) VALUES (?, ?, ?, ?)",
+            (user_id, DEFAULT_NOTIFY_HOUR, DEFAULT_TZ,
+             next_fire_utc(user_id, DEFAULT_NOTIFY_HOUR, DEFAULT_TZ, _utcnow()))
+        )
+
+
+def set_sign(user_id: int, sign: str) -> None:
+    with _connect() as conn:
+        conn.execute("UPDATE users SET sign=? WHERE user_id=?", (sign, user_id))
+
+
+def _set_schedule(conn, user_id: int, hour: int | None = None, tz: str | None = None) -> None:
+    row = conn.execute("SELECT notify_hour, tz FROM users WHERE user_id=?", (user_id,)).fetchone()
+    if row is None:
+        return
+    hour = row["notify_hour"] if hour is None else hour
+    tz = tz or row["tz"]
+    conn.execute(
+        "UPDATE users SET notify_hour=?, tz=?, next_fire_utc=? WHERE user_id=?",
+        (hour, tz, next_fire_utc(user_id, hour, tz, _utcnow()), user_id)
+    )
+
+
+def set_notify_hour(user_id: int, hour: int) -> None:
+    with _connect() as conn:
+        _set_schedule(conn, user_id, hour=hour)
+
+
+def set_timezone(user_id: int, tz: str) -> None:
+    with _connect() as conn:
+        _set_schedule(conn, user_id, tz=tz)
+
+
+def set_subscribed(user_id: int, subscribed: bool) -> None:
+    with _connect() as conn:
+        conn.execute("UPDATE users SET subscribed=? WHERE user_id=?", (int(subscribed), user_id))
+        if subscribed:
+            # пользователь снова пишет боту — значит, доставлять ему уже можно
+            conn.execute("DELETE FROM dead_letters WHERE user_id=?", (user_id,))
+            _set_schedule(conn, user_id)
+
+
+def get_user(user_id: int) -> dict | None:
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT user_id, sign, notify_hour, tz, subscribed, last_sent_date, next_fire_utc FROM users WHERE user_id=?",
+            (user_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+
+# subscribed=1 в запросе обязателен — иначе частичный индекс idx_users_next_fire не подходит.
+# Пользователей без знака тоже выбираем: планировщик переносит им next_fire_utc,
+# иначе они копились бы в начале диапазона и читались при каждой выборке.
+_DUE_USERS_SQL = """
+    SELECT user_id, sign, notify_hour, tz, last_sent_date FROM users
+    WHERE subscribed=1 AND next_fire_utc <= ?
+"""
+_DUE_COUNT_SQL = "SELECT COUNT(*) FROM users WHERE subscribed=1 AND next_fire_utc <= ?"
+DUE_CHUNK_SIZE = int(os.getenv("DUE_CHUNK_SIZE", "2000"))
+
+
+def iter_due_users(now_ts: int, chunk_size: int = DUE_CHUNK_SIZE) -> Iterator[list[dict]]:
+    """
+    Подписчики, чей next_fire_utc уже наступил, — пачками по chunk_size с одного курсора.
+    Читаем в своём соединении: в WAL переносы next_fire_utc из других соединений
+    не мешают курсору и не видны ему.
+    """
+    conn = _connect()
+    try:
+        cur = conn.execute(_DUE_USERS_SQL, (now_ts,))
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+
+def list_due_users(now_ts: int) -> list[dict]:
+    """Подписчики, которым пора отправить рассылку (next_fire_utc <= now_ts)."""
+    users = [u for chunk in iter_due_users(now_ts) for u in chunk]
+    users.sort(key=lambda u: u["user_id"])
+    return users
+
+
+def count_due_users(now_ts: int) -> int:
+    """Сколько подписчиков ждут рассылки (next_fire_utc <= now_ts) — тот же диапазон по индексу."""
+    with _connect() as conn:
+        return conn.execute(_DUE_COUNT_SQL, (now_ts,)).fetchone()[0]
+
+
+def reschedule_users(updates: list[tuple[int, int]]) -> None:
+    """Переносит next_fire_utc пачке пользователей, пары (next_fire_utc, user_id) — одна транзакция."""
+    with _connect() as conn:
+        conn.executemany("UPDATE users SET next_fire_utc=? WHERE user_id=?", updates)
+
+
+def next_fire_at() -> int | None:
+    """Ближайший next_fire_utc среди подписчиков — до него планировщик может спать."""
+    with _connect() as conn:
+        return conn.execute("SELECT MIN(next_fire_utc) FROM users WHERE subscribed=1").fetchone()[0]
+
+
+# ---------- итоги доставки рассылки ----------
+DELIVERIES_KEEP_DAYS = 7
+
+
+def record_deliveries(for_date: str, outcomes: list[tuple[int, str, int | None, str | None]]) -> None:
+    """
+    Записывает пачку итогов (user_id, status, error_code, error) одной транзакцией:
+    'sent' — отмечает отправку за день, 'dead' — переносит в dead_letters и отписывает,
+    'failed' — только статус: «пропущен за этот день». Повторы (429, 5xx) уже сделала
+    очередь отправки, а next_fire_utc планировщик перенёс при отправке, поэтому
+    сегодня попыток больше не будет — пользователь получит рассылку завтра.
+    """
+    sent = [(for_date, uid) for uid, status, _, _ in outcomes if status == "sent"]
+    dead = [(uid, for_date, code, error or "") for uid, status, code, error in outcomes if status == "dead"]
+    with _connect() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO deliveries(for_date, user_id, status, error_code, error) VALUES (?, ?, ?, ?, ?)",
+            [(for_date, uid, status, code, error) for uid, status, code, error in outcomes]
+        )
+        conn.executemany("UPDATE users SET last_sent_date=? WHERE user_id=?", sent)
+        conn.executemany(
+            "INSERT OR REPLACE INTO dead_letters(user_id, for_date, error_code, reason) VALUES (?, ?, ?, ?)", dead
+        )
+        conn.executemany("UPDATE users SET subscribed=0 WHERE user_id=?", [(d[0],) for d in dead])
+        conn.execute(
+            "DELETE FROM deliveries WHERE for_date < date(?, ?)",
+            (for_date, f"-{DELIVERIES_KEEP_DAYS} days")
+        )
+
+
+def get_delivery(user_id: int, for_date: str) -> dict | None:
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT status, error_code, error FROM deliveries WHERE for_date=? AND user_id=?",
+            (for_date, user_id)
+        ).fetchone()
+        return dict(row) if row else None
+
+
+def count_deliveries(for_date: str) -> dict[str, int]:
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT status, COUNT(*) AS n FROM deliveries WHERE for_date=? GROUP BY status", (for_date,)
+        ).fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+
+def get_dead_letter(user_id: int) -> dict | None:
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT user_id, for_date, error_code, reason FROM dead_letters WHERE user_id=?", (user_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+
+# ---------- готовые тексты гороскопа на дату ----------
+DAILY_TEXTS_KEEP_DAYS = 7
+
+
+def get_daily_texts(for_date: str) -> dict[str, str]:
+    with _connect() as conn:
+        rows = conn.execute("SELECT sign, text FROM daily_texts WHERE for_date=?", (for_date,)).fetchall()
+        return {r["sign"]: r["text"] for r in rows}
+
+
+def save_daily_texts(for_date: str, texts: dict[str, str]) -> None:
+    """Сохраняет тексты на дату и удаляет те, что старше DAILY_TEXTS_KEEP_DAYS дней."""
+    with _connect() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO daily_texts(for_date, sign, text) VALUES (?, ?, ?)",
+            [(for_date, sign, text) for sign, text in texts.items()]
+        )
+        conn.execute(
+            "DELETE FROM daily_texts WHERE for_date < date(?, ?)",
+            (for_date, f"-{DAILY_TEXTS_KEEP_DAYS} days")
+        )
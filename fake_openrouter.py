@@ -0,0 +1,159 @@
+"""
+fake_openrouter.py — локальная заглушка OpenRouter для тестов и бенчмарков без интернета.
+Понимает и обычные ответы, и потоковые (SSE, "stream": true).
+
+Запуск отдельно:
+    python fake_openrouter.py 8099
+    OPENROUTER_API=http://127.0.0.1:8099/api/v1/chat/completions python main.py
+
+В коде:
+    with FakeOpenRouter(delay_s=0.1) as fake:
+        openrouter_client.OPENROUTER_API = fake.url
+"""
+
+from __future__ import annotations
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHAT_PATH = "/api/v1/chat/completions"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего OpenRouter
+    server: "_Server"
+
+    def log_message(self, format, *args):  # noqa: A002 — сигнатура базового класса
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        fake = self.server.fake
+        fake.record(payload)
+
+        if self.path != CHAT_PATH:
+            self._send_json(404, {"error": "not found"})
+            return
+        time.sleep(fake.delays.get(payload.get("model"), fake.delay_s))
+        status = fake.next_status()
+        if status != 200:
+            headers = {"Retry-After": fake.retry_after} if fake.retry_after and status in (429, 503) else {}
+            self._send_json(status, {"error": {"code": status}}, headers)
+            return
+
+        answer = fake.answer_for(payload)
+        if payload.get("stream"):
+            self._send_stream(answer, fake.token_delay_s)
+            return
+        self._send_json(200, {"choices": [{"message": {"role": "assistant", "content": answer}}]})
+
+    def _send_stream(self, answer: str, token_delay_s: float) -> None:
+        # SSE поверх chunked-кодирования: соединение остаётся keep-alive
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._write_chunk(": OPENROUTER PROCESSING\n\n")
+        for i, word in enumerate(answer.split(" ")):
+            delta = word if i == 0 else " " + word
+            event = {"choices": [{"index": 0, "delta": {"content": delta}}]}
+            self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n")
+            time.sleep(token_delay_s)
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _write_chunk(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, body: dict, headers: dict | None = None) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # бенчмарки открывают сотни соединений разом
+    fake: "FakeOpenRouter"
+
+
+class FakeOpenRouter:
+    """
+    HTTP-сервер, отвечающий как /api/v1/chat/completions.
+    delay_s — искусственная «задержка модели», statuses — очередь кодов ответа
+    для первых запросов (например [502, 200] — сначала ошибка, потом успех).
+    На запрос с "stream": true отвечает SSE по одному слову, с паузой token_delay_s.
+    retry_after — значение заголовка Retry-After для ответов 429/503,
+    delays — задержка для отдельных моделей вместо delay_s.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay_s: float = 0.0,
+                 statuses: list[int] | None = None, token_delay_s: float = 0.0):
+        self.delay_s = delay_s
+        self.token_delay_s = token_delay_s
+        self.statuses = list(statuses or [])
+        self.retry_after: str | None = None
+        self.delays: dict[str, float] = {}
+        self.requests: list[dict] = []
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{CHAT_PATH}"
+
+    def record(self, payload: dict) -> None:
+        with self._lock:
+            self.requests.append(payload)
+
+    def next_status(self) -> int:
+        with self._lock:
+            return self.statuses.pop(0) if self.statuses else 200
+
+    def answer_for(self, payload: dict) -> str:
+        question = (payload.get("messages") or [{}])[-1].get("content", "")
+        return f"Ответ модели {payload.get('model')}: {question}"
+
+    def start(self) -> "FakeOpenRouter":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-openrouter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOpenRouter":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8099
+    fake = FakeOpenRouter(port=port)
+    print(f"Заглушка OpenRouter: {fake.url}")
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,149 @@
+"""
+fake_telegram.py — локальная заглушка Bot API для тестов и бенчмарков без интернета.
+Принимает любой метод /bot<token>/<method>, записывает вызов и отвечает
+{"ok": true, "result": <сообщение>}. Параметры понимает и из query string
+(синхронный telebot), и из тела формы/multipart (AsyncTeleBot), и из JSON.
+
+В коде:
+    with FakeTelegram() as tg:
+        telebot.apihelper.API_URL = tg.api_url
+        telebot.asyncio_helper.API_URL = tg.api_url
+"""
+
+from __future__ import annotations
+import json
+import re
+import sys
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+_METHOD_PATH = re.compile(r"^/bot[^/]+/(\w+)$")
+
+
+def _parse_body(content_type: str, body: bytes) -> dict:
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body)
+        params = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if name and part.get_filename() is None:
+                params[name] = part.get_payload(decode=True).decode("utf-8")
+        return params
+    return dict(parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def log_message(self, format, *args):  # noqa: A002 — сигнатура базового класса
+        pass
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        url = urlsplit(self.path)
+        match = _METHOD_PATH.match(url.path)
+        if match is None:
+            self._send_json(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+            return
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+        params.update(_parse_body(self.headers.get("Content-Type", ""), body))
+        result = self.server.fake.handle(match.group(1), params)
+        self._send_json(200, {"ok": True, "result": result})
+
+    def _send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # бенчмарк открывает сотни соединений разом
+    fake: "FakeTelegram"
+
+
+class FakeTelegram:
+    """
+    HTTP-сервер с интерфейсом Bot API. calls — все вызовы (метод, параметры);
+    answers — тексты сообщений, содержащих marker (по умолчанию подпись ответа
+    модели), а wait_answers(n) ждёт, пока их наберётся n.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, marker: str = "модель:"):
+        self.marker = marker
+        self.calls: list[tuple[str, dict]] = []
+        self.answers: list[str] = []
+        self._cond = threading.Condition()
+        self._message_ids = iter(range(1, sys.maxsize))
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def api_url(self) -> str:
+        """Шаблон для telebot.apihelper.API_URL / telebot.asyncio_helper.API_URL."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def handle(self, method: str, params: dict):
+        with self._cond:
+            self.calls.append((method, params))
+            message_id = next(self._message_ids)
+            text = params.get("text", "")
+            if self.marker and self.marker in text:
+                self.answers.append(text)
+                self._cond.notify_all()
+        if method in ("sendChatAction", "answerCallbackQuery", "deleteMessage"):
+            return True
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"}
+        if method == "getUpdates":
+            return []
+        chat_id = int(params.get("chat_id") or 0)
+        return {
+            "message_id": int(params.get("message_id") or message_id),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+        }
+
+    def wait_answers(self, count: int, timeout_s: float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self.answers) >= count, timeout_s)
+
+    def reset(self) -> None:
+        with self._cond:
+            self.calls.clear()
+            self.answers.clear()
+
+    def start(self) -> "FakeTelegram":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-telegram", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeTelegram":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,123 @@
+"""
+horoscope3.py — тексты «гороскопа дня» для DailyZodiakBot (main3.py).
+
+Текст зависит только от (знак, дата), значит, в день их ровно 12. DailyTexts
+рендерит все 12 один раз на дату, держит их в памяти и сохраняет в db3
+(таблица daily_texts), чтобы перезапуск не пересчитывал; рассылка и /today
+только читают готовый текст.
+"""
+
+from __future__ import annotations
+import hashlib
+import threading
+from datetime import date, timedelta
+from typing import Callable, Dict
+
+import db3 as db
+
+CANON_SIGNS = [
+    "овен", "телец", "близнецы", "рак", "лев", "дева",
+    "весы", "скорпион", "стрелец", "козерог", "водолей", "рыбы"
+]
+SIGN_EMOJI = {
+    "овен":"♈", "телец":"♉", "близнецы":"♊", "рак":"♋", "лев":"♌", "дева":"♍",
+    "весы":"♎", "скорпион":"♏", "стрелец":"♐", "козерог":"♑", "водолей":"♒", "рыбы":"♓"
+}
+
+
+# ---------- генерация «гороскопа» без API (детерминированно на (sign, date)) ----------
+INTRO = [
+    "Сегодня вас ждёт", "День сулит", "Утро принесёт", "В первой половине дня вероятно",
+    "Хорошее время для", "Подходящий момент для"
+]
+FOCUS = ["работы", "личных дел", "общения", "обучения", "творчества", "маленьких поездок"]
+ADVICE = [
+    "действуйте спокойно и без спешки", "обратите внимание на детали", "держите курс и не отвлекайтесь",
+    "не спорьте из принципа", "подумайте о пользе привычек", "не бойтесь попросить помощи"
+]
+LUCK = [
+    "удача на вашей стороне", "окружающие настроены дружелюбно", "случай поможет тем, кто готов",
+    "небольшой риск себя оправдает", "поддержка придёт вовремя", "день подойдёт для новых начал"
+]
+COLOR = ["синий", "зелёный", "жёлтый", "красный", "фиолетовый", "белый", "оранжевый"]
+NUMBER = [3, 4, 5, 6, 7, 8, 9]
+
+def _pick(seq: list, seed: bytes, salt: str) -> str:
+    h = hashlib.md5(seed + salt.encode("utf-8")).hexdigest()
+    idx = int(h, 16) % len(seq)
+    return str(seq[idx])
+
+def make_daily_text(sign: str, for_date: date) -> str:
+    """
+    Генерирует 3–4 коротких фразы и пару «фишек» (цвет, число).
+    Детерминированно для (sign, date) — без внешних API.
+    """
+    iso = for_date.isoformat().encode("utf-8")
+    sgn = sign.encode("utf-8")
+    intro = _pick(INTRO, sgn+iso, ":intro")
+    focus = _pick(FOCUS, sgn+iso, ":focus")
+    advice = _pick(ADVICE, sgn+iso, ":advice")
+    luck = _pick(LUCK, sgn+iso, ":luck")
+    color = _pick(COLOR, sgn+iso, ":color")
+    number = _pick(NUMBER, sgn+iso, ":num")
+
+    emoji = SIGN_EMOJI.get(sign, "")
+    return (
+        f"{emoji} *{sign.capitalize()}* — {for_date.strftime('%Y-%m-%d')}\n"
+        f"{intro} акцент на *{focus}*; {luck}. Советы: {advice}.\n\n"
+        f"Счастливый цвет: *{color}*, число дня: *{number}*.\n"
+        f"_Развлекательный контент._"
+    )
+
+
+class DailyTexts:
+    """
+    Кэш текстов на дату: память -> db3 -> рендер всех 12 знаков разом.
+    В памяти держим keep_days последних дат (сегодня и завтра для прогрева).
+    """
+
+    def __init__(self, load: Callable[[str], Dict[str, str]] = db.get_daily_texts,
+                 save: Callable[[str, Dict[str, str]], None] = db.save_daily_texts,
+                 render: Callable[[str, date], str] = make_daily_text, keep_days: int = 3):
+        self._load = load
+        self._save = save
+        self._render = render
+        self.keep_days = keep_days
+        self._lock = threading.Lock()
+        self._days: Dict[date, Dict[str, str]] = {}
+        self._stats = {"hits": 0, "disk_loads": 0, "renders": 0}
+
+    def for_date(self, for_date: date) -> Dict[str, str]:
+        """Тексты всех знаков на дату; при первом обращении — из базы или рендер."""
+        texts = self._days.get(for_date)
+        if texts is not None:
+            self._stats["hits"] += 1
+            return texts
+        with self._lock:
+            texts = self._days.get(for_date)
+            if texts is None:
+                texts = self._load(for_date.isoformat())
+                if len(texts) == len(CANON_SIGNS):
+                    self._stats["disk_loads"] += 1
+                else:
+                    texts = {sign: self._render(sign, for_date) for sign in CANON_SIGNS}
+                    self._save(for_date.isoformat(), texts)
+                    self._stats["renders"] += 1
+                self._days[for_date] = texts
+                for old in sorted(self._days)[:-self.keep_days]:
+                    del self._days[old]
+            return texts
+
+    def get(self, sign: str, for_date: date) -> str:
+        text = self.for_date(for_date).get(sign)
+        # неизвестный знак (старые данные) — как раньше, рендерим на лету
+        return text if text is not None else self._render(sign, for_date)
+
+    def warm_ahead(self, today: date) -> None:
+        """Прогрев на сегодня и завтра — вызывается планировщиком в начале дня, до первой рассылки."""
+        for day in (today, today + timedelta(days=1)):
+            self.for_date(day)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, dates=sorted(d.isoformat() for d in self._days))
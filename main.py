@@ -1,16 +1,28 @@
 import os
-from random import random
+import random
+import signal
 
 from dotenv import load_dotenv
 import telebot
+import threading
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import lru_cache
+from urllib.parse import urlsplit
 
 from telebot import types
-
-from db import init_db, add_note, list_notes, update_note, delete_note, find_notes, list_models, get_active_model, \
-    set_active_model, list_characters, get_character_by_id, get_user_character, set_user_character, get_model_by_id
-from openrouter_client import chat_once, OpenRouterError
+from telebot.handler_backends import BaseMiddleware, CancelUpdate
+
+from db import init_db, list_notes, update_note_counted, delete_note_counted, find_notes, list_models, get_active_model, \
+    set_active_model, list_characters, get_character_by_id, get_user_character, set_user_character, get_model_by_id, \
+    close_all, backfill_notes_fts, add_note_limited, count_notes, list_notes_page, \
+    list_note_dates, get_fallback_chain
+import openrouter_client
+import webhook
+from chat_dispatch import ChatLanes
+from send_queue import QueuedTeleBot
+from rate_limit import RateLimiter
+from openrouter_client import chat_stream_failover, OpenRouterError, QueueFullError, PRIORITY_HIGH, PRIORITY_LOW
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -18,13 +30,70 @@ TOKEN = os.getenv("TOKEN")
 if not TOKEN:
     raise RuntimeError("В .env файле нет TOKEN")
 
-bot = telebot.TeleBot(TOKEN)
+
+class OrderedTeleBot(QueuedTeleBot):
+    """
+    TeleBot, который раскладывает обновления по полосам ChatLanes: обновления
+    одного чата обрабатываются по порядку, разных чатов — параллельно. Обработчики
+    выполняются в потоках полос, поэтому собственный пул telebot выключен.
+    Сообщения и правки уходят через очередь отправки с лимитами Telegram (SendQueue).
+    """
+
+    def __init__(self, token: str, **kwargs):
+        super().__init__(token, threaded=False, **kwargs)
+        self.lanes = ChatLanes(super().process_new_updates)
+
+    def process_new_updates(self, updates: list[types.Update]) -> None:
+        if not updates:
+            return
+        # сдвигаем offset сразу: polling не должен получить эти обновления повторно, пока они в очереди
+        self.last_update_id = max(self.last_update_id, max(u.update_id for u in updates))
+        self.lanes.submit_all(updates)
+
+
+bot = OrderedTeleBot(TOKEN, use_class_middlewares=True)
 
 # Инициализация базы данных при запуске
 init_db()
 
 # Константы
 MAX_NOTES_PER_USER = 50
+# Как часто можно редактировать ответ при потоковой генерации: Telegram ограничивает
+# правки примерно раз в секунду на чат и 20 в минуту в группах
+STREAM_EDIT_INTERVAL_S = float(os.getenv("STREAM_EDIT_INTERVAL_S", "1.5"))
+STREAM_EDIT_INTERVAL_GROUP_S = float(os.getenv("STREAM_EDIT_INTERVAL_GROUP_S", "3.0"))
+NOTES_PAGE_SIZE = 10
+NOTE_PREVIEW_LEN = 300
+
+
+class RateLimitMiddleware(BaseMiddleware):
+    """
+    Ограничивает частоту команд до вызова обработчика. Отказ отвечает из памяти,
+    без обращения к БД; при серии отказов предупреждаем только первый раз.
+    """
+
+    def __init__(self, limiter: RateLimiter):
+        super().__init__()
+        self.update_types = ["message"]
+        self.limiter = limiter
+
+    def pre_process(self, message, data):
+        command = telebot.util.extract_command(message.text or "")
+        if not command or message.from_user is None:
+            return None
+        verdict = self.limiter.check(message.from_user.id, command.lower())
+        if verdict.allowed:
+            return None
+        if verdict.warn:
+            bot.reply_to(message, f"Слишком часто. Повторите через {int(verdict.retry_after_s) + 1} с.")
+        return CancelUpdate()
+
+    def post_process(self, message, data, exception):
+        pass
+
+
+rate_limiter = RateLimiter()
+bot.setup_middleware(RateLimitMiddleware(rate_limiter))
 
 
 @bot.message_handler(commands=['start'])
@@ -37,7 +106,7 @@ def help_cmd(message):
     help_text = f"""
 Доступные команды:
 /note_add <текст> - Добавить заметку (максимум {MAX_NOTES_PER_USER})
-/note_list - Показать все заметки
+/note_list - Показать заметки (по страницам)
 /note_find <запрос> - Найти заметку
 /note_edit <id> <новый текст> - Изменить заметку
 /note_del <id> - Удалить заметку
@@ -59,43 +128,96 @@ def help_cmd(message):
 
 @bot.message_handler(commands=['note_add'])
 def note_add(message):
-    # Проверяем лимит заметок
+    text = message.text.replace('/note_add', '').strip()
+    if not text:
+        bot.reply_to(message, "Ошибка: Укажите текст заметки.")
+        return
+
+    # Проверка лимита и вставка — одна транзакция
     user_id = message.from_user.id
-    user_notes = list_notes(user_id)
+    note_id, count = add_note_limited(user_id, text, MAX_NOTES_PER_USER)
 
-    if len(user_notes) >= MAX_NOTES_PER_USER:
+    if note_id is None:
         bot.reply_to(
             message,
             f"❌ Достигнут лимит заметок! Максимум {MAX_NOTES_PER_USER} заметок на пользователя.\n"
-            f"У вас уже {len(user_notes)} заметок. Удалите некоторые заметки чтобы добавить новые."
+            f"У вас уже {count} заметок. Удалите некоторые заметки чтобы добавить новые."
         )
         return
 
-    text = message.text.replace('/note_add', '').strip()
-    if not text:
-        bot.reply_to(message, "Ошибка: Укажите текст заметки.")
-        return
-
-    note_id = add_note(user_id, text)
     bot.reply_to(
         message,
         f"✅ Заметка #{note_id} добавлена: {text}\n"
-        f"📊 Статистика: {len(user_notes) + 1}/{MAX_NOTES_PER_USER} заметок"
+        f"📊 Статистика: {count}/{MAX_NOTES_PER_USER} заметок"
     )
 
 
+def render_notes_page(user_id: int, before_id: int | None = None, after_id: int | None = None):
+    """Текст и клавиатура одной страницы /note_list. Возвращает (None, None), если заметок нет."""
+    notes, has_more = list_notes_page(user_id, before_id=before_id, after_id=after_id,
+                                      page_size=NOTES_PAGE_SIZE)
+    if not notes:
+        return None, None
+
+    # при листании вперёд «более новые» точно есть, назад — «более старые»
+    has_older = has_more if after_id is None else True
+    has_newer = has_more if after_id is not None else before_id is not None
+
+    lines = []
+    for note in notes:
+        text = note['text']
+        if len(text) > NOTE_PREVIEW_LEN:
+            text = text[:NOTE_PREVIEW_LEN] + "…"
+        lines.append(f"{note['id']}: {text}")
+    response = f"📝 Ваши заметки ({count_notes(user_id)}/{MAX_NOTES_PER_USER}):\n" + "\n".join(lines)
+
+    kb = types.InlineKeyboardMarkup()
+    buttons = []
+    if has_newer:
+        buttons.append(types.InlineKeyboardButton("◀️ Новее", callback_data=f"notes:{user_id}:a:{notes[0]['id']}"))
+    if has_older:
+        buttons.append(types.InlineKeyboardButton("Старше ▶️", callback_data=f"notes:{user_id}:b:{notes[-1]['id']}"))
+    if buttons:
+        kb.row(*buttons)
+    return response, kb
+
+
 @bot.message_handler(commands=['note_list'])
 def note_list(message):
     user_id = message.from_user.id
-    user_notes = list_notes(user_id)
+    response, kb = render_notes_page(user_id)
 
-    if not user_notes:
+    if response is None:
         bot.reply_to(message, "Заметок пока нет.")
         return
 
-    response = f"📝 Ваши заметки ({len(user_notes)}/{MAX_NOTES_PER_USER}):\n" + "\n".join(
-        [f"{note['id']}: {note['text']}" for note in user_notes])
-    bot.reply_to(message, response)
+    bot.reply_to(message, response, reply_markup=kb)
+
+
+@bot.callback_query_handler(func=lambda call: (call.data or "").startswith("notes:"))
+def note_list_page(call: types.CallbackQuery) -> None:
+    try:
+        _, owner_id, direction, cursor = call.data.split(":")
+        owner_id, cursor = int(owner_id), int(cursor)
+    except ValueError:
+        bot.answer_callback_query(call.id)
+        return
+
+    if call.from_user.id != owner_id:
+        bot.answer_callback_query(call.id, "Это не ваш список заметок.")
+        return
+
+    if direction == "a":
+        response, kb = render_notes_page(owner_id, after_id=cursor)
+    else:
+        response, kb = render_notes_page(owner_id, before_id=cursor)
+
+    if response is None:
+        bot.answer_callback_query(call.id, "Здесь больше нет заметок.")
+        return
+
+    bot.edit_message_text(response, call.message.chat.id, call.message.message_id, reply_markup=kb)
+    bot.answer_callback_query(call.id)
 
 
 @bot.message_handler(commands=['note_find'])
@@ -113,7 +235,7 @@ def note_find(message):
         return
 
     response = f"🔍 Найденные заметки ({len(found_notes)}):\n" + "\n".join(
-        [f"{note['id']}: {note['text']}" for note in found_notes])
+        [f"{note['id']}: {note['snippet']}" for note in found_notes])
     bot.reply_to(message, response)
 
 
@@ -132,17 +254,16 @@ def note_edit(message):
         return
 
     user_id = message.from_user.id
-    success = update_note(user_id, note_id, new_text)
+    count = update_note_counted(user_id, note_id, new_text)
 
-    if not success:
+    if count is None:
         bot.reply_to(message, f"Ошибка: Заметка #{note_id} не найдена или у вас нет прав для её изменения.")
         return
 
-    user_notes = list_notes(user_id)
     bot.reply_to(
         message,
         f"✏️ Заметка #{note_id} изменена на: {new_text}\n"
-        f"📊 Статистика: {len(user_notes)}/{MAX_NOTES_PER_USER} заметок"
+        f"📊 Статистика: {count}/{MAX_NOTES_PER_USER} заметок"
     )
 
 
@@ -160,25 +281,23 @@ def note_del(message):
         return
 
     user_id = message.from_user.id
-    success = delete_note(user_id, note_id)
+    count = delete_note_counted(user_id, note_id)
 
-    if not success:
+    if count is None:
         bot.reply_to(message, f"Ошибка: Заметка #{note_id} не найдена или у вас нет прав для её удаления.")
         return
 
-    user_notes = list_notes(user_id)
     bot.reply_to(
         message,
         f"🗑️ Заметка #{note_id} удалена.\n"
-        f"📊 Статистика: {len(user_notes)}/{MAX_NOTES_PER_USER} заметок"
+        f"📊 Статистика: {count}/{MAX_NOTES_PER_USER} заметок"
     )
 
 
 @bot.message_handler(commands=['note_count'])
 def note_count(message):
     user_id = message.from_user.id
-    user_notes = list_notes(user_id)
-    count = len(user_notes)
+    count = count_notes(user_id)
 
     if count >= MAX_NOTES_PER_USER:
         status = "❌ Лимит достигнут!"
@@ -250,24 +369,13 @@ def note_export(message):
 @bot.message_handler(commands=['note_stats'])
 def note_stats(message):
     user_id = message.from_user.id
-    user_notes = list_notes(user_id)
+    # Только даты создания — запрос целиком обслуживается индексом (user_id, created_at)
+    dates = list_note_dates(user_id)
 
-    if not user_notes:
+    if not dates:
         bot.reply_to(message, "У вас пока нет заметок для статистики.")
         return
 
-    # Получаем даты создания заметок (предполагаем, что в базе есть поле created_at)
-    # Если в вашей базе нет created_at, нужно будет адаптировать этот код
-    dates = []
-    for note in user_notes:
-        # Если в note есть created_at, используем его, иначе используем текущее время
-        if 'created_at' in note:
-            dates.append(note['created_at'])
-        else:
-            # Для демонстрации - случайные даты за последнюю неделю
-            days_ago = len(dates) % 7
-            dates.append(datetime.now() - timedelta(days=days_ago))
-
     # Считаем активность по дням недели
     week_activity = [0] * 7  # 0 = понедельник, 6 = воскресенье
 
@@ -323,7 +431,7 @@ def note_stats(message):
     stats_text += values_line + "\n\n"
 
     # Общая статистика
-    total_notes = len(user_notes)
+    total_notes = len(dates)
     avg_per_day = total_notes / 7
     most_active_day = days_ru[week_activity.index(max(week_activity))] if week_activity else "нет данных"
 
@@ -376,38 +484,116 @@ def cmd_model(message: types.Message) -> None:
         bot.reply_to(message, "Неизвестный ID модели. Сначала /models")
 
 
-def build_messages(user_id: int, user_text: str) -> list[dict]:
-    """Строит список сообщений для LLM с учетом персонажа пользователя"""
-    character = get_user_character(user_id)
-
+@lru_cache(maxsize=256)
+def _system_content(character_id: int, name: str, prompt: str, rules_title: str) -> str:
+    """Текст system-сообщения персонажа: строится один раз и дальше берётся из кэша"""
     # Формируем system-сообщение с именем и prompt персонажа + правила
-    system_content = f"Ты - {character['name']}. {character.get('prompt', '')}\n\n"
-    system_content += "Формат ответа:\n"
+    system_content = f"Ты - {name}. {prompt}\n\n"
+    system_content += f"{rules_title}:\n"
     system_content += "1. Отвечай кратко и по существу\n"
     system_content += "2. Технические ответы давай корректно и по пунктам\n"
     system_content += "3. Будь полезным и информативным\n"
+    return system_content
+
+
+def _system_message(character: dict, rules_title: str) -> dict:
+    # в кэше только неизменяемая строка: список сообщений вызывающий может дополнять и править
+    content = _system_content(character['id'], character['name'], character.get('prompt', ''), rules_title)
+    return {"role": "system", "content": content}
+
+
+def build_messages(user_id: int, user_text: str) -> list[dict]:
+    """Строит список сообщений для LLM с учетом персонажа пользователя"""
+    character = get_user_character(user_id)
 
     return [
-        {"role": "system", "content": system_content},
+        _system_message(character, "Формат ответа"),
         {"role": "user", "content": user_text},
     ]
 
 
 def build_messages_for_character(character: dict, user_text: str) -> list[dict]:
     """Строит список сообщений для LLM для конкретного персонажа"""
-    # Формируем system-сообщение с именем и prompt персонажа + правила
-    system_content = f"Ты - {character['name']}. {character.get('prompt', '')}\n\n"
-    system_content += "Правила ответа:\n"
-    system_content += "1. Отвечай кратко и по существу\n"
-    system_content += "2. Технические ответы давай корректно и по пунктам\n"
-    system_content += "3. Будь полезным и информативным\n"
-
     return [
-        {"role": "system", "content": system_content},
+        _system_message(character, "Правила ответа"),
         {"role": "user", "content": user_text},
     ]
 
 
+def format_latency(ms) -> str:
+    """Время ответа LLM; если пришлось открывать соединение, повторять запрос или ждать очереди — показываем и это"""
+    if getattr(ms, "cached", False):
+        return f"из кэша, исходно {ms} мс"
+    text = f"{ms} мс"
+    connect_ms = getattr(ms, "connect_ms", 0)
+    if connect_ms:
+        text += f", из них соединение {connect_ms} мс"
+    attempts = getattr(ms, "attempts", 1)
+    if attempts > 1:
+        text += f", попыток: {attempts}"
+    queue_ms = getattr(ms, "queue_ms", 0)
+    if queue_ms:
+        text += f", в очереди {queue_ms} мс"
+    return text
+
+
+def answer_footer(latency, model: str, model_keys: list[str], info: str = "", hedged: bool = False) -> str:
+    """Подпись под ответом модели: время, какая модель ответила и почему не основная"""
+    answered = f"модель: {model}"
+    if model != model_keys[0]:
+        reason = "быстрее" if hedged else "вместо недоступной"
+        answered += f" ({reason} {model_keys[0]})"
+    if info:
+        answered += f"; {info}"
+    return f"({format_latency(latency)}; {answered})"
+
+
+def _safe_edit(text: str, chat_id: int, message_id: int) -> None:
+    try:
+        bot.edit_message_text(text, chat_id, message_id)
+    except telebot.apihelper.ApiTelegramException as e:
+        # «message is not modified» и т. п. не должны обрывать ответ
+        print(f"Не удалось отредактировать сообщение: {e}")
+
+
+def stream_answer(message: types.Message, msgs: list[dict], model_keys: list[str], info: str = "",
+                  tail: str = "", priority: int = PRIORITY_HIGH) -> None:
+    """
+    Отправляет заглушку и дописывает в неё ответ модели по мере генерации.
+    Правки не чаще STREAM_EDIT_INTERVAL_S, чтобы не упереться в лимиты Telegram.
+    model_keys — основная модель и запасные; в ответе пишем, какая ответила.
+    priority — место в очереди к LLM (PRIORITY_HIGH для интерактивных команд).
+    """
+    placeholder = bot.reply_to(message, "⏳ Думаю…")
+    chat_id, message_id = placeholder.chat.id, placeholder.message_id
+    interval = STREAM_EDIT_INTERVAL_S if message.chat.type == "private" else STREAM_EDIT_INTERVAL_GROUP_S
+
+    parts: list[str] = []
+    shown = ""
+    last_edit = time.monotonic()
+    try:
+        stream = chat_stream_failover(msgs, model_keys, temperature=0.2, max_tokens=400, priority=priority)
+        for delta in stream:
+            parts.append(delta)
+            now = time.monotonic()
+            if now - last_edit < interval:
+                continue
+            text = "".join(parts).strip()[:4000]
+            if text and text != shown:
+                _safe_edit(f"{text} ▌", chat_id, message_id)
+                shown = text
+                last_edit = now
+        out = "".join(parts).strip()[:4000]  # не переполняем сообщение Telegram
+        footer = answer_footer(stream.latency, stream.model, model_keys, info, getattr(stream, "hedged", False))
+        _safe_edit(f"{out}\n\n{footer}{tail}", chat_id, message_id)
+    except QueueFullError:
+        _safe_edit("⏳ Бот сейчас занят другими вопросами к модели. Попробуйте через минуту.", chat_id, message_id)
+    except OpenRouterError as e:
+        _safe_edit(f"Ошибка: {e}", chat_id, message_id)
+    except Exception:
+        _safe_edit("Непредвиденная ошибка.", chat_id, message_id)
+
+
 @bot.message_handler(commands=["ask"])
 def cmd_ask(message: types.Message) -> None:
     q = message.text.replace("/ask", "", 1).strip()
@@ -416,16 +602,9 @@ def cmd_ask(message: types.Message) -> None:
         return
 
     msgs = build_messages(message.from_user.id, q[:600])
-    model_key = get_active_model()["key"]
+    model_keys = [m["key"] for m in get_fallback_chain()]
 
-    try:
-        text, ms = chat_once(msgs, model=model_key, temperature=0.2, max_tokens=400)
-        out = (text or "").strip()[:4000]  # не переполняем сообщение Telegram
-        bot.reply_to(message, f"{out}\n\n({ms} мс; модель: {model_key})")
-    except OpenRouterError as e:
-        bot.reply_to(message, f"Ошибка: {e}")
-    except Exception:
-        bot.reply_to(message, "Непредвиденная ошибка.")
+    stream_answer(message, msgs, model_keys)
 
 
 @bot.message_handler(commands=["characters"])
@@ -490,16 +669,9 @@ def cmd_ask_random(message: types.Message) -> None:
     character = get_character_by_id(chosen["id"])
 
     msgs = build_messages_for_character(character, q)
-    model_key = get_active_model()["key"]
+    model_keys = [m["key"] for m in get_fallback_chain()]
 
-    try:
-        text, ms = chat_once(msgs, model=model_key, temperature=0.2, max_tokens=400)
-        out = (text or "").strip()[:4000]
-        bot.reply_to(message, f"{out}\n\n({ms} мс; модель: {model_key}; как: {character['name']})")
-    except OpenRouterError as e:
-        bot.reply_to(message, f"Ошибка: {e}")
-    except Exception:
-        bot.reply_to(message, "Непредвиденная ошибка")
+    stream_answer(message, msgs, model_keys, f"как: {character['name']}", priority=PRIORITY_LOW)
 
 
 @bot.message_handler(commands=["ask_model"])
@@ -530,26 +702,56 @@ def cmd_ask_model(message: types.Message) -> None:
     # Строим сообщения с текущим персонажем пользователя
     msgs = build_messages(message.from_user.id, question[:600])
 
-    try:
-        # Выполняем запрос к указанной модели
-        text, ms = chat_once(msgs, model=target_model["key"], temperature=0.2, max_tokens=400)
-        out = (text or "").strip()[:4000]
+    # Получаем активную модель для информации
+    active_model = get_active_model()
 
-        # Получаем активную модель для информации
-        active_model = get_active_model()
+    # Выполняем запрос к указанной модели — без запасных, её выбрали явно
+    stream_answer(
+        message, msgs, [target_model["key"]],
+        target_model["label"],
+        f"\nАктивная модель осталась: {active_model['label']}"
+    )
 
-        bot.reply_to(
-            message,
-            f"{out}\n\n"
-            f"({ms} мс; модель: {target_model['label']} [{target_model['key']}])\n"
-            f"Активная модель осталась: {active_model['label']}"
-        )
-    except OpenRouterError as e:
-        bot.reply_to(message, f"Ошибка: {e}")
-    except Exception:
-        bot.reply_to(message, "Непредвиденная ошибка.")
+
+def run_webhook() -> None:
+    """Принимает обновления через webhook, пока не придёт SIGTERM/Ctrl+C; затем дорабатывает очередь."""
+    # один поток вебхука передаёт обновления в полосы в порядке прихода; обрабатывают их полосы,
+    # а когда полоса переполнена, очередь вебхука растёт и Telegram получает 503
+    server = webhook.WebhookServer(bot.process_new_updates, webhook.WEBHOOK_SECRET,
+                                   path=urlsplit(webhook.WEBHOOK_URL).path, workers=1).start()
+    bot.set_webhook(url=webhook.WEBHOOK_URL, secret_token=webhook.WEBHOOK_SECRET)
+    print(f"Webhook: {webhook.WEBHOOK_URL}, слушаем {server.address[0]}:{server.address[1]}")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        while not stop.wait(1.0):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"Webhook остановлен: {server.stats()}")
 
 
 if __name__ == "__main__":
     print("Бот запускается...")
-    bot.infinity_polling()
\ No newline at end of file
+    # индексируем старые заметки для /note_find в фоне, не задерживая запуск
+    threading.Thread(target=backfill_notes_fts, name="fts-backfill", daemon=True).start()
+    # DNS + TLS до OpenRouter заранее, чтобы первый /ask не ждал рукопожатия
+    threading.Thread(target=openrouter_client.warm_up, name="openrouter-warmup", daemon=True).start()
+    try:
+        if webhook.BOT_MODE == "webhook" and webhook.WEBHOOK_URL:
+            run_webhook()
+        else:
+            if webhook.BOT_MODE == "webhook":
+                print("BOT_MODE=webhook, но WEBHOOK_URL не задан — работаем через polling")
+            bot.remove_webhook()  # getUpdates не работает, пока установлен webhook
+            bot.infinity_polling()
+    finally:
+        bot.lanes.stop()
+        bot.outbox.close()
+        print(f"Полосы обработки: {bot.lanes.stats()}")
+        print(f"Очередь отправки: {bot.outbox.stats()}")
+        openrouter_client.close()
+        close_all()
\ No newline at end of file
@@ -0,0 +1,218 @@
+"""
+main_async.py — тот же бот на AsyncTeleBot: запросы к LLM ждут ответа в event loop,
+а не в потоке ОС, поэтому тысячи одновременных /ask обходятся несколькими потоками.
+
+Команды к модели (/ask, /ask_random, /ask_model) переписаны на async и используют
+openrouter_client.chat_once_failover_async; запросы к БД они делают в небольшом пуле
+db_executor. Остальные обработчики берутся из main.py как есть и выполняются в своём
+пуле handler_executor: они ждут отправки ответа и не должны занимать потоки БД.
+
+Все ответы — и async-команд, и обработчиков из main.py — идут через общую очередь
+отправки main.bot.outbox: лимиты Telegram и порядок сообщений в чате те же, что у main.py.
+
+Запуск:
+    python main_async.py
+"""
+
+import asyncio
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import telebot
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_handler_backends import BaseMiddleware, CancelUpdate
+
+import main
+import openrouter_client
+from db import list_characters, get_character_by_id, get_model_by_id, get_active_model, get_fallback_chain, \
+    backfill_notes_fts, close_all
+from openrouter_client import chat_once_failover_async, OpenRouterError
+from rate_limit import RateLimiter
+
+# Потоки для SQLite; запросы к LLM их не занимают
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "4"))
+# Потоки для синхронных обработчиков из main.py: каждый ждёт отправки своего ответа
+SYNC_HANDLER_WORKERS = int(os.getenv("SYNC_HANDLER_WORKERS", "8"))
+
+bot = AsyncTeleBot(main.TOKEN)
+db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+handler_executor = ThreadPoolExecutor(max_workers=SYNC_HANDLER_WORKERS, thread_name_prefix="sync-handler")
+
+# обработчики, у которых здесь своя async-версия
+ASYNC_HANDLERS = {"cmd_ask", "cmd_ask_random", "cmd_ask_model"}
+
+
+async def run_db(fn, *args, **kwargs):
+    """Выполняет блокирующий вызов (БД, синхронный обработчик) в db_executor."""
+    return await asyncio.get_running_loop().run_in_executor(db_executor, partial(fn, *args, **kwargs))
+
+
+async def reply_to(message: telebot.types.Message, text: str) -> telebot.types.Message:
+    """Как bot.reply_to, но через очередь отправки main.bot.outbox; ждёт, не занимая поток."""
+    reply = telebot.types.ReplyParameters(message.message_id)
+    return await asyncio.wrap_future(main.bot.send_message_nowait(message.chat.id, text, reply_parameters=reply))
+
+
+async def send_chat_action(chat_id: int, action: str) -> None:
+    """send_chat_action через очередь отправки: в лимит сообщений не считается."""
+    send = partial(telebot.TeleBot.send_chat_action, main.bot)
+    await asyncio.wrap_future(main.bot.outbox.submit_action(chat_id, send, chat_id, action))
+
+
+class AsyncRateLimitMiddleware(BaseMiddleware):
+    """RateLimitMiddleware из main.py для AsyncTeleBot; лимиты общие с синхронным режимом."""
+
+    def __init__(self, limiter: RateLimiter):
+        super().__init__()
+        self.update_types = ["message"]
+        self.limiter = limiter
+
+    async def pre_process(self, message, data):
+        command = telebot.util.extract_command(message.text or "")
+        if not command or message.from_user is None:
+            return None
+        verdict = self.limiter.check(message.from_user.id, command.lower())
+        if verdict.allowed:
+            return None
+        if verdict.warn:
+            await reply_to(message, f"Слишком часто. Повторите через {int(verdict.retry_after_s) + 1} с.")
+        return CancelUpdate()
+
+    async def post_process(self, message, data, exception):
+        pass
+
+
+bot.setup_middleware(AsyncRateLimitMiddleware(main.rate_limiter))
+
+
+def _offloaded(handler):
+    async def run(update) -> None:
+        await asyncio.get_running_loop().run_in_executor(handler_executor, handler, update)
+
+    run.__name__ = handler.__name__
+    return run
+
+
+def _mirror_sync_handlers() -> None:
+    """Регистрирует обработчики main.py с теми же фильтрами; отвечают они через main.bot."""
+    for h in main.bot.message_handlers:
+        if h["function"].__name__ not in ASYNC_HANDLERS:
+            bot.register_message_handler(_offloaded(h["function"]), **h["filters"])
+    for h in main.bot.callback_query_handlers:
+        bot.register_callback_query_handler(_offloaded(h["function"]), **h["filters"])
+
+
+async def answer(message: telebot.types.Message, msgs: list[dict], model_keys: list[str], info: str = "",
+                 tail: str = "") -> None:
+    """Ответ модели одним сообщением; подпись — как у main.stream_answer."""
+    await send_chat_action(message.chat.id, "typing")
+    try:
+        text, latency, model = await chat_once_failover_async(msgs, model_keys, temperature=0.2, max_tokens=400)
+        out = text.strip()[:4000]  # не переполняем сообщение Telegram
+        await reply_to(message, f"{out}\n\n{main.answer_footer(latency, model, model_keys, info)}{tail}")
+    except OpenRouterError as e:
+        await reply_to(message, f"Ошибка: {e}")
+    except Exception:
+        await reply_to(message, "Непредвиденная ошибка.")
+
+
+@bot.message_handler(commands=["ask"])
+async def cmd_ask(message: telebot.types.Message) -> None:
+    q = message.text.replace("/ask", "", 1).strip()
+    if not q:
+        await reply_to(message, "Использование: /ask <вопрос>")
+        return
+
+    msgs = await run_db(main.build_messages, message.from_user.id, q[:600])
+    model_keys = [m["key"] for m in await run_db(get_fallback_chain)]
+
+    await answer(message, msgs, model_keys)
+
+
+@bot.message_handler(commands=["ask_random"])
+async def cmd_ask_random(message: telebot.types.Message) -> None:
+    q = message.text.replace("/ask_random", "", 1).strip()
+    if not q:
+        await reply_to(message, "Использование: /ask_random <вопрос>")
+        return
+    q = q[:600]
+
+    items = await run_db(list_characters)
+    if not items:
+        await reply_to(message, "Каталог персонажей пуст.")
+        return
+    chosen = random.choice(items)
+    character = await run_db(get_character_by_id, chosen["id"])
+
+    msgs = main.build_messages_for_character(character, q)
+    model_keys = [m["key"] for m in await run_db(get_fallback_chain)]
+
+    await answer(message, msgs, model_keys, f"как: {character['name']}")
+
+
+@bot.message_handler(commands=["ask_model"])
+async def cmd_ask_model(message: telebot.types.Message) -> None:
+    parts = message.text.split(maxsplit=2)
+    if len(parts) < 3:
+        await reply_to(message, "Использование: /ask_model <ID модели> <вопрос>")
+        return
+
+    try:
+        model_id = int(parts[1])
+        question = parts[2].strip()
+    except ValueError:
+        await reply_to(message, "Ошибка: ID модели должен быть числом.")
+        return
+
+    if not question:
+        await reply_to(message, "Ошибка: Укажите вопрос.")
+        return
+
+    try:
+        target_model = await run_db(get_model_by_id, model_id)
+    except ValueError:
+        await reply_to(message, f"Ошибка: Модель с ID={model_id} не найдена. Сначала /models")
+        return
+
+    msgs = await run_db(main.build_messages, message.from_user.id, question[:600])
+    active_model = await run_db(get_active_model)
+
+    # только выбранная модель, без запасных
+    await answer(
+        message, msgs, [target_model["key"]],
+        target_model["label"],
+        f"\nАктивная модель осталась: {active_model['label']}"
+    )
+
+
+_mirror_sync_handlers()
+
+
+async def shutdown() -> None:
+    if asyncio_helper.session_manager.session is not None:  # сессию открывает только polling
+        await bot.close_session()
+    # сначала дорабатывают обработчики, потом очередь отправки досылает их ответы
+    handler_executor.shutdown(wait=True)
+    main.bot.lanes.stop()
+    main.bot.outbox.close()
+    print(f"Очередь отправки: {main.bot.outbox.stats()}")
+    await openrouter_client.aclose()
+    db_executor.shutdown(wait=True)
+    close_all()
+
+
+async def run() -> None:
+    print("Бот (asyncio) запускается...")
+    threading.Thread(target=backfill_notes_fts, name="fts-backfill", daemon=True).start()
+    try:
+        await bot.infinity_polling()
+    finally:
+        await shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
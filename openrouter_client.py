@@ -1,21 +1,82 @@
 from __future__ import annotations
-import os, time, requests
+import os, json, time, queue, bisect, random, socket, sqlite3, asyncio, hashlib, itertools, threading, requests
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, List, Sequence, Tuple
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
 load_dotenv()
 
-OPENROUTER_API = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_API = os.getenv("OPENROUTER_API", "https://openrouter.ai/api/v1/chat/completions")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+# сколько keep-alive соединений держим к одному хосту (по числу рабочих потоков бота)
+OPENROUTER_POOL_SIZE = int(os.getenv("OPENROUTER_POOL_SIZE", "10"))
+# кэш ответов: размер LRU в памяти, срок жизни записи и (необязательно) файл SQLite
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512"))
+LLM_CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_S", "86400"))
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "")
+# повторы при временных сбоях: число попыток и база экспоненциальной паузы
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))
+LLM_RETRY_BASE_S = float(os.getenv("LLM_RETRY_BASE_S", "0.5"))
+# предохранитель модели: окно последних вызовов, «медленный» ответ и пауза после размыкания
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+LLM_BREAKER_SLOW_S = float(os.getenv("LLM_BREAKER_SLOW_S", "15"))
+LLM_BREAKER_OPEN_S = float(os.getenv("LLM_BREAKER_OPEN_S", "30"))
+# хеджирование: включается явно; бюджет — доля запросов, которым разрешён дубль к запасной модели
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))
+# очередь к LLM: сколько запросов одновременно (всего и к одной модели) и сколько ждут в очереди
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+LLM_MODEL_CONCURRENCY = int(os.getenv("LLM_MODEL_CONCURRENCY", "2"))
+LLM_QUEUE_DEPTH = int(os.getenv("LLM_QUEUE_DEPTH", "8"))
+# asyncio-клиент (main_async.py): одновременных запросов к OpenRouter из одного event loop
+LLM_ASYNC_CONCURRENCY = int(os.getenv("LLM_ASYNC_CONCURRENCY", "256"))
+
+# приоритеты очереди: меньше — раньше
+PRIORITY_HIGH = 0   # интерактивные /ask, /ask_model
+PRIORITY_LOW = 10   # развлекательные /ask_random
+
+# сбои на стороне OpenRouter/модели: их имеет смысл повторять и на них срабатывает предохранитель
+TRANSIENT_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
 
 @dataclass
 class OpenRouterError(Exception):
     status: int
     msg: str
+    retry_after: float | None = None  # из заголовка Retry-After, секунды
+    retryable: bool = True            # False — повтор бессмыслен при любом статусе
+    attempts: int = 1                 # сколько попыток сделано до этой ошибки
     def __str__(self) -> str:
         return f"[{self.status}] {self.msg}"
 
+
+class QueueFullError(OpenRouterError):
+    """Очередь к LLM переполнена — запрос отклонён, не дожидаясь своей очереди."""
+
+    def __init__(self):
+        super().__init__(503, "Сейчас слишком много запросов к модели. Попробуйте через минуту.", retryable=False)
+
+
+class QueueTimeoutError(QueueFullError):
+    """Место в очереди к LLM не освободилось за timeout_s — запрос к модели не отправлялся."""
+
+    def __init__(self):
+        OpenRouterError.__init__(self, 408, "Слишком долго ждали очереди к модели. Повторите попытку позже.",
+                                 retryable=False)
+
+
+class CircuitOpenError(OpenRouterError):
+    """Модель отключена предохранителем — запрос к ней даже не отправлялся."""
+
+    def __init__(self, model: str):
+        super().__init__(503, f"Модель {model} временно отключена после серии ошибок.", retryable=False)
+        self.model = model
+
 def _friendly(status: int) -> str:
     return {
         400: "Неверный формат запроса.",
@@ -29,11 +90,604 @@ def _friendly(status: int) -> str:
         504: "Таймаут шлюза OpenRouter. Сервер не ответил вовремя. Повторите попытку позже.",
     }.get(status, "Сервис недоступен. Повторите попытку позже.")
 
-def chat_once(messages: List[Dict], *,
-              model: str,
-              temperature: float = 0.2,
-              max_tokens: int = 400,
-              timeout_s: int = 30) -> Tuple[str, int]:
+# ---------- пул HTTP-соединений ----------
+_timing = threading.local()
+_stats_lock = threading.Lock()
+_stats = {"connections": 0}
+
+
+def _record_connect(seconds: float) -> None:
+    _timing.connect_s = getattr(_timing, "connect_s", 0.0) + seconds
+    with _stats_lock:
+        _stats["connections"] += 1
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        t0 = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _record_connect(time.perf_counter() - t0)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        # DNS + TCP + TLS — всё, что экономит keep-alive
+        t0 = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _record_connect(time.perf_counter() - t0)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedAdapter(HTTPAdapter):
+    """HTTPAdapter, который замеряет время установки новых соединений."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Общая для всех потоков сессия с keep-alive пулом соединений к OpenRouter."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = _TimedAdapter(pool_connections=1, pool_maxsize=OPENROUTER_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def warm_up(timeout_s: float = 5.0) -> bool:
+    """Заранее открывает соединение (DNS + TLS), чтобы первый /ask не платил за него."""
+    try:
+        get_session().head(OPENROUTER_API, timeout=timeout_s)
+        return True
+    except requests.exceptions.RequestException:
+        return False
+
+
+def close() -> None:
+    """Закрывает пул соединений и файл кэша ответов (вызывать при остановке бота)."""
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
+    response_cache.close()
+
+
+async def aclose() -> None:
+    """Закрывает aiohttp-сессию asyncio-клиента и всё, что закрывает close()."""
+    global _async_session
+    session, _async_session = _async_session, None
+    if session is not None:
+        await session.close()
+    close()
+
+
+def connection_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
+
+
+class Latency(int):
+    """
+    Задержка запроса в мс. Ведёт себя как обычный int (общее время),
+    дополнительно хранит разбивку: connect_ms — установка соединения,
+    model_ms — всё остальное (отправка запроса и ответ модели).
+    """
+
+    def __new__(cls, total_ms: int, connect_ms: int = 0, cached: bool = False,
+                attempts: int = 1, retry_ms: int = 0, queue_ms: int = 0):
+        obj = super().__new__(cls, total_ms)
+        obj.connect_ms = connect_ms
+        obj.model_ms = total_ms - connect_ms
+        obj.cached = cached  # True — ответ из кэша, total_ms — задержка исходного запроса
+        obj.attempts = attempts  # сколько попыток понадобилось
+        obj.retry_ms = retry_ms  # сколько ушло на неудачные попытки и паузы между ними
+        obj.queue_ms = queue_ms  # сколько запрос ждал свободного места в очереди к LLM (входит в total_ms)
+        return obj
+
+
+# ---------- повторы ----------
+_sleep = time.sleep
+
+
+def _retry_after(headers) -> float | None:
+    """Retry-After из заголовков ответа в секундах: число или HTTP-дата."""
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Когда и через сколько повторять запрос: экспоненциальная пауза с полным
+    джиттером (random(0, min(max_delay_s, base_s * 2^n))), Retry-After от сервера
+    важнее своей паузы. Повтор не делается, если до дедлайна не успеть
+    подождать и дать попытке хотя бы min_attempt_s.
+    """
+    max_attempts: int = 3
+    base_s: float = 0.5
+    max_delay_s: float = 8.0
+    min_attempt_s: float = 1.0
+    statuses: frozenset = TRANSIENT_STATUSES
+
+    def is_retryable(self, error: OpenRouterError) -> bool:
+        return error.retryable and error.status in self.statuses
+
+    def next_delay(self, attempt: int, error: OpenRouterError, remaining_s: float) -> float | None:
+        """Пауза перед попыткой attempt + 1 или None, если повторять не надо."""
+        if attempt >= self.max_attempts or not self.is_retryable(error):
+            return None
+        if error.retry_after is not None:
+            delay = error.retry_after
+        else:
+            delay = random.uniform(0, min(self.max_delay_s, self.base_s * 2 ** (attempt - 1)))
+        if delay + self.min_attempt_s > remaining_s:
+            return None
+        return delay
+
+
+DEFAULT_RETRY = RetryPolicy(max_attempts=LLM_RETRY_ATTEMPTS, base_s=LLM_RETRY_BASE_S)
+
+
+# ---------- предохранители моделей ----------
+class CircuitBreaker:
+    """
+    Предохранитель одной модели.
+    closed — запросы идут; в скользящем окне из window последних вызовов считаем
+    плохие (ошибка сервера или ответ дольше slow_ms). Если плохих не меньше
+    failure_ratio (и вызовов хотя бы min_calls) — open: open_s запросы сразу
+    отклоняются. Потом half_open: пропускаем одну пробу; удача замыкает цепь,
+    неудача снова размыкает.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window: int = 20, min_calls: int = 5, failure_ratio: float = 0.5,
+                 slow_ms: int = 15000, open_s: float = 30.0, clock=time.monotonic):
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_ms = slow_ms
+        self.open_s = open_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._outcomes: deque[bool] = deque(maxlen=window)  # True — плохой вызов
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self.open_s:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос. В half_open пропускает ровно одну пробу."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if self._clock() - self._opened_at < self.open_s:
+                    return False
+                self._state, self._probe = self.HALF_OPEN, False
+            if self._probe:
+                return False
+            self._probe = True
+            return True
+
+    def record(self, ok: bool | None, latency_ms: int | None = None) -> None:
+        """Итог вызова: True/False — удача/сбой, None — не про здоровье модели (401, отмена)."""
+        with self._lock:
+            if ok is None:
+                if self._state == self.HALF_OPEN:
+                    self._probe = False
+                return
+            bad = not ok or (latency_ms is not None and latency_ms > self.slow_ms)
+            if self._state == self.HALF_OPEN:
+                self._probe = False
+                if bad:
+                    self._trip()
+                else:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                return
+            if self._state == self.OPEN:
+                return  # запоздалый ответ запроса, начатого до размыкания
+            self._outcomes.append(bad)
+            if len(self._outcomes) >= self.min_calls and \
+                    sum(self._outcomes) / len(self._outcomes) >= self.failure_ratio:
+                self._trip()
+
+    def _trip(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = self._clock()
+        self._outcomes.clear()
+
+    def snapshot(self) -> dict:
+        state = self.state
+        with self._lock:
+            return {"state": state, "calls": len(self._outcomes), "failures": sum(self._outcomes)}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = _breakers[model] = CircuitBreaker(
+                window=LLM_BREAKER_WINDOW, slow_ms=int(LLM_BREAKER_SLOW_S * 1000), open_s=LLM_BREAKER_OPEN_S)
+        return breaker
+
+
+def breaker_states() -> Dict[str, dict]:
+    """Состояние предохранителей по ключам моделей."""
+    with _breakers_lock:
+        items = list(_breakers.items())
+    return {model: breaker.snapshot() for model, breaker in items}
+
+
+def _health(error: OpenRouterError) -> bool | None:
+    # 400/401/403 — проблема запроса или ключа, а не модели; переполненная очередь
+    # и таймаут ожидания в ней (QueueTimeoutError) — наши
+    if isinstance(error, QueueFullError):
+        return None
+    return False if error.status in TRANSIENT_STATUSES else None
+
+
+# ---------- очередь запросов к LLM ----------
+class _Waiter:
+    __slots__ = ("model", "event", "granted")
+
+    def __init__(self, model: str):
+        self.model = model
+        self.event = threading.Event()
+        self.granted = False
+
+
+class LLMDispatcher:
+    """
+    Ограничивает число одновременных запросов к OpenRouter: всего max_concurrency
+    и не больше per_model к одной модели. Остальные ждут в очереди по приоритету
+    (внутри приоритета — по порядку прихода); запрос к занятой модели не мешает
+    пройти запросу к свободной. Если впереди уже max_depth ожидающих (для
+    PRIORITY_LOW — половина), запрос сразу отклоняется с QueueFullError, а не
+    дождавшийся места за timeout_s — с QueueTimeoutError.
+    """
+
+    def __init__(self, max_concurrency: int = 4, per_model: int = 2, max_depth: int = 8):
+        self.max_concurrency = max_concurrency
+        self.per_model = per_model
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._active_total = 0
+        self._active: Dict[str, int] = {}
+        self._waiting: List[Tuple[int, int, _Waiter]] = []  # отсортирован по (приоритет, номер)
+        self._seq = itertools.count()
+        self._stats = {"admitted": 0, "queued": 0, "rejected": 0, "timeouts": 0, "wait_ms": 0}
+
+    def _has_room(self, model: str) -> bool:
+        return self._active_total < self.max_concurrency and self._active.get(model, 0) < self.per_model
+
+    def _take(self, model: str) -> None:
+        self._active_total += 1
+        self._active[model] = self._active.get(model, 0) + 1
+        self._stats["admitted"] += 1
+
+    def _depth_limit(self, priority: int) -> int:
+        return self.max_depth if priority <= PRIORITY_HIGH else self.max_depth // 2
+
+    @contextmanager
+    def slot(self, model: str, priority: int = PRIORITY_HIGH, timeout_s: float | None = None):
+        """Держит место в очереди на время запроса; отдаёт время ожидания в мс."""
+        waited_ms = self.acquire(model, priority, timeout_s)
+        try:
+            yield waited_ms
+        finally:
+            self.release(model)
+
+    def acquire(self, model: str, priority: int = PRIORITY_HIGH, timeout_s: float | None = None) -> int:
+        """Занимает место (ждёт его до timeout_s) и отдаёт время ожидания в мс; вернуть — release(model)."""
+        t0 = time.perf_counter()
+        with self._lock:
+            if self._has_room(model):
+                self._take(model)
+                waiter = None
+            else:
+                if len(self._waiting) >= self._depth_limit(priority):
+                    self._stats["rejected"] += 1
+                    raise QueueFullError()
+                waiter = _Waiter(model)
+                bisect.insort(self._waiting, (priority, next(self._seq), waiter))
+                self._stats["queued"] += 1
+        if waiter is not None and not waiter.event.wait(timeout_s):
+            with self._lock:
+                if not waiter.granted:
+                    self._waiting = [item for item in self._waiting if item[2] is not waiter]
+                    self._stats["timeouts"] += 1
+                    raise QueueTimeoutError()
+        waited_ms = int((time.perf_counter() - t0) * 1000)
+        with self._lock:
+            self._stats["wait_ms"] += waited_ms
+        return waited_ms
+
+    def release(self, model: str) -> None:
+        with self._lock:
+            self._active_total -= 1
+            self._active[model] -= 1
+            if not self._active[model]:
+                del self._active[model]
+            # будим всех, кому теперь хватает места, в порядке приоритета
+            for item in list(self._waiting):
+                if self._active_total >= self.max_concurrency:
+                    break
+                waiter = item[2]
+                if self._has_room(waiter.model):
+                    self._waiting.remove(item)
+                    self._take(waiter.model)
+                    waiter.granted = True
+                    waiter.event.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, active=self._active_total, waiting=len(self._waiting))
+
+
+dispatcher = LLMDispatcher(LLM_CONCURRENCY, LLM_MODEL_CONCURRENCY, LLM_QUEUE_DEPTH)
+
+
+def dispatch_stats() -> dict:
+    """Счётчики очереди к LLM: admitted/queued/rejected/timeouts, суммарное ожидание, active/waiting."""
+    return dispatcher.stats()
+
+
+# ---------- статистика задержек и бюджет хеджирования ----------
+class LatencyWindow:
+    """Последние size удачных задержек модели (мс) и их перцентили."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples: deque[int] = deque(maxlen=size)
+
+    def add(self, ms: int) -> None:
+        with self._lock:
+            self._samples.append(ms)
+
+    def percentile(self, q: float) -> int | None:
+        """q-й перцентиль (0..1) или None, пока данных меньше min_samples."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+
+_latencies: Dict[Tuple[str, str], LatencyWindow] = {}  # (модель, "full" | "first_token") -> окно
+_latencies_lock = threading.Lock()
+
+
+def _latency_window(model: str, kind: str) -> LatencyWindow:
+    with _latencies_lock:
+        window = _latencies.get((model, kind))
+        if window is None:
+            window = _latencies[(model, kind)] = LatencyWindow()
+        return window
+
+
+def model_latency(model: str) -> LatencyWindow:
+    """Полные ответы модели (chat_once и async) без времени в очереди."""
+    return _latency_window(model, "full")
+
+
+def model_first_token(model: str) -> LatencyWindow:
+    """Время до первого куска потоковых ответов модели — по нему HedgedStream решает, когда слать дубль."""
+    return _latency_window(model, "first_token")
+
+
+class HedgeBudget:
+    """
+    Сколько дублирующих запросов можно себе позволить: не больше ratio от
+    числа запросов. Счётчики периодически делятся пополам, чтобы бюджет
+    отражал недавний трафик, а не всю историю.
+    """
+
+    def __init__(self, ratio: float = 0.1, horizon: int = 1000):
+        self.ratio = ratio
+        self.horizon = horizon
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+
+    def note_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+            if self.requests > self.horizon:
+                self.requests //= 2
+                self.hedges //= 2
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.ratio * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "hedges": self.hedges, "ratio": self.ratio}
+
+
+hedge_budget = HedgeBudget(LLM_HEDGE_BUDGET)
+
+
+# ---------- кэш ответов ----------
+def cache_key(messages: List[Dict], model: str, temperature: float, max_tokens: int) -> str:
+    """Канонический хэш запроса: одинаковые по смыслу запросы дают один ключ."""
+    blob = json.dumps(
+        {"model": model, "messages": messages, "temperature": float(temperature), "max_tokens": int(max_tokens)},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Двухуровневый кэш ответов модели: LRU в памяти (max_size записей)
+    и, если задан db_path, таблица SQLite, переживающая перезапуск бота.
+    Записи старше ttl_s считаются промахом. Хранит текст и задержку исходного запроса.
+    """
+
+    def __init__(self, max_size: int = 512, ttl_s: float = 86400.0, db_path: str | None = None):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[str, int, float]]" = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+        self._stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_s > 0 and (self.max_size > 0 or bool(self.db_path))
+
+    def _conn(self) -> sqlite3.Connection:
+        # одно соединение на процесс, доступ под self._lock
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5.0)
+            self._db.execute("PRAGMA journal_mode = WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    latency_ms INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._db.commit()
+        return self._db
+
+    def _remember(self, key: str, entry: Tuple[str, int, float]) -> None:
+        if self.max_size <= 0:
+            return
+        self._items[key] = entry
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def get(self, key: str) -> Tuple[str, Latency] | None:
+        """Текст и Latency(cached=True) исходного запроса либо None."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and now - entry[2] > self.ttl_s:
+                del self._items[key]
+                entry = None
+            if entry is not None:
+                self._items.move_to_end(key)
+                self._stats["memory_hits"] += 1
+            elif self.db_path:
+                row = self._conn().execute(
+                    "SELECT text, latency_ms, created_at FROM llm_cache WHERE key = ? AND created_at >= ?",
+                    (key, now - self.ttl_s)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1], row[2])
+                    self._remember(key, entry)
+                    self._stats["disk_hits"] += 1
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+        return entry[0], Latency(entry[1], cached=True)
+
+    def put(self, key: str, text: str, latency: int) -> None:
+        if not self.enabled or not text:
+            return
+        entry = (text, int(latency), time.time())
+        with self._lock:
+            self._remember(key, entry)
+            self._stats["stores"] += 1
+            if self.db_path:
+                conn = self._conn()
+                conn.execute("INSERT OR REPLACE INTO llm_cache (key, text, latency_ms, created_at) VALUES (?, ?, ?, ?)",
+                             (key, *entry))
+                # заодно подчищаем просроченное, чтобы файл не рос бесконечно
+                conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (entry[2] - self.ttl_s,))
+                conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            for name in self._stats:
+                self._stats[name] = 0
+            if self.db_path:
+                conn = self._conn()
+                conn.execute("DELETE FROM llm_cache")
+                conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, size=len(self._items))
+
+
+response_cache = ResponseCache(LLM_CACHE_SIZE, LLM_CACHE_TTL_S, LLM_CACHE_DB or None)
+
+
+def cache_stats() -> dict:
+    """Счётчики кэша ответов: hits/misses (+ разбивка по уровням), stores, size."""
+    return response_cache.stats()
+
+
+def _request_parts(messages: List[Dict], model: str, temperature: float, max_tokens: int) -> Tuple[Dict, Dict]:
     if not OPENROUTER_API_KEY:
         raise OpenRouterError(401, "Отсутствует OPENROUTER_API_KEY (.env).")
     headers = {
@@ -46,19 +700,704 @@ def chat_once(messages: List[Dict], *,
         "temperature": temperature,
         "max_tokens": max_tokens,
     }
-    t0 = time.perf_counter()
+    return headers, payload
+
+
+# ---------- склейка одинаковых запросов (single-flight) ----------
+class _Flight:
+    """
+    Один запрос к модели, результат которого ждут несколько потоков.
+    Лидер публикует куски текста и завершает полёт; ведомые читают те же куски.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.parts: List[str] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.latency: Latency | None = None
+        self.followers = 0  # меняется только под замком SingleFlight
+
+    def publish(self, delta: str) -> None:
+        with self._cond:
+            self.parts.append(delta)
+            self._cond.notify_all()
+
+    def finish(self, latency: Latency | None = None, error: BaseException | None = None) -> None:
+        with self._cond:
+            self.done = True
+            self.latency = latency
+            self.error = error
+            self._cond.notify_all()
+
+    def follow(self) -> Iterator[str]:
+        """Куски ответа лидера по мере поступления; ошибка лидера пробрасывается."""
+        seen = 0
+        while True:
+            with self._cond:
+                while seen >= len(self.parts) and not self.done:
+                    self._cond.wait()
+                new = self.parts[seen:]
+                seen = len(self.parts)
+                done, error = self.done, self.error
+            yield from new
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    """Реестр запросов «в полёте»: одинаковые одновременные запросы делят один вызов."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._stats = {"leaders": 0, "collapsed": 0}
+
+    def count(self, collapsed: bool) -> None:
+        with self._lock:
+            self._stats["collapsed" if collapsed else "leaders"] += 1
+
+    def join(self, key: str) -> Tuple[_Flight, bool]:
+        """(полёт, True) — вызывающий сам идёт к модели; (полёт, False) — ждёт чужой ответ."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._stats["collapsed"] += 1
+                flight.followers += 1
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            self._stats["leaders"] += 1
+            return flight, True
+
+    def leave(self, key: str, flight: _Flight) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def detach(self, key: str, flight: _Flight) -> bool:
+        """
+        Снять полёт с реестра, если его никто не ждёт: True — лидер может обрывать
+        запрос, новые вызовы к нему уже не присоединятся. False — есть ведомые.
+        """
+        with self._lock:
+            if flight.followers:
+                return False
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            return True
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._flights))
+
+
+_single_flight = SingleFlight()
+
+
+def single_flight_stats() -> dict:
+    """leaders — реальных запросов к модели, collapsed — сколько вызовов к ним присоединилось."""
+    return _single_flight.stats()
+
+
+def _aborted() -> OpenRouterError:
+    return OpenRouterError(503, "Запрос к модели прерван. Повторите попытку позже.")
+
+
+def _post_once(headers: Dict, payload: Dict, timeout_s: int, attempt_timeout_s: float) -> str:
     try:
-        r = requests.post(OPENROUTER_API, json=payload, headers=headers, timeout=timeout_s)
-        dt_ms = int((time.perf_counter() - t0) * 1000)
+        r = get_session().post(OPENROUTER_API, json=payload, headers=headers, timeout=attempt_timeout_s)
         if r.status_code // 100 != 2:
-            raise OpenRouterError(r.status_code, _friendly(r.status_code))
+            raise OpenRouterError(r.status_code, _friendly(r.status_code), retry_after=_retry_after(r.headers))
         try:
             data = r.json()
-            text = data["choices"][0]["message"]["content"]
+            return data["choices"][0]["message"]["content"]
         except Exception:
-            raise OpenRouterError(500, "Неожиданная структура ответа OpenRouter.")
-        return text, dt_ms
+            raise OpenRouterError(500, "Неожиданная структура ответа OpenRouter.", retryable=False)
     except requests.exceptions.Timeout:
         raise OpenRouterError(408, f"Таймаут запроса ({timeout_s}с). Проверьте соединение.")
     except requests.exceptions.ConnectionError:
-        raise OpenRouterError(503, "Ошибка подключения к OpenRouter. Проверьте интернет-соединение.")
\ No newline at end of file
+        raise OpenRouterError(503, "Ошибка подключения к OpenRouter. Проверьте интернет-соединение.")
+
+
+def _post_with_retries(headers: Dict, payload: Dict, timeout_s: int, policy: RetryPolicy,
+                       queue_ms: int = 0) -> Tuple[str, Latency]:
+    # timeout_s — общий дедлайн на все попытки, а не на каждую; из него уже ушло queue_ms в очереди
+    _timing.connect_s = 0.0
+    t0 = time.perf_counter()
+    deadline = time.monotonic() + timeout_s - queue_ms / 1000
+    attempt = 0
+    while True:
+        attempt += 1
+        attempt_started = time.perf_counter()
+        try:
+            text = _post_once(headers, payload, timeout_s, max(deadline - time.monotonic(), 0.1))
+            break
+        except OpenRouterError as e:
+            delay = policy.next_delay(attempt, e, deadline - time.monotonic())
+            if delay is None:
+                e.attempts = attempt
+                raise
+            _sleep(delay)
+    now = time.perf_counter()
+    return text, Latency(int((now - t0) * 1000) + queue_ms, int(_timing.connect_s * 1000),
+                         attempts=attempt, retry_ms=int((attempt_started - t0) * 1000), queue_ms=queue_ms)
+
+
+def _guarded_post(model: str, headers: Dict, payload: Dict, timeout_s: int,
+                  policy: RetryPolicy, priority: int = PRIORITY_HIGH) -> Tuple[str, Latency]:
+    breaker = get_breaker(model)
+    if not breaker.allow():
+        raise CircuitOpenError(model)
+    ok, service_ms = None, None
+    try:
+        with dispatcher.slot(model, priority, timeout_s) as queue_ms:
+            text, latency = _post_with_retries(headers, payload, timeout_s, policy, queue_ms)
+        ok = True
+        # предохранитель и p90 судят о модели, а не о нашей очереди к ней
+        service_ms = int(latency) - queue_ms
+        model_latency(model).add(service_ms)
+        return text, latency
+    except OpenRouterError as e:
+        ok = _health(e)
+        raise
+    finally:
+        breaker.record(ok, service_ms)
+
+
+def chat_once(messages: List[Dict], *,
+              model: str,
+              temperature: float = 0.2,
+              max_tokens: int = 400,
+              timeout_s: int = 30,
+              use_cache: bool = True,
+              retry: RetryPolicy | None = None,
+              priority: int = PRIORITY_HIGH) -> Tuple[str, int]:
+    headers, payload = _request_parts(messages, model, temperature, max_tokens)
+    key = cache_key(messages, model, temperature, max_tokens)
+    if use_cache:
+        hit = response_cache.get(key)
+        if hit is not None:
+            return hit
+    flight, leader = _single_flight.join(key)
+    if not leader:
+        # такой же запрос уже идёт — ждём его ответа вместо второго вызова
+        text = "".join(flight.follow())
+        return text, flight.latency
+    try:
+        text, dt_ms = _guarded_post(model, headers, payload, timeout_s, retry or DEFAULT_RETRY, priority)
+    except BaseException as e:
+        flight.finish(error=e if isinstance(e, OpenRouterError) else _aborted())
+        raise
+    else:
+        if use_cache:
+            response_cache.put(key, text, dt_ms)
+        flight.publish(text)
+        flight.finish(latency=dt_ms)
+        return text, dt_ms
+    finally:
+        _single_flight.leave(key, flight)
+
+
+class ChatStream:
+    """
+    Потоковый ответ OpenRouter (SSE, "stream": true). Итерация выдаёт куски текста
+    по мере генерации. После окончания заполнены latency (как у chat_once)
+    и first_token_ms — время до первого куска. При попадании в кэш весь ответ
+    приходит одним куском, а полностью дочитанный поток кладётся в кэш.
+    Если такой же запрос уже идёт, поток читает его куски, а не открывает свой.
+    """
+
+    def __init__(self, messages: List[Dict], *, model: str, temperature: float = 0.2,
+                 max_tokens: int = 400, timeout_s: int = 30, use_cache: bool = True,
+                 retry: RetryPolicy | None = None, priority: int = PRIORITY_HIGH):
+        self.headers, self.payload = _request_parts(messages, model, temperature, max_tokens)
+        self.payload["stream"] = True
+        self.model = model
+        self.timeout_s = timeout_s
+        self.key = cache_key(messages, model, temperature, max_tokens)
+        self.use_cache = use_cache
+        self.retry = retry or DEFAULT_RETRY
+        self.priority = priority
+        self.latency: Latency | None = None
+        self.first_token_ms: int | None = None
+        self.cancelled = False
+        self._response: requests.Response | None = None
+        self._lock = threading.Lock()
+        self._slot: LLMDispatcher | None = None  # чьё место в очереди держим
+        self._flight: _Flight | None = None  # полёт, который мы ведём как лидер
+
+    def cancel(self) -> None:
+        """
+        Отмена из другого потока (проигравший в HedgedStream): место в очереди к LLM
+        освобождается сразу, а HTTP-ответ обрывается, не дожидаясь следующего куска.
+        Если к нашему запросу присоединились другие вызовы (SingleFlight), его не
+        обрываем: он дочитывается для них, а отменивший просто перестаёт слушать.
+        """
+        with self._lock:
+            if self._flight is not None and not _single_flight.detach(self.key, self._flight):
+                return
+            self.cancelled = True
+        self._free_slot()
+        if self._response is not None:
+            _abort_response(self._response)
+
+    def _free_slot(self) -> None:
+        with self._lock:
+            slot, self._slot = self._slot, None
+        if slot is not None:
+            slot.release(self.model)
+
+    def __iter__(self) -> Iterator[str]:
+        hit = response_cache.get(self.key) if self.use_cache else None
+        if hit is not None:
+            text, self.latency = hit
+            self.first_token_ms = 0
+            yield text
+            return
+        flight, leader = _single_flight.join(self.key)
+        if not leader:
+            t0 = time.perf_counter()
+            for delta in flight.follow():
+                if self.first_token_ms is None:
+                    self.first_token_ms = int((time.perf_counter() - t0) * 1000)
+                yield delta
+            self.latency = flight.latency
+            return
+        with self._lock:
+            self._flight = flight
+            # cancel() пришёл до join: обрываем, только если никто не успел присоединиться
+            if self.cancelled and not _single_flight.detach(self.key, flight):
+                self.cancelled = False
+        try:
+            for delta in self._guarded_fetch():
+                flight.publish(delta)
+                yield delta
+        except BaseException as e:
+            # в т. ч. GeneratorExit, если читатель бросил поток: ведомые не должны ждать вечно
+            flight.finish(error=e if isinstance(e, OpenRouterError) else _aborted())
+            raise
+        else:
+            if self.use_cache:
+                response_cache.put(self.key, "".join(flight.parts), self.latency)
+            flight.finish(latency=self.latency)
+        finally:
+            _single_flight.leave(self.key, flight)
+
+    def _guarded_fetch(self) -> Iterator[str]:
+        # для потока «скорость» модели — время до первого куска, а не всей генерации
+        breaker = get_breaker(self.model)
+        if not breaker.allow():
+            raise CircuitOpenError(self.model)
+        ok = None
+        try:
+            slot = dispatcher
+            queue_ms = slot.acquire(self.model, self.priority, self.timeout_s)
+            with self._lock:
+                self._slot = slot
+            try:
+                if self.cancelled:  # отменили, пока ждали очереди
+                    raise _aborted()
+                yield from self._fetch(queue_ms)
+            finally:
+                self._free_slot()
+            ok = True
+            if self.first_token_ms is not None:
+                model_first_token(self.model).add(self.first_token_ms)
+        except OpenRouterError as e:
+            # оборванный нами ответ ничего не говорит о здоровье модели
+            ok = None if self.cancelled else _health(e)
+            raise
+        finally:
+            breaker.record(ok, self.first_token_ms if ok else None)
+
+    def _fetch(self, queue_ms: int = 0) -> Iterator[str]:
+        # повторяем только до первого куска: отданный пользователю текст не переиграть
+        _timing.connect_s = 0.0
+        t0 = time.perf_counter()
+        deadline = time.monotonic() + self.timeout_s - queue_ms / 1000
+        attempt = 0
+        while True:
+            attempt += 1
+            attempt_started = time.perf_counter()
+            try:
+                for delta in self._fetch_once(t0, max(deadline - time.monotonic(), 0.1)):
+                    yield delta
+                break
+            except OpenRouterError as e:
+                delay = None
+                if self.first_token_ms is None and not self.cancelled:
+                    delay = self.retry.next_delay(attempt, e, deadline - time.monotonic())
+                if delay is None:
+                    e.attempts = attempt
+                    raise
+                _sleep(delay)
+        self.latency = Latency(int((time.perf_counter() - t0) * 1000) + queue_ms, int(_timing.connect_s * 1000),
+                               attempts=attempt, retry_ms=int((attempt_started - t0) * 1000), queue_ms=queue_ms)
+
+    def _fetch_once(self, t0: float, attempt_timeout_s: float) -> Iterator[str]:
+        try:
+            r = get_session().post(OPENROUTER_API, json=self.payload, headers=self.headers,
+                                   timeout=attempt_timeout_s, stream=True)
+            self._response = r
+            with r:
+                if self.cancelled:  # cancel() пришёл, пока ждали заголовков
+                    raise _aborted()
+                if r.status_code // 100 != 2:
+                    raise OpenRouterError(r.status_code, _friendly(r.status_code), retry_after=_retry_after(r.headers))
+                r.encoding = "utf-8"  # у text/event-stream часто нет charset
+                lines = r.iter_lines(decode_unicode=True)
+                for delta in self._parse(lines):
+                    if self.first_token_ms is None:
+                        self.first_token_ms = int((time.perf_counter() - t0) * 1000)
+                    yield delta
+                # дочитываем хвост после [DONE], иначе соединение не вернётся в пул
+                for _ in lines:
+                    pass
+        except requests.exceptions.Timeout:
+            raise OpenRouterError(408, f"Таймаут запроса ({self.timeout_s}с). Проверьте соединение.")
+        except requests.exceptions.ConnectionError:
+            raise OpenRouterError(503, "Ошибка подключения к OpenRouter. Проверьте интернет-соединение.")
+
+    @staticmethod
+    def _parse(lines) -> Iterator[str]:
+        for line in lines:
+            # пустые строки разделяют события, ":" — комментарии (OpenRouter шлёт keep-alive)
+            if not line or line.startswith(":") or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            try:
+                event = json.loads(data)
+            except ValueError:
+                raise OpenRouterError(500, "Неожиданная структура ответа OpenRouter.", retryable=False)
+            if "error" in event:
+                code = (event["error"] or {}).get("code")
+                status = code if isinstance(code, int) else 500
+                raise OpenRouterError(status, _friendly(status))
+            try:
+                delta = event["choices"][0].get("delta", {}).get("content")
+            except (KeyError, IndexError, AttributeError):
+                raise OpenRouterError(500, "Неожиданная структура ответа OpenRouter.", retryable=False)
+            if delta:
+                yield delta
+
+
+def _abort_response(r: requests.Response) -> None:
+    # r.close() из чужого потока ждёт, пока читающий поток получит следующий кусок;
+    # shutdown сокета будит его сразу (ChunkedEncodingError), соединение в пул не вернётся
+    sock = getattr(getattr(r.raw, "_connection", None), "sock", None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def chat_stream(messages: List[Dict], *,
+                model: str,
+                temperature: float = 0.2,
+                max_tokens: int = 400,
+                timeout_s: int = 30,
+                use_cache: bool = True,
+                retry: RetryPolicy | None = None,
+                priority: int = PRIORITY_HIGH) -> ChatStream:
+    """Как chat_once, но ответ приходит по кускам: for delta in chat_stream(...)."""
+    return ChatStream(messages, model=model, temperature=temperature, max_tokens=max_tokens,
+                      timeout_s=timeout_s, use_cache=use_cache, retry=retry, priority=priority)
+
+
+class HedgedStream:
+    """
+    Поток с подстраховкой: запрос к primary; если первый кусок не пришёл за p90
+    её задержки и бюджет позволяет — тот же запрос к hedge. Отвечает та, что
+    первой прислала текст, вторая отменяется. После окончания model — победитель,
+    hedged — был ли дубль, launched — к каким моделям реально ходили.
+    """
+
+    def __init__(self, messages: List[Dict], primary: str, hedge: str, *,
+                 budget: HedgeBudget | None = None, **kwargs):
+        self.messages = messages
+        self.primary = primary
+        self.hedge = hedge
+        self.budget = budget or hedge_budget
+        self.kwargs = kwargs
+        self.model: str | None = None
+        self.hedged = False
+        self.launched: List[str] = []
+        self.latency: Latency | None = None
+        self.first_token_ms: int | None = None
+
+    def _leg(self, stream: ChatStream, events: "queue.Queue") -> None:
+        # отдельный поток на каждую модель: куски складываем в общую очередь
+        model = stream.model
+        chunks = iter(stream)
+        try:
+            for delta in chunks:
+                if stream.cancelled:
+                    return
+                events.put(("delta", model, delta))
+            events.put(("done", model, stream.latency))
+        except OpenRouterError as e:
+            events.put(("error", model, e))
+        except Exception:
+            events.put(("error", model, _aborted()))
+        finally:
+            chunks.close()
+
+    def _launch(self, model: str, events: "queue.Queue", legs: Dict[str, ChatStream]) -> None:
+        legs[model] = ChatStream(self.messages, model=model, **self.kwargs)
+        self.launched.append(model)
+        threading.Thread(target=self._leg, args=(legs[model], events),
+                         name=f"hedge-{model}", daemon=True).start()
+
+    def __iter__(self) -> Iterator[str]:
+        events: "queue.Queue" = queue.Queue()
+        legs: Dict[str, ChatStream] = {}
+        t0 = time.perf_counter()
+        self.budget.note_request()
+        self._launch(self.primary, events, legs)
+        threshold = model_first_token(self.primary).percentile(0.9)
+        pending = {self.primary}
+        winner = None
+        try:
+            while True:
+                timeout = None
+                if winner is None and threshold is not None and not self.hedged:
+                    timeout = max(0.0, threshold / 1000 - (time.perf_counter() - t0))
+                try:
+                    kind, model, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    if self.budget.try_spend():
+                        self.hedged = True
+                        self._launch(self.hedge, events, legs)
+                        pending.add(self.hedge)
+                    else:
+                        threshold = None  # бюджет исчерпан — просто ждём основную
+                    continue
+                if winner is None:
+                    if kind == "error":
+                        pending.discard(model)
+                        if pending:
+                            continue
+                        raise value
+                    winner = model
+                    # проигравший отдаёт место в очереди и соединение сразу, а не со следующим куском
+                    for other, leg in legs.items():
+                        if other != winner:
+                            leg.cancel()
+                if model != winner:
+                    continue
+                if kind == "error":
+                    raise value
+                if kind == "done":
+                    self.model = winner
+                    if winner == self.primary or value.cached:
+                        self.latency = value
+                    else:
+                        # для дубля считаем от начала запроса, а не от его запуска
+                        self.latency = Latency(int((time.perf_counter() - t0) * 1000), value.connect_ms,
+                                               attempts=value.attempts, retry_ms=value.retry_ms)
+                    return
+                if self.first_token_ms is None:
+                    self.first_token_ms = int((time.perf_counter() - t0) * 1000)
+                yield value
+        finally:
+            if self.model is None:  # ошибка или читатель бросил поток — гасим всех
+                for leg in legs.values():
+                    leg.cancel()
+
+
+class FailoverStream:
+    """
+    Поток по цепочке моделей: если модель отключена предохранителем или упала
+    до первого куска, сразу переходим к следующей. С hedge=True первая модель
+    подстраховывается следующей (см. HedgedStream). После окончания model —
+    ключ ответившей модели, failed — кого пропустили, hedged — ответил ли дубль.
+    """
+
+    def __init__(self, messages: List[Dict], models: Sequence[str], *, hedge: bool = False, **kwargs):
+        self.messages = messages
+        self.models = list(models)
+        self.hedge = hedge
+        self.kwargs = kwargs
+        self.model: str | None = None
+        self.failed: List[str] = []
+        self.hedged = False
+        self.latency: Latency | None = None
+        self.first_token_ms: int | None = None
+
+    def __iter__(self) -> Iterator[str]:
+        last_error: OpenRouterError | None = None
+        remaining = list(self.models)
+        while remaining:
+            model = remaining.pop(0)
+            if self.hedge and remaining:
+                stream = HedgedStream(self.messages, model, remaining[0], **self.kwargs)
+            else:
+                stream = ChatStream(self.messages, model=model, **self.kwargs)
+            try:
+                yield from stream
+            except OpenRouterError as e:
+                # начатый ответ уже у пользователя, а 401/400 другая модель не исправит
+                if stream.first_token_ms is not None or not (isinstance(e, CircuitOpenError) or _health(e) is False):
+                    raise
+                tried = getattr(stream, "launched", [model])
+                self.failed.extend(tried)
+                remaining = [m for m in remaining if m not in tried]
+                last_error = e
+                continue
+            self.model, self.latency, self.first_token_ms = stream.model, stream.latency, stream.first_token_ms
+            self.hedged = getattr(stream, "hedged", False) and stream.model != model
+            return
+        raise last_error or OpenRouterError(503, _friendly(503))
+
+
+def chat_stream_failover(messages: List[Dict], models: Sequence[str], *,
+                         temperature: float = 0.2,
+                         max_tokens: int = 400,
+                         timeout_s: int = 30,
+                         hedge: bool | None = None,
+                         priority: int = PRIORITY_HIGH) -> FailoverStream:
+    """Как chat_stream, но по цепочке моделей models (первая — основная). hedge=None — по LLM_HEDGE."""
+    return FailoverStream(messages, models, hedge=LLM_HEDGE if hedge is None else hedge,
+                          temperature=temperature, max_tokens=max_tokens, timeout_s=timeout_s,
+                          priority=priority)
+
+
+# ---------- asyncio-клиент ----------
+# Те же кэш, склейка запросов, предохранители и повторы, но без потоков:
+# тысячи ожидающих ответа /ask не занимают ни одного потока ОС.
+_async_session = None
+_async_slots: asyncio.Semaphore | None = None
+_async_flights: Dict[str, "asyncio.Future"] = {}
+_async_sleep = asyncio.sleep
+
+
+def _get_async_session():
+    global _async_session, _async_slots
+    import aiohttp  # нужен только asyncio-режиму (ставится вместе с AsyncTeleBot)
+
+    if _async_session is None or _async_session.closed:
+        connector = aiohttp.TCPConnector(limit=LLM_ASYNC_CONCURRENCY, limit_per_host=LLM_ASYNC_CONCURRENCY)
+        _async_session = aiohttp.ClientSession(connector=connector)
+        _async_slots = asyncio.Semaphore(LLM_ASYNC_CONCURRENCY)
+    return _async_session
+
+
+async def _post_once_async(headers: Dict, payload: Dict, timeout_s: int, attempt_timeout_s: float) -> str:
+    import aiohttp
+
+    session = _get_async_session()
+    try:
+        async with session.post(OPENROUTER_API, json=payload, headers=headers,
+                                timeout=aiohttp.ClientTimeout(total=attempt_timeout_s)) as r:
+            if r.status // 100 != 2:
+                raise OpenRouterError(r.status, _friendly(r.status), retry_after=_retry_after(r.headers))
+            try:
+                data = await r.json(content_type=None)
+                return data["choices"][0]["message"]["content"]
+            except Exception:
+                raise OpenRouterError(500, "Неожиданная структура ответа OpenRouter.", retryable=False)
+    except asyncio.TimeoutError:
+        raise OpenRouterError(408, f"Таймаут запроса ({timeout_s}с). Проверьте соединение.")
+    except aiohttp.ClientError:
+        raise OpenRouterError(503, "Ошибка подключения к OpenRouter. Проверьте интернет-соединение.")
+
+
+async def _post_with_retries_async(headers: Dict, payload: Dict, timeout_s: int,
+                                   policy: RetryPolicy) -> Tuple[str, Latency]:
+    t0 = time.perf_counter()
+    deadline = time.monotonic() + timeout_s
+    _get_async_session()
+    async with _async_slots:
+        queue_ms = int((time.perf_counter() - t0) * 1000)
+        attempt = 0
+        while True:
+            attempt += 1
+            attempt_started = time.perf_counter()
+            try:
+                text = await _post_once_async(headers, payload, timeout_s, max(deadline - time.monotonic(), 0.1))
+                break
+            except OpenRouterError as e:
+                delay = policy.next_delay(attempt, e, deadline - time.monotonic())
+                if delay is None:
+                    e.attempts = attempt
+                    raise
+                await _async_sleep(delay)
+    return text, Latency(int((time.perf_counter() - t0) * 1000), attempts=attempt,
+                         retry_ms=int((attempt_started - t0) * 1000) - queue_ms, queue_ms=queue_ms)
+
+
+async def chat_once_async(messages: List[Dict], *,
+                          model: str,
+                          temperature: float = 0.2,
+                          max_tokens: int = 400,
+                          timeout_s: int = 30,
+                          use_cache: bool = True,
+                          retry: RetryPolicy | None = None) -> Tuple[str, Latency]:
+    """Асинхронный chat_once для AsyncTeleBot: ждёт ответ, не занимая поток."""
+    headers, payload = _request_parts(messages, model, temperature, max_tokens)
+    key = cache_key(messages, model, temperature, max_tokens)
+    if use_cache:
+        hit = response_cache.get(key)
+        if hit is not None:
+            return hit
+    flight = _async_flights.get(key)
+    if flight is not None:
+        _single_flight.count(collapsed=True)
+        return await asyncio.shield(flight)
+    flight = _async_flights[key] = asyncio.get_running_loop().create_future()
+    _single_flight.count(collapsed=False)
+    try:
+        breaker = get_breaker(model)
+        if not breaker.allow():
+            raise CircuitOpenError(model)
+        ok, service_ms = None, None
+        try:
+            text, latency = await _post_with_retries_async(headers, payload, timeout_s, retry or DEFAULT_RETRY)
+            ok = True
+            service_ms = int(latency) - latency.queue_ms
+            model_latency(model).add(service_ms)
+        except OpenRouterError as e:
+            ok = _health(e)
+            raise
+        finally:
+            breaker.record(ok, service_ms)
+    except BaseException as e:
+        flight.set_exception(e if isinstance(e, OpenRouterError) else _aborted())
+        flight.exception()  # помечаем как прочитанное, если ведомых не было
+        raise
+    else:
+        if use_cache:
+            response_cache.put(key, text, latency)
+        flight.set_result((text, latency))
+        return text, latency
+    finally:
+        if _async_flights.get(key) is flight:
+            del _async_flights[key]
+
+
+async def chat_once_failover_async(messages: List[Dict], models: Sequence[str], *,
+                                   temperature: float = 0.2,
+                                   max_tokens: int = 400,
+                                   timeout_s: int = 30) -> Tuple[str, Latency, str]:
+    """chat_once_async по цепочке моделей; возвращает (текст, задержка, ключ ответившей модели)."""
+    last_error: OpenRouterError | None = None
+    for model in models:
+        try:
+            text, latency = await chat_once_async(messages, model=model, temperature=temperature,
+                                                  max_tokens=max_tokens, timeout_s=timeout_s)
+            return text, latency, model
+        except OpenRouterError as e:
+            if not (isinstance(e, CircuitOpenError) or _health(e) is False):
+                raise
+            last_error = e
+    raise last_error or OpenRouterError(503, _friendly(503))
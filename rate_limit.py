@@ -0,0 +1,183 @@
+"""
+rate_limit.py — ограничение частоты команд бота (token bucket на пользователя и класс команд).
+
+Состояние только в памяти: на пользователя в каждом классе хранится кортеж
+(токены, время последнего обращения, предупреждён ли). Ведро, к которому не
+обращались дольше периода, уже полное — его можно просто забыть, поэтому
+простаивающие ведра выбрасываются по ходу проверок. Проверка — O(1) амортизированно.
+
+Лимиты настраиваются переменными окружения RATE_LIMIT_<КЛАСС>=<запросов>/<секунд>,
+например RATE_LIMIT_LLM=5/60. RATE_LIMIT_CMD_<КОМАНДА> (например RATE_LIMIT_CMD_ASK_RANDOM=2/60)
+важнее лимита класса: у такой команды своё ведро, отдельное от остальных команд класса.
+Неразборчивое значение пишется в лог и пропускается — бот запускается с прежним лимитом.
+"""
+
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+log = logging.getLogger(__name__)
+
+# класс команды -> (сколько запросов, за сколько секунд)
+DEFAULT_LIMITS: dict[str, tuple[int, float]] = {
+    "llm": (5, 60.0),      # запросы к модели: дорогие и по времени, и по квоте OpenRouter
+    "heavy": (3, 60.0),    # выгрузки и статистика читают все заметки пользователя
+    "notes": (30, 60.0),   # обычная работа с заметками
+    "default": (30, 60.0),
+}
+
+COMMAND_CLASSES: dict[str, str] = {
+    "ask": "llm",
+    "ask_random": "llm",
+    "ask_model": "llm",
+    "note_export": "heavy",
+    "note_stats": "heavy",
+    "note_add": "notes",
+    "note_list": "notes",
+    "note_find": "notes",
+    "note_edit": "notes",
+    "note_del": "notes",
+    "note_count": "notes",
+}
+
+# сколько пользователей помним в одном классе, даже если все активны
+MAX_TRACKED_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", "100000"))
+
+
+class Verdict(NamedTuple):
+    allowed: bool
+    retry_after_s: float = 0.0
+    warn: bool = False  # первый отказ подряд — стоит ответить пользователю, дальше молчим
+
+
+class TokenBuckets:
+    """Token bucket на каждый ключ: capacity запросов, пополнение capacity за period_s."""
+
+    def __init__(self, capacity: int, period_s: float, max_keys: int = MAX_TRACKED_USERS,
+                 clock=time.monotonic):
+        self.capacity = float(capacity)
+        self.period_s = period_s
+        self.rate = capacity / period_s
+        self.max_keys = max_keys
+        self._clock = clock
+        self._lock = threading.Lock()
+        # ключ -> (токены, время обращения, предупреждён); порядок — от давних обращений к свежим
+        self._state: OrderedDict[int, tuple[float, float, bool]] = OrderedDict()
+
+    def take(self, key: int) -> Verdict:
+        now = self._clock()
+        with self._lock:
+            self._evict_idle(now)
+            state = self._state.pop(key, None)
+            if state is None:
+                tokens, warned = self.capacity, False
+            else:
+                tokens = min(self.capacity, state[0] + (now - state[1]) * self.rate)
+                warned = state[2]
+            if tokens >= 1.0:
+                self._state[key] = (tokens - 1.0, now, False)
+                return Verdict(True)
+            self._state[key] = (tokens, now, True)
+            # capacity=0 — команда отключена совсем
+            retry_after = (1.0 - tokens) / self.rate if self.rate else self.period_s
+            return Verdict(False, retry_after, not warned)
+
+    def delay(self, key: int) -> float:
+        """Через сколько секунд у ключа появится токен (0 — уже есть); ничего не списывает."""
+        now = self._clock()
+        with self._lock:
+            state = self._state.get(key)
+            tokens = self.capacity if state is None else min(self.capacity, state[0] + (now - state[1]) * self.rate)
+            if tokens >= 1.0:
+                return 0.0
+            return (1.0 - tokens) / self.rate if self.rate else self.period_s
+
+    def _evict_idle(self, now: float) -> None:
+        # спереди самые давние: выбрасываем, пока они успели наполниться (или пока нас слишком много)
+        while self._state:
+            key, state = next(iter(self._state.items()))
+            if now - state[1] < self.period_s and len(self._state) < self.max_keys:
+                break
+            self._state.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._state)
+
+
+_ENV_PREFIX = "RATE_LIMIT_"
+_COMMAND_ENV_PREFIX = "RATE_LIMIT_CMD_"
+
+
+def _parse_limit(key: str, raw: str) -> tuple[int, float] | None:
+    """"<запросов>/<секунд>" (секунды по умолчанию 60); None — значение не разобрать."""
+    count, _, period = raw.partition("/")
+    try:
+        limit = int(count), float(period or 60)
+    except ValueError:
+        limit = None
+    if limit is None or limit[0] < 0 or not limit[1] > 0:
+        log.warning("Ignoring %s=%r: expected <requests>/<seconds>", key, raw)
+        return None
+    return limit
+
+
+def _limits_from_env(limits: dict[str, tuple[int, float]]) -> dict[str, tuple[int, float]]:
+    result = dict(limits)
+    for name in limits:
+        key = f"{_ENV_PREFIX}{name.upper()}"
+        raw = os.getenv(key)
+        limit = _parse_limit(key, raw) if raw else None
+        if limit is not None:
+            result[name] = limit
+    return result
+
+
+def _command_limits_from_env() -> dict[str, tuple[int, float]]:
+    """RATE_LIMIT_CMD_<КОМАНДА>: команда -> (запросов, секунд)."""
+    result = {}
+    for key, raw in os.environ.items():
+        if key.startswith(_COMMAND_ENV_PREFIX) and raw:
+            limit = _parse_limit(key, raw)
+            if limit is not None:
+                result[key[len(_COMMAND_ENV_PREFIX):].lower()] = limit
+    return result
+
+
+class RateLimiter:
+    """
+    Набор TokenBuckets по классам команд; команды без класса идут в default.
+    Без явных limits лимиты берутся из окружения, и команда с RATE_LIMIT_CMD_<КОМАНДА>
+    получает собственный класс "/<команда>".
+    """
+
+    def __init__(self, limits: dict[str, tuple[int, float]] | None = None,
+                 classes: dict[str, str] | None = None, clock=time.monotonic):
+        classes = COMMAND_CLASSES if classes is None else classes
+        if limits is None:
+            limits = _limits_from_env(DEFAULT_LIMITS)
+            overrides = _command_limits_from_env()
+            if overrides:
+                classes = dict(classes)
+                for command, limit in overrides.items():
+                    limits[f"/{command}"] = limit
+                    classes[command] = f"/{command}"
+        self.classes = classes
+        self._buckets = {name: TokenBuckets(count, period, clock=clock) for name, (count, period) in limits.items()}
+
+    def check(self, user_id: int, command: str) -> Verdict:
+        name = self.classes.get(command, "default")
+        buckets = self._buckets.get(name)
+        if buckets is None:
+            buckets = self._buckets.get("default")
+        if buckets is None:
+            return Verdict(True)
+        return buckets.take(user_id)
+
+    def tracked(self) -> dict[str, int]:
+        """Сколько вёдер сейчас в памяти по каждому классу."""
+        return {name: len(buckets) for name, buckets in self._buckets.items()}
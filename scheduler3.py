@@ -0,0 +1,125 @@
+"""
+scheduler3.py — планировщик ежедневной рассылки гороскопа (для main3.py).
+
+У каждого подписчика в базе лежит next_fire_utc — ближайший момент рассылки: его час
+notify_hour по его часовому поясу tz плюс постоянный сдвиг внутри SCHEDULER_SPREAD_S
+(см. db3.next_fire_utc). Поэтому «кому пора» — это диапазон next_fire_utc <= сейчас
+по одному индексу, а нагрузка сама расходится по суткам и часовым поясам.
+
+Поток спит до ближайшего next_fire_utc (но не дольше MAX_SLEEP_S: пользователь мог
+поменять время), затем читает наступивших пачками с одного курсора, отправляет и
+переносит им next_fire_utc на следующие сутки — одной транзакцией на пачку. Простой
+догоняется сам: после него наступившими окажутся все пропущенные, и каждый получит
+одно сообщение за свою текущую дату. Повтор в пределах местного дня (например, после
+смены часа) отсекается по last_sent_date.
+
+next_fire_utc переносится при отправке, а не после доставки: сообщения, которые были
+в очереди при падении процесса, не повторятся — зато никто не получит два за день.
+По той же причине доставка со статусом failed (повторы очереди отправки исчерпаны)
+в тот же день не повторяется: такой пользователь пропускает день и получит рассылку завтра.
+"""
+
+from __future__ import annotations
+import logging
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Iterable
+
+import db3 as db
+
+log = logging.getLogger(__name__)
+
+MAX_SLEEP_S = 60.0  # перечитываем ближайший next_fire_utc хотя бы так часто: его могли сдвинуть /set_time и /set_tz
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class DailyScheduler:
+    """
+    send(user, for_date) отправляет (или ставит в очередь) гороскоп одному пользователю
+    за его местную дату; отметку о доставке ставит сам send (broadcast3.Broadcaster).
+    on_new_day(day) вызывается при смене даты сервера — например, прогреть тексты.
+    on_backlog(count) получает, сколько наступивших ещё не обработано в этом проходе
+    (Broadcaster.set_backlog — для ETA рассылки): в начале и после каждой пачки.
+    """
+
+    def __init__(self, send: Callable[[dict, date], None],
+                 iter_due: Callable[[int], Iterable[list[dict]]] = db.iter_due_users,
+                 reschedule: Callable[[list[tuple[int, int]]], None] = db.reschedule_users,
+                 next_fire_at: Callable[[], int | None] = db.next_fire_at,
+                 clock: Callable[[], datetime] = _utcnow,
+                 on_new_day: Callable[[date], None] | None = None,
+                 count_due: Callable[[int], int] = db.count_due_users,
+                 on_backlog: Callable[[int], None] | None = None):
+        self.send = send
+        self.iter_due = iter_due
+        self.reschedule = reschedule
+        self.next_fire_at = next_fire_at
+        self.on_new_day = on_new_day
+        self.count_due = count_due
+        self.on_backlog = on_backlog
+        self._clock = clock
+        self._day: date | None = None
+        self._stats = {"sent": 0, "errors": 0, "skipped": 0, "chunks": 0}
+
+    def run_pending(self, now: datetime | None = None) -> datetime:
+        """Отправляет всем, чей next_fire_utc наступил, и возвращает время следующего пробуждения (UTC)."""
+        now = now or self._clock()
+        today = now.astimezone().date()
+        if self._day != today:
+            self._day = today
+            if self.on_new_day is not None:
+                try:
+                    self.on_new_day(today)
+                except Exception as e:
+                    log.warning("New day preparation failed: %r", e)
+
+        now_ts = int(now.timestamp())
+        remaining = 0
+        if self.on_backlog is not None:
+            remaining = self.count_due(now_ts)
+            self.on_backlog(remaining)
+        for chunk in self.iter_due(now_ts):
+            updates = []
+            for user in chunk:
+                updates.append((db.next_fire_utc(user["user_id"], user["notify_hour"], user["tz"], now),
+                                user["user_id"]))
+                for_date = db.local_date(user["tz"], now)
+                if not user["sign"] or user["last_sent_date"] == for_date.isoformat():
+                    self._stats["skipped"] += 1
+                    continue
+                try:
+                    self.send(user, for_date)
+                    self._stats["sent"] += 1
+                except Exception as e:
+                    self._stats["errors"] += 1
+                    log.warning("Send failed to %s: %r", user["user_id"], e)
+            self.reschedule(updates)
+            self._stats["chunks"] += 1
+            if self.on_backlog is not None:
+                remaining = max(remaining - len(chunk), 0)
+                self.on_backlog(remaining)
+        if self.on_backlog is not None and remaining:
+            self.on_backlog(0)  # пока считали, часть наступивших успела смениться
+
+        wake = now + timedelta(seconds=MAX_SLEEP_S)
+        next_ts = self.next_fire_at()
+        if next_ts is not None:
+            wake = min(wake, datetime.fromtimestamp(next_ts, timezone.utc))
+        return wake
+
+    def run(self, stop: threading.Event) -> None:
+        log.info("Scheduler started")
+        while not stop.is_set():
+            try:
+                wake = self.run_pending()
+            except Exception as e:
+                log.exception("Scheduler error: %r", e)
+                wake = self._clock() + timedelta(seconds=MAX_SLEEP_S)
+            delay = (wake - self._clock()).total_seconds()
+            stop.wait(min(max(delay, 0.0), MAX_SLEEP_S))
+
+    def stats(self) -> dict:
+        return dict(self._stats)
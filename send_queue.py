@@ -0,0 +1,323 @@
+"""
+send_queue.py — общая очередь исходящих сообщений в Telegram с учётом его лимитов.
+
+Telegram отвечает 429, если бот шлёт больше ~30 сообщений в секунду всего,
+больше 1 в секунду в один чат или больше 20 в минуту в группу. SendQueue
+пропускает вызовы API через token bucket на каждую из этих областей, а 429 с
+retry_after ставит отправку на паузу и повторяет сообщение, а не теряет его.
+Временные сбои (5xx Telegram, обрыв соединения) повторяются с растущей паузой
+только для своего чата.
+
+Внутри чата сообщения уходят строго по порядку (в полёте не больше одного на чат),
+разные чаты отправляются параллельно пулом SEND_WORKERS потоков. submit не блокирует:
+возвращает Future с результатом вызова API.
+
+Настройка: SEND_GLOBAL_PER_S (30), SEND_CHAT_PER_S (1), SEND_GROUP_PER_MIN (20),
+SEND_WORKERS (8), SEND_MAX_RETRIES (5).
+"""
+
+from __future__ import annotations
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict
+
+import requests
+import telebot
+
+from rate_limit import TokenBuckets
+
+SEND_GLOBAL_PER_S = int(os.getenv("SEND_GLOBAL_PER_S", "30"))
+SEND_CHAT_PER_S = int(os.getenv("SEND_CHAT_PER_S", "1"))
+SEND_GROUP_PER_MIN = int(os.getenv("SEND_GROUP_PER_MIN", "20"))
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "8"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "5"))
+SEND_BACKOFF_MAX_S = 30.0
+
+_GLOBAL = 0  # ключ общего ведра
+
+
+def retry_after(error: Exception) -> float | None:
+    """retry_after из ответа 429 (ApiTelegramException); None — это не 429."""
+    if getattr(error, "error_code", None) != 429:
+        return None
+    params = (getattr(error, "result_json", None) or {}).get("parameters") or {}
+    return float(params.get("retry_after") or 1)
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Сбой на стороне Telegram или сети, после которого сообщение стоит повторить.
+    ReadTimeout сюда не входит: запрос мог дойти, и повтор дал бы дубль.
+    """
+    code = getattr(error, "error_code", None)
+    if code is None:
+        code = getattr(getattr(error, "result", None), "status_code", None)  # ApiHTTPException: не-JSON ответ
+    if isinstance(code, int):
+        return code >= 500
+    return isinstance(error, requests.exceptions.ConnectionError)
+
+
+def _is_group(chat_id) -> bool:
+    # у групп, супергрупп и каналов id отрицательный; "@username" считаем каналом
+    return not isinstance(chat_id, int) or chat_id < 0
+
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "future", "enqueued_at", "attempts", "counted")
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict, enqueued_at: float, counted: bool = True):
+        self.fn = fn
+        self.counted = counted  # False — не сообщение (chat action): бакеты не тратит, но ждёт паузу после 429
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.enqueued_at = enqueued_at
+        self.attempts = 0
+
+
+class SendQueue:
+    """
+    Диспетчер исходящих вызовов Telegram API. Группой считается чат с отрицательным id
+    (группы, супергруппы и каналы): для них дополнительно действует лимит в минуту.
+    """
+
+    def __init__(self, global_per_s: int = SEND_GLOBAL_PER_S, chat_per_s: int = SEND_CHAT_PER_S,
+                 group_per_min: int = SEND_GROUP_PER_MIN, workers: int = SEND_WORKERS,
+                 max_retries: int = SEND_MAX_RETRIES, clock=time.monotonic):
+        self._clock = clock
+        self.max_retries = max_retries
+        self._global = TokenBuckets(global_per_s, 1.0, clock=clock)
+        self._chat = TokenBuckets(chat_per_s, 1.0, clock=clock)
+        self._group = TokenBuckets(group_per_min, 60.0, clock=clock)
+        self._cond = threading.Condition()
+        self._chats: Dict[int, Deque[_Job]] = {}
+        self._ready: list[tuple[float, int, int]] = []  # (не раньше, порядок, chat_id) — чаты, готовые к отправке
+        self._in_flight: set[int] = set()
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._closed = False
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="send")
+        self._thread: threading.Thread | None = None
+        self._stats = {"enqueued": 0, "sent": 0, "failed": 0, "retried_429": 0, "retried_transient": 0,
+                       "lag_ms_total": 0, "lag_ms_max": 0}
+
+    def submit(self, chat_id: int, fn: Callable, *args, **kwargs) -> Future:
+        """Ставит вызов fn(*args, **kwargs) в очередь чата chat_id и сразу возвращает Future."""
+        return self._enqueue(chat_id, _Job(fn, args, kwargs, self._clock()))
+
+    def submit_action(self, chat_id: int, fn: Callable, *args, **kwargs) -> Future:
+        """Как submit, но для вызовов, которые не считаются сообщениями (send_chat_action)."""
+        return self._enqueue(chat_id, _Job(fn, args, kwargs, self._clock(), counted=False))
+
+    def _enqueue(self, chat_id: int, job: _Job) -> Future:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Очередь отправки закрыта")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, name="send-dispatcher", daemon=True)
+                self._thread.start()
+            self._stats["enqueued"] += 1
+            pending = self._chats.get(chat_id)
+            if pending is None:
+                pending = self._chats[chat_id] = deque()
+            pending.append(job)
+            if len(pending) == 1 and chat_id not in self._in_flight:
+                heapq.heappush(self._ready, (job.enqueued_at, next(self._seq), chat_id))
+                self._cond.notify()
+        return job.future
+
+    def _global_delay(self, now: float) -> float:
+        return max(self._paused_until - now, self._global.delay(_GLOBAL))
+
+    def _chat_delay(self, chat_id: int) -> float:
+        delay = self._chat.delay(chat_id)
+        if _is_group(chat_id):
+            delay = max(delay, self._group.delay(chat_id))
+        return delay
+
+    def _dispatch(self) -> None:
+        with self._cond:
+            while True:
+                if not self._ready:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                    continue
+                not_before, _, chat_id = self._ready[0]
+                now = self._clock()
+                if not_before > now:
+                    self._cond.wait(not_before - now)
+                    continue
+                counted = self._chats[chat_id][0].counted
+                # общий лимит и пауза после 429 — одни на всех: ждём их, не перебирая чаты
+                delay = self._global_delay(now) if counted else self._paused_until - now
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                # откладываем только чат, у которого пуст его собственный бакет
+                delay = self._chat_delay(chat_id) if counted else 0.0
+                if delay > 0:
+                    heapq.heapreplace(self._ready, (now + delay, next(self._seq), chat_id))
+                    continue
+                heapq.heappop(self._ready)
+                if counted:
+                    self._global.take(_GLOBAL)
+                    self._chat.take(chat_id)
+                    if _is_group(chat_id):
+                        self._group.take(chat_id)
+                job = self._chats[chat_id].popleft()
+                self._in_flight.add(chat_id)
+                self._pool.submit(self._send, chat_id, job)
+
+    def _send(self, chat_id: int, job: _Job) -> None:
+        started = self._clock()
+        job.attempts += 1
+        retry_s = backoff_s = result = error = None
+        try:
+            result = job.fn(*job.args, **job.kwargs)
+        except Exception as e:
+            last_error = e
+            retry_s = retry_after(e)
+            if job.attempts > self.max_retries:
+                retry_s, error = None, e
+            elif retry_s is None:
+                if is_transient(e):
+                    backoff_s = min(2.0 ** (job.attempts - 1), SEND_BACKOFF_MAX_S)
+                else:
+                    error = e
+
+        with self._cond:
+            self._in_flight.discard(chat_id)
+            pending = self._chats[chat_id]
+            not_before = self._clock()
+            if self._closed and (retry_s is not None or backoff_s is not None):
+                # очередь закрыта, пока шла попытка: пул уже остановлен, повторять некому
+                retry_s = backoff_s = None
+                error = last_error
+            if retry_s is not None:
+                # 429 — лимит общий для бота: ждём retry_after всем, сообщение идёт первым в своём чате
+                self._stats["retried_429"] += 1
+                self._paused_until = max(self._paused_until, not_before + retry_s)
+                not_before = self._paused_until
+                pending.appendleft(job)
+            elif backoff_s is not None:
+                # временный сбой — повторяем первым в чате через паузу, другие чаты не ждут
+                self._stats["retried_transient"] += 1
+                not_before += backoff_s
+                pending.appendleft(job)
+            else:
+                lag_ms = int((started - job.enqueued_at) * 1000)
+                self._stats["sent" if error is None else "failed"] += 1
+                self._stats["lag_ms_total"] += lag_ms
+                self._stats["lag_ms_max"] = max(self._stats["lag_ms_max"], lag_ms)
+            if pending:
+                heapq.heappush(self._ready, (not_before, next(self._seq), chat_id))
+            else:
+                del self._chats[chat_id]
+            self._cond.notify_all()
+        # Future — после обновления статистики, чтобы ожидающий видел её уже учтённой
+        if retry_s is None and backoff_s is None:
+            if error is None:
+                job.future.set_result(result)
+            else:
+                job.future.set_exception(error)
+
+    def join(self, timeout_s: float | None = None) -> bool:
+        """Ждёт, пока очередь опустеет; False — не дождались за timeout_s."""
+        deadline = None if timeout_s is None else self._clock() + timeout_s
+        with self._cond:
+            while self._chats:
+                remaining = None if deadline is None else deadline - self._clock()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, drain_timeout_s: float = 30.0) -> bool:
+        """Перестаёт принимать сообщения, отправляет уже поставленные и останавливает потоки."""
+        drained = self.join(drain_timeout_s)
+        with self._cond:
+            self._closed = True
+            self._ready.clear()
+            for jobs in self._chats.values():
+                for job in jobs:
+                    job.future.cancel()
+                jobs.clear()
+            self._cond.notify_all()
+        self._pool.shutdown(wait=drained)
+        return drained
+
+    def stats(self) -> dict:
+        """Сколько ждёт и в полёте, отправлено/ошибок/повторов (429 и временных сбоев) и задержка в очереди (lag)."""
+        now = self._clock()
+        with self._cond:
+            stats = dict(self._stats)
+            pending = [job for jobs in self._chats.values() for job in jobs]
+            stats["pending"] = len(pending)
+            stats["in_flight"] = len(self._in_flight)
+            stats["oldest_pending_ms"] = int((now - min(j.enqueued_at for j in pending)) * 1000) if pending else 0
+        done = stats["sent"] + stats["failed"]
+        stats["lag_ms_avg"] = stats.pop("lag_ms_total") // done if done else 0
+        return stats
+
+
+# методы TeleBot, которые шлют сообщение в чат (первый аргумент — chat_id): идут через SendQueue
+QUEUED_SEND_METHODS = (
+    "send_photo", "send_document", "send_audio", "send_video", "send_voice", "send_video_note",
+    "send_animation", "send_sticker", "send_media_group", "send_location", "send_venue",
+    "send_contact", "send_poll", "send_dice", "send_invoice", "send_game",
+    "forward_message", "copy_message",
+)
+
+
+class QueuedTeleBot(telebot.TeleBot):
+    """
+    TeleBot, у которого исходящие в чат вызовы идут через SendQueue: send_message (а значит,
+    и reply_to), edit_message_text, методы из QUEUED_SEND_METHODS и send_chat_action
+    (без траты лимита сообщений, но с паузой после 429 и по порядку в чате).
+    Обычные методы ждут результата и возвращают то же, что TeleBot;
+    send_message_nowait только ставит сообщение в очередь и возвращает Future.
+
+    answer_callback_query в очередь не идёт: это ответ на нажатие кнопки, а не сообщение
+    в чат, Telegram ждёт его в пределах нескольких секунд и в лимиты сообщений не считает.
+    """
+
+    def __init__(self, token: str, outbox: SendQueue | None = None, **kwargs):
+        super().__init__(token, **kwargs)
+        self.outbox = outbox or SendQueue()
+
+    def send_message_nowait(self, chat_id, text: str, **kwargs) -> Future:
+        return self.outbox.submit(chat_id, super().send_message, chat_id, text, **kwargs)
+
+    def send_message(self, chat_id, text: str, *args, **kwargs):
+        return self.outbox.submit(chat_id, super().send_message, chat_id, text, *args, **kwargs).result()
+
+    def edit_message_text(self, text: str, chat_id=None, message_id=None, *args, **kwargs):
+        # правка inline-сообщения (без chat_id) лимитируется как отдельный «чат» 0
+        key = chat_id if chat_id is not None else 0
+        return self.outbox.submit(key, super().edit_message_text, text, chat_id, message_id,
+                                  *args, **kwargs).result()
+
+    def send_chat_action(self, chat_id, action: str, *args, **kwargs):
+        return self.outbox.submit_action(chat_id, super().send_chat_action, chat_id, action,
+                                         *args, **kwargs).result()
+
+
+def _queued_send(name: str):
+    def method(self, chat_id, *args, **kwargs):
+        send = getattr(super(QueuedTeleBot, self), name)
+        return self.outbox.submit(chat_id, send, chat_id, *args, **kwargs).result()
+
+    method.__name__ = name
+    method.__doc__ = getattr(telebot.TeleBot, name).__doc__
+    return method
+
+
+for _name in QUEUED_SEND_METHODS:
+    if hasattr(telebot.TeleBot, _name):  # в старых версиях pyTelegramBotAPI части методов нет
+        setattr(QueuedTeleBot, _name, _queued_send(_name))
@@ -22,12 +22,41 @@ def main_module():
 
 @pytest.fixture
 def openrouter_module():
-    """Фикстура для модуля OpenRouter"""
+    """Фикстура для модуля OpenRouter (пустой кэш ответов, свежие предохранители и статистика задержек)"""
     import openrouter_client
-    return openrouter_client
+    openrouter_client.response_cache.clear()
+    openrouter_client._breakers.clear()
+    openrouter_client._latencies.clear()
+    yield openrouter_client
+    openrouter_client.response_cache.clear()
+    openrouter_client._breakers.clear()
+    openrouter_client._latencies.clear()
 
 
 @pytest.fixture
 def tmp_db_path(tmp_path):
     """Фикстура для временного пути к базе данных"""
-    return tmp_path / "test.db"
\ No newline at end of file
+    return tmp_path / "test.db"
+
+@pytest.fixture
+def fresh_db(db_module, tmp_db_path, monkeypatch):
+    """Фикстура для чистой временной базы данных"""
+    db = db_module
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_db_path))
+    db.init_db()
+    yield db
+    db.close_all()
+
+
+@pytest.fixture
+def fake_openrouter(openrouter_module, monkeypatch):
+    """Фикстура: локальная заглушка OpenRouter вместо openrouter.ai"""
+    from fake_openrouter import FakeOpenRouter
+
+    openrouter = openrouter_module
+    with FakeOpenRouter() as fake:
+        monkeypatch.setattr(openrouter, "OPENROUTER_API", fake.url)
+        monkeypatch.setattr(openrouter, "OPENROUTER_API_KEY", "test-api-key")
+        openrouter.close()
+        yield fake
+        openrouter.close()
@@ -0,0 +1,158 @@
+import threading
+from concurrent.futures import Future
+from datetime import date
+
+import pytest
+from telebot.apihelper import ApiTelegramException
+
+import db3
+from broadcast3 import Broadcaster, dead_letter_reason
+
+DAY = date(2026, 10, 18)
+
+
+def _api_error(code: int, description: str) -> ApiTelegramException:
+    return ApiTelegramException("sendMessage", None, {"ok": False, "error_code": code, "description": description})
+
+
+def _done(error: Exception | None = None) -> Future:
+    f = Future()
+    if error is None:
+        f.set_result("msg")
+    else:
+        f.set_exception(error)
+    return f
+
+
+@pytest.fixture
+def users_db(tmp_path, monkeypatch):
+    """Фикстура: база db3 с подписчиками 1..5"""
+    monkeypatch.setattr(db3, "DB_PATH", str(tmp_path / "zodiac.db"))
+    db3.init_db()
+    for uid in range(1, 6):
+        db3.ensure_user(uid)
+        db3.set_sign(uid, "рак")
+    return db3
+
+
+def test_dead_letter_reason():
+    """Тест: 403 и «chat not found» — окончательные ошибки, прочие — нет"""
+    assert dead_letter_reason(_api_error(403, "Forbidden: bot was blocked by the user"))
+    assert dead_letter_reason(_api_error(400, "Bad Request: chat not found"))
+    assert dead_letter_reason(_api_error(400, "Bad Request: can't parse entities")) is None
+    assert dead_letter_reason(_api_error(502, "Bad Gateway")) is None
+
+
+def test_only_delivered_users_are_marked_sent(users_db):
+    """Тест: отправка отмечается только при доставке; ошибки — статусы и dead letters"""
+    errors = {2: _api_error(403, "Forbidden: bot was blocked by the user"),
+              3: _api_error(400, "Bad Request: chat not found"),
+              4: _api_error(400, "Bad Request: can't parse entities")}
+    broadcaster = Broadcaster(lambda chat_id, text: _done(errors.get(chat_id)))
+
+    for uid in (1, 2, 3, 4):
+        broadcaster.submit(uid, "гороскоп", DAY)
+
+    db = users_db
+    assert [db.get_user(uid)["last_sent_date"] for uid in (1, 4, 5)] == [DAY.isoformat(), None, None]
+    assert db.count_deliveries(DAY.isoformat()) == {"sent": 1, "dead": 2, "failed": 1}
+    assert db.get_delivery(4, DAY.isoformat())["error_code"] == 400
+    assert db.get_user(2)["subscribed"] == 0
+    assert db.get_dead_letter(3)["reason"] == "Bad Request: chat not found"
+    assert broadcaster.stats()["dead"] == 2
+
+
+def test_resubscribe_clears_dead_letter(users_db):
+    """Тест: /subscribe после блокировки возвращает пользователя в рассылку"""
+    broadcaster = Broadcaster(lambda chat_id, text: _done(_api_error(403, "Forbidden: user is deactivated")))
+    broadcaster.submit(1, "гороскоп", DAY)
+    assert users_db.get_dead_letter(1) is not None
+
+    users_db.set_subscribed(1, True)
+    assert users_db.get_dead_letter(1) is None
+    assert users_db.get_user(1)["subscribed"] == 1
+
+
+def test_outcomes_are_recorded_in_batches():
+    """Тест: итоги пишутся пачкой — по размеру пачки или когда в полёте ничего не осталось"""
+    pending = [Future() for _ in range(5)]
+    calls = []
+    broadcaster = Broadcaster(lambda chat_id, text: pending[chat_id],
+                              record=lambda day, outcomes: calls.append([o[0] for o in outcomes]),
+                              record_batch=3)
+    for uid in range(5):
+        broadcaster.submit(uid, "гороскоп", DAY)
+
+    for f in pending:
+        f.set_result("msg")
+
+    assert calls == [[0, 1, 2], [3, 4]]
+    assert broadcaster.stats()["record_batches"] == 2
+
+
+def test_failed_record_is_kept_for_next_flush():
+    """Тест: если запись в базу не удалась, итоги не теряются и пишутся при следующем flush"""
+    calls = []
+
+    def record(day, outcomes):
+        calls.append(len(outcomes))
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+
+    broadcaster = Broadcaster(lambda chat_id, text: _done(), record=record)
+    broadcaster.submit(1, "гороскоп", DAY)
+    assert broadcaster.stats()["unrecorded"] == 1
+
+    broadcaster.flush()
+    assert calls == [1, 1]
+    assert broadcaster.stats()["unrecorded"] == 0
+
+
+def test_in_flight_is_bounded():
+    """Тест: submit ждёт, пока в полёте max_in_flight сообщений"""
+    pending = []
+    broadcaster = Broadcaster(lambda chat_id, text: pending.append(Future()) or pending[-1],
+                              record=lambda day, outcomes: None, max_in_flight=2)
+    broadcaster.submit(1, "a", DAY)
+    broadcaster.submit(2, "b", DAY)
+
+    third = threading.Thread(target=broadcaster.submit, args=(3, "c", DAY))
+    third.start()
+    third.join(0.2)
+    assert third.is_alive() and broadcaster.stats()["in_flight"] == 2
+
+    pending[0].set_result("msg")
+    third.join(2)
+    assert not third.is_alive()
+
+
+def test_progress_rate_and_eta():
+    """Тест: скорость — доставки в секунду с начала рассылки (не дольше минуты), ETA — по остатку"""
+    now = [100.0]
+    broadcaster = Broadcaster(lambda chat_id, text: _done(), record=lambda day, outcomes: None,
+                              clock=lambda: now[0])
+    broadcaster.submit(1, "a", DAY)
+    now[0] = 110.0
+    for uid in range(2, 21):
+        broadcaster.submit(uid, "a", DAY)
+
+    stats = broadcaster.stats(backlog=100)
+    assert stats["sent"] == 20
+    assert stats["sent_per_s"] == 2.0
+    assert stats["eta_s"] == 50
+
+
+def test_eta_counts_users_not_yet_submitted():
+    """Тест: ETA по умолчанию учитывает тех, кого планировщик ещё не передал в submit"""
+    now = [100.0]
+    broadcaster = Broadcaster(lambda chat_id, text: _done(), record=lambda day, outcomes: None,
+                              clock=lambda: now[0])
+    broadcaster.set_backlog(120)
+    broadcaster.submit(1, "a", DAY)
+    now[0] = 110.0
+    for uid in range(2, 21):
+        broadcaster.submit(uid, "a", DAY)
+
+    stats = broadcaster.stats()
+    assert stats["backlog"] == 100
+    assert stats["eta_s"] == 50
@@ -0,0 +1,89 @@
+def _trace(db):
+    statements = []
+    with db._connect() as conn:
+        conn.set_trace_callback(statements.append)
+    return statements
+
+
+def _untrace(db):
+    with db._connect() as conn:
+        conn.set_trace_callback(None)
+
+
+def test_build_messages_cache_hit_does_no_queries(main_module, fresh_db):
+    """Тест: на попадании в кэш build_messages не выполняет SQL-запросов"""
+    db = fresh_db
+    main = main_module
+    uid = 43001
+    db.set_user_character(uid, 2)
+    main.build_messages(uid, "прогрев")
+
+    statements = _trace(db)
+    try:
+        msgs = main.build_messages(uid, "Что такое API?")
+    finally:
+        _untrace(db)
+
+    assert [s for s in statements if s.strip().upper() != "PRAGMA DATA_VERSION"] == []
+    assert "Дарт Вейдер" in msgs[0]['content']
+
+
+def test_system_message_is_prebuilt_once(main_module, fresh_db):
+    """Тест: текст system-сообщения строится один раз, а сам словарь у каждого вызова свой"""
+    main = main_module
+    uid = 43002
+
+    first = main.build_messages(uid, "вопрос 1")
+    first[0]['content'] += "\nДоп. правило"
+    second = main.build_messages(uid, "вопрос 2")
+
+    assert first[0] is not second[0]
+    assert "Доп. правило" not in second[0]['content']
+    assert second[0]['content'] is main.build_messages(uid, "вопрос 3")[0]['content']
+    assert second[1]['content'] == "вопрос 2"
+
+
+def test_set_user_character_updates_cached_mapping(main_module, fresh_db):
+    """Тест: смена персонажа сразу видна в build_messages"""
+    db = fresh_db
+    main = main_module
+    uid = 43003
+
+    db.set_user_character(uid, 3)
+    assert "Мистер Спок" in main.build_messages(uid, "?")[0]['content']
+
+    db.set_user_character(uid, 5)
+    assert "Шерлок Холмс" in main.build_messages(uid, "?")[0]['content']
+
+
+def test_user_character_lru_is_bounded(fresh_db, monkeypatch):
+    """Тест: LRU пользователь -> персонаж ограничен по размеру"""
+    db = fresh_db
+    monkeypatch.setattr(db._user_characters, "max_size", 3)
+
+    for uid in range(10):
+        db.get_user_character(uid)
+    db.get_user_character(7)
+    db.get_user_character(100)
+
+    assert list(db._user_characters._items) == [9, 7, 100]
+
+
+def test_stale_read_does_not_overwrite_new_choice(fresh_db, monkeypatch):
+    """Тест: прочитанное из базы до смены персонажа не затирает в кэше новый выбор"""
+    db = fresh_db
+    uid = 43004
+    db.set_user_character(uid, 3)
+    db._user_characters.clear()
+    cache = db._user_characters
+    put_loaded = cache.put_loaded
+
+    def switch_then_put(user_id, character_id, generation):
+        # читатель уже достал 3 из базы, а пользователь тем временем выбрал 5
+        db.set_user_character(uid, 5)
+        put_loaded(user_id, character_id, generation)
+
+    monkeypatch.setattr(cache, "put_loaded", switch_then_put)
+    assert db.get_user_character(uid)["name"] == "Мистер Спок"
+
+    assert cache.get(uid) == 5
@@ -0,0 +1,157 @@
+import threading
+import time
+
+import pytest
+from unittest.mock import patch
+from telebot import types
+
+from chat_dispatch import ChatLanes, chat_key
+
+
+def _update(update_id: int, chat_id: int, text: str = "/note_list") -> types.Update:
+    return types.Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "u"},
+            "text": text,
+        },
+    })
+
+
+@pytest.fixture
+def make_lanes():
+    """Фикстура: ChatLanes, которые останавливаются после теста"""
+    created = []
+
+    def make(process, **kwargs):
+        lanes = ChatLanes(process, **kwargs)
+        created.append(lanes)
+        return lanes
+
+    yield make
+    for lanes in created:
+        lanes.stop(drain_timeout_s=5)
+
+
+def test_chat_key_for_callback_uses_message_chat():
+    """Тест: нажатие кнопки попадает в полосу чата, где она нарисована"""
+    update = types.Update.de_json({
+        "update_id": 5,
+        "callback_query": {
+            "id": "1", "chat_instance": "x", "data": "notes:1",
+            "from": {"id": 7, "is_bot": False, "first_name": "u"},
+            "message": {"message_id": 1, "date": 0, "chat": {"id": -100500, "type": "group"}},
+        },
+    })
+
+    assert chat_key(update) == -100500
+    assert chat_key(_update(1, 42)) == 42
+
+
+def test_same_chat_is_processed_in_order(make_lanes):
+    """Тест: обновления одного чата выполняются строго по порядку, даже если первое медленное"""
+    seen = []
+    done = threading.Event()
+
+    def process(updates):
+        update = updates[0]
+        if update.update_id == 1:
+            time.sleep(0.2)  # медленный /note_add
+        seen.append(update.update_id)
+        if len(seen) == 3:
+            done.set()
+
+    lanes = make_lanes(process, lanes=4)
+    for i in (1, 2, 3):
+        lanes.submit(_update(i, chat_id=100))
+
+    assert done.wait(5)
+    assert seen == [1, 2, 3]
+
+
+def test_different_chats_run_in_parallel(make_lanes):
+    """Тест: медленный чат не задерживает остальные"""
+    release = threading.Event()
+    fast_done = threading.Event()
+
+    def process(updates):
+        if updates[0].message.chat.id == 0:
+            release.wait(5)
+        else:
+            fast_done.set()
+
+    lanes = make_lanes(process, lanes=2)
+    lanes.submit(_update(1, chat_id=0))
+    lanes.submit(_update(2, chat_id=1))
+
+    assert fast_done.wait(2)
+    release.set()
+
+
+def test_full_lane_applies_backpressure(make_lanes):
+    """Тест: переполненная полоса заставляет ждать, по таймауту — отказ"""
+    release = threading.Event()
+    started = threading.Event()
+
+    def process(updates):
+        started.set()
+        release.wait(5)
+
+    lanes = make_lanes(process, lanes=1, depth=1)
+    assert lanes.submit(_update(1, chat_id=1))
+    assert started.wait(2)
+    assert lanes.submit(_update(2, chat_id=1), timeout_s=0.5)
+
+    t0 = time.monotonic()
+    assert not lanes.submit(_update(3, chat_id=1), timeout_s=0.2)
+    assert time.monotonic() - t0 >= 0.2
+    release.set()
+
+    assert lanes.stop(drain_timeout_s=5)
+    stats = lanes.stats()
+    assert stats["rejected"] == 1
+    assert stats["processed"] == 2
+    assert stats["lanes"][0]["max_depth"] == 1
+
+
+def test_stats_track_wait_and_handler_time(make_lanes):
+    """Тест: метрики показывают время в очереди и время обработчика"""
+    lanes = make_lanes(lambda updates: time.sleep(0.1), lanes=1)
+    lanes.submit(_update(1, chat_id=1))
+    lanes.submit(_update(2, chat_id=1))
+
+    assert lanes.stop(drain_timeout_s=5)
+    stats = lanes.stats()
+    assert stats["processed"] == 2 and stats["depth"] == 0
+    assert stats["handler_ms_max"] >= 100
+    assert stats["wait_ms_max"] >= 90  # второе ждало, пока отработает первое
+
+
+def test_handler_errors_are_counted(make_lanes):
+    """Тест: исключение в обработчике не останавливает полосу"""
+    def process(updates):
+        if updates[0].update_id == 1:
+            raise RuntimeError("сбой")
+
+    lanes = make_lanes(process, lanes=1)
+    lanes.submit(_update(1, chat_id=1))
+    lanes.submit(_update(2, chat_id=1))
+
+    assert lanes.stop(drain_timeout_s=5)
+    assert lanes.stats()["lanes"][0]["errors"] == 1
+    assert lanes.stats()["processed"] == 2
+
+
+def test_bot_routes_updates_through_lanes(main_module):
+    """Тест: main.bot отдаёт обновления в полосы и сразу сдвигает offset для polling"""
+    main = main_module
+    updates = [_update(10**9 + 1, 1), _update(10**9 + 2, 2)]
+
+    with patch.object(main.bot, "lanes") as lanes, patch.object(main.bot, "last_update_id", 0):
+        main.bot.process_new_updates(updates)
+
+        lanes.submit_all.assert_called_once_with(updates)
+        assert main.bot.last_update_id == 10**9 + 2
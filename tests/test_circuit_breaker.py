@@ -0,0 +1,155 @@
+import pytest
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def no_sleep(openrouter_module, monkeypatch):
+    """Фикстура: паузы между повторами не ждём"""
+    monkeypatch.setattr(openrouter_module, "_sleep", lambda s: None)
+
+
+def test_opens_on_error_rate_and_recovers(openrouter_module):
+    """Тест: closed → open по доле ошибок → half_open после паузы → closed после удачной пробы"""
+    openrouter = openrouter_module
+    clock = FakeClock()
+    breaker = openrouter.CircuitBreaker(window=10, min_calls=4, failure_ratio=0.5, open_s=30, clock=clock)
+
+    for ok in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(ok)
+    assert breaker.state == breaker.OPEN
+    assert not breaker.allow()
+
+    clock.now = 31
+    assert breaker.state == breaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # вторая проба не пропускается, пока первая не вернулась
+    breaker.record(True, 100)
+    assert breaker.state == breaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens(openrouter_module):
+    """Тест: неудачная проба снова размыкает цепь на open_s"""
+    openrouter = openrouter_module
+    clock = FakeClock()
+    breaker = openrouter.CircuitBreaker(min_calls=1, open_s=10, clock=clock)
+    breaker.record(False)
+
+    clock.now = 11
+    assert breaker.allow()
+    breaker.record(False)
+
+    assert breaker.state == breaker.OPEN
+    clock.now = 15
+    assert not breaker.allow()
+
+
+def test_slow_calls_count_as_failures(openrouter_module):
+    """Тест: ответы дольше slow_ms размыкают цепь так же, как ошибки"""
+    openrouter = openrouter_module
+    breaker = openrouter.CircuitBreaker(min_calls=3, slow_ms=1000, clock=FakeClock())
+
+    for _ in range(3):
+        breaker.record(True, 5000)
+
+    assert breaker.state == breaker.OPEN
+
+
+def test_neutral_outcome_releases_probe(openrouter_module):
+    """Тест: брошенная проба (ok=None) не блокирует half_open навсегда"""
+    openrouter = openrouter_module
+    clock = FakeClock()
+    breaker = openrouter.CircuitBreaker(min_calls=1, open_s=1, clock=clock)
+    breaker.record(False)
+    clock.now = 2
+
+    assert breaker.allow()
+    breaker.record(None)
+    assert breaker.allow()
+
+
+def test_open_breaker_fails_fast(openrouter_module, fake_openrouter, no_sleep):
+    """Тест: при разомкнутом предохранителе запрос к модели не отправляется"""
+    openrouter = openrouter_module
+    fake_openrouter.statuses = [502] * 20
+    policy = openrouter.RetryPolicy(max_attempts=1)
+
+    for i in range(5):
+        with pytest.raises(openrouter.OpenRouterError):
+            openrouter.chat_once([{"role": "user", "content": f"q{i}"}], model="flaky", retry=policy)
+    sent = len(fake_openrouter.requests)
+
+    with pytest.raises(openrouter.CircuitOpenError):
+        openrouter.chat_once([{"role": "user", "content": "ещё"}], model="flaky")
+
+    assert len(fake_openrouter.requests) == sent
+    assert openrouter.breaker_states()["flaky"]["state"] == "open"
+
+
+def test_auth_errors_do_not_trip_breaker(openrouter_module, fake_openrouter):
+    """Тест: 401 — проблема ключа, а не модели"""
+    openrouter = openrouter_module
+    fake_openrouter.statuses = [401] * 10
+
+    for i in range(10):
+        with pytest.raises(openrouter.OpenRouterError):
+            openrouter.chat_once([{"role": "user", "content": f"q{i}"}], model="m")
+
+    assert openrouter.get_breaker("m").state == "closed"
+
+
+def test_failover_to_next_model(openrouter_module, fake_openrouter, no_sleep):
+    """Тест: основная модель упала до первого куска — отвечает следующая"""
+    openrouter = openrouter_module
+    fake_openrouter.statuses = [503, 503, 503]  # все попытки первой модели
+
+    stream = openrouter.chat_stream_failover([{"role": "user", "content": "вопрос"}], ["main", "backup"])
+    text = "".join(stream)
+
+    assert text == "Ответ модели backup: вопрос"
+    assert stream.model == "backup"
+    assert stream.failed == ["main"]
+    assert [r["model"] for r in fake_openrouter.requests] == ["main"] * 3 + ["backup"]
+
+
+def test_failover_skips_open_breaker_immediately(openrouter_module, fake_openrouter):
+    """Тест: модель с разомкнутым предохранителем пропускается без запроса"""
+    openrouter = openrouter_module
+    openrouter.get_breaker("main")._trip()
+
+    stream = openrouter.chat_stream_failover([{"role": "user", "content": "вопрос"}], ["main", "backup"])
+    "".join(stream)
+
+    assert stream.model == "backup"
+    assert [r["model"] for r in fake_openrouter.requests] == ["backup"]
+
+
+def test_failover_does_not_mask_auth_error(openrouter_module, fake_openrouter):
+    """Тест: 401 не лечится сменой модели — ошибка отдаётся сразу"""
+    openrouter = openrouter_module
+    fake_openrouter.statuses = [401]
+
+    with pytest.raises(openrouter.OpenRouterError) as exc_info:
+        list(openrouter.chat_stream_failover([{"role": "user", "content": "?"}], ["main", "backup"]))
+
+    assert exc_info.value.status == 401
+    assert len(fake_openrouter.requests) == 1
+
+
+def test_all_models_down_raises_last_error(openrouter_module, fake_openrouter):
+    """Тест: если вся цепочка недоступна, пользователь получает ошибку"""
+    openrouter = openrouter_module
+    openrouter.get_breaker("a")._trip()
+    openrouter.get_breaker("b")._trip()
+
+    with pytest.raises(openrouter.CircuitOpenError):
+        list(openrouter.chat_stream_failover([{"role": "user", "content": "?"}], ["a", "b"]))
+    assert fake_openrouter.requests == []
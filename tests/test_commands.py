@@ -15,16 +15,14 @@ class TestNoteEdit:
         self.message.from_user.id = self.user_id
         self.message.chat.id = self.chat_id
 
-    @patch('main.update_note')
-    @patch('main.list_notes')
+    @patch('main.update_note_counted')
     @patch('main.bot.reply_to')
-    def test_note_edit_success(self, mock_reply, mock_list_notes, mock_update_note, main_module):
+    def test_note_edit_success(self, mock_reply, mock_update_note, main_module):
         """Тест успешного редактирования заметки"""
         main = main_module
 
         # Настраиваем моки
-        mock_update_note.return_value = True
-        mock_list_notes.return_value = [{'id': 1, 'text': 'Старый текст'}]
+        mock_update_note.return_value = 1
 
         # Устанавливаем текст сообщения
         self.message.text = "/note_edit 1 Новый текст заметки"
@@ -74,14 +72,14 @@ class TestNoteEdit:
             "Ошибка: ID должен быть числом."
         )
 
-    @patch('main.update_note')
+    @patch('main.update_note_counted')
     @patch('main.bot.reply_to')
     def test_note_edit_note_not_found(self, mock_reply, mock_update_note, main_module):
         """Тест редактирования несуществующей заметки"""
         main = main_module
 
         # Настраиваем моки
-        mock_update_note.return_value = False
+        mock_update_note.return_value = None
 
         # Устанавливаем текст сообщения
         self.message.text = "/note_edit 999 Новый текст"
@@ -110,16 +108,14 @@ class TestNoteDel:
         self.message.from_user.id = self.user_id
         self.message.chat.id = self.chat_id
 
-    @patch('main.delete_note')
-    @patch('main.list_notes')
+    @patch('main.delete_note_counted')
     @patch('main.bot.reply_to')
-    def test_note_del_success(self, mock_reply, mock_list_notes, mock_delete_note, main_module):
+    def test_note_del_success(self, mock_reply, mock_delete_note, main_module):
         """Тест успешного удаления заметки"""
         main = main_module
 
         # Настраиваем моки
-        mock_delete_note.return_value = True
-        mock_list_notes.return_value = [{'id': 2, 'text': 'Текст заметки'}]
+        mock_delete_note.return_value = 1
 
         # Устанавливаем текст сообщения
         self.message.text = "/note_del 1"
@@ -169,14 +165,14 @@ class TestNoteDel:
             "Ошибка: ID должен быть числом."
         )
 
-    @patch('main.delete_note')
+    @patch('main.delete_note_counted')
     @patch('main.bot.reply_to')
     def test_note_del_note_not_found(self, mock_reply, mock_delete_note, main_module):
         """Тест удаления несуществующей заметки"""
         main = main_module
 
         # Настраиваем моки
-        mock_delete_note.return_value = False
+        mock_delete_note.return_value = None
 
         # Устанавливаем текст сообщения
         self.message.text = "/note_del 999"
@@ -205,14 +201,14 @@ class TestNoteCount:
         self.message.from_user.id = self.user_id
         self.message.chat.id = self.chat_id
 
-    @patch('main.list_notes')
+    @patch('main.count_notes')
     @patch('main.bot.reply_to')
-    def test_note_count_empty(self, mock_reply, mock_list_notes, main_module):
+    def test_note_count_empty(self, mock_reply, mock_count_notes, main_module):
         """Тест подсчета пустого списка заметок"""
         main = main_module
 
         # Настраиваем моки
-        mock_list_notes.return_value = []
+        mock_count_notes.return_value = 0
 
         # Устанавливаем текст сообщения
         self.message.text = "/note_count"
@@ -221,7 +217,7 @@ class TestNoteCount:
         main.note_count(self.message)
 
         # Проверяем вызовы
-        mock_list_notes.assert_called_once_with(self.user_id)
+        mock_count_notes.assert_called_once_with(self.user_id)
         mock_reply.assert_called_once_with(
             self.message,
             "📊 Статистика заметок:\n"
@@ -231,14 +227,14 @@ class TestNoteCount:
             "✅ Есть свободное место"
         )
 
-    @patch('main.list_notes')
+    @patch('main.count_notes')
     @patch('main.bot.reply_to')
-    def test_note_count_half_full(self, mock_reply, mock_list_notes, main_module):
+    def test_note_count_half_full(self, mock_reply, mock_count_notes, main_module):
         """Тест подсчета при заполнении половины лимита"""
         main = main_module
 
         # Настраиваем моки (25 заметок)
-        mock_list_notes.return_value = [Mock() for _ in range(25)]
+        mock_count_notes.return_value = 25
 
         # Устанавливаем текст сообщения
         self.message.text = "/note_count"
@@ -256,14 +252,14 @@ class TestNoteCount:
             "✅ Есть свободное место"
         )
 
-    @patch('main.list_notes')
+    @patch('main.count_notes')
     @patch('main.bot.reply_to')
-    def test_note_count_near_limit(self, mock_reply, mock_list_notes, main_module):
+    def test_note_count_near_limit(self, mock_reply, mock_count_notes, main_module):
         """Тест подсчета при приближении к лимиту (80%)"""
         main = main_module
 
         # Настраиваем моки (40 заметок - 80% от лимита)
-        mock_list_notes.return_value = [Mock() for _ in range(40)]
+        mock_count_notes.return_value = 40
 
         # Устанавливаем текст сообщения
         self.message.text = "/note_count"
@@ -281,14 +277,14 @@ class TestNoteCount:
             "⚠️ Лимит почти достигнут!"
         )
 
-    @patch('main.list_notes')
+    @patch('main.count_notes')
     @patch('main.bot.reply_to')
-    def test_note_count_limit_reached(self, mock_reply, mock_list_notes, main_module):
+    def test_note_count_limit_reached(self, mock_reply, mock_count_notes, main_module):
         """Тест подсчета при достижении лимита"""
         main = main_module
 
         # Настраиваем моки (50 заметок - лимит)
-        mock_list_notes.return_value = [Mock() for _ in range(50)]
+        mock_count_notes.return_value = 50
 
         # Устанавливаем текст сообщения
         self.message.text = "/note_count"
@@ -399,4 +395,219 @@ class TestModels:
         # Проверяем форматирование
         lines = response_text.split('\n')
         assert len(lines) >= 3  # Заголовок + модель + инструкция
-        assert any('*' in line for line in lines)  # Должна быть активная модель с *
\ No newline at end of file
+        assert any('*' in line for line in lines)  # Должна быть активная модель с *
+
+class TestNoteList:
+    """Тесты для команды /note_list и листания страниц"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.user_id = 12345
+        self.chat_id = 67890
+
+        # Создаем mock-объект сообщения
+        self.message = Mock()
+        self.message.from_user.id = self.user_id
+        self.message.chat.id = self.chat_id
+
+    @patch('main.list_notes_page')
+    @patch('main.bot.reply_to')
+    def test_note_list_empty(self, mock_reply, mock_page, main_module):
+        """Тест пустого списка заметок"""
+        main = main_module
+
+        mock_page.return_value = ([], False)
+        self.message.text = "/note_list"
+
+        main.note_list(self.message)
+
+        mock_reply.assert_called_once_with(self.message, "Заметок пока нет.")
+
+    @patch('main.count_notes')
+    @patch('main.list_notes_page')
+    @patch('main.bot.reply_to')
+    def test_note_list_first_page_has_next_button(self, mock_reply, mock_page, mock_count, main_module):
+        """Тест первой страницы: есть только кнопка «Старше»"""
+        main = main_module
+
+        mock_page.return_value = ([{'id': 12, 'text': 'Новая'}, {'id': 11, 'text': 'Старая'}], True)
+        mock_count.return_value = 15
+        self.message.text = "/note_list"
+
+        main.note_list(self.message)
+
+        text = mock_reply.call_args[0][1]
+        kb = mock_reply.call_args[1]['reply_markup']
+        assert "📝 Ваши заметки (15/50):" in text
+        assert "12: Новая" in text
+        buttons = kb.keyboard[0]
+        assert [b.callback_data for b in buttons] == [f"notes:{self.user_id}:b:11"]
+
+    @patch('main.count_notes')
+    @patch('main.list_notes_page')
+    @patch('main.bot.answer_callback_query')
+    @patch('main.bot.edit_message_text')
+    def test_note_list_page_edits_message(self, mock_edit, mock_answer, mock_page, mock_count, main_module):
+        """Тест перехода на следующую страницу: сообщение редактируется"""
+        main = main_module
+
+        mock_page.return_value = ([{'id': 10, 'text': 'Ещё старее'}], False)
+        mock_count.return_value = 11
+        call = Mock()
+        call.data = f"notes:{self.user_id}:b:11"
+        call.from_user.id = self.user_id
+
+        main.note_list_page(call)
+
+        mock_page.assert_called_once_with(self.user_id, before_id=11, after_id=None, page_size=10)
+        args, kwargs = mock_edit.call_args
+        assert "10: Ещё старее" in args[0]
+        assert [b.callback_data for b in kwargs['reply_markup'].keyboard[0]] == [f"notes:{self.user_id}:a:10"]
+        mock_answer.assert_called_once_with(call.id)
+
+    @patch('main.list_notes_page')
+    @patch('main.bot.answer_callback_query')
+    def test_note_list_page_rejects_other_user(self, mock_answer, mock_page, main_module):
+        """Тест, что чужой список листать нельзя"""
+        main = main_module
+
+        call = Mock()
+        call.data = f"notes:{self.user_id}:b:11"
+        call.from_user.id = 999
+
+        main.note_list_page(call)
+
+        mock_page.assert_not_called()
+        mock_answer.assert_called_once_with(call.id, "Это не ваш список заметок.")
+
+
+class TestStreamAnswer:
+    """Тесты потоковой отправки ответа LLM"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.message = Mock()
+        self.message.from_user.id = 12345
+        self.message.chat.id = 67890
+        self.message.chat.type = "private"
+
+    def _stream(self, deltas, latency=120, model="m", hedged=False):
+        stream = Mock()
+        stream.__iter__ = Mock(return_value=iter(deltas))
+        stream.latency = latency
+        stream.model = model
+        stream.hedged = hedged
+        return stream
+
+    @patch('main.time.monotonic')
+    @patch('main.chat_stream_failover')
+    @patch('main.bot.edit_message_text')
+    @patch('main.bot.reply_to')
+    def test_edits_are_throttled(self, mock_reply, mock_edit, mock_stream, mock_clock, main_module):
+        """Тест: промежуточные правки не чаще интервала, в конце — полный ответ"""
+        main = main_module
+
+        mock_reply.return_value.chat.id = 1
+        mock_reply.return_value.message_id = 2
+        mock_stream.return_value = self._stream(["Раз", " два", " три", " четыре"])
+        # старт, затем время перед каждым куском
+        mock_clock.side_effect = [0.0, 0.5, 1.6, 2.0, 3.2]
+
+        main.stream_answer(self.message, [], ["m"])
+
+        mock_reply.assert_called_once_with(self.message, "⏳ Думаю…")
+        texts = [c[0][0] for c in mock_edit.call_args_list]
+        assert texts == [
+            "Раз два ▌",
+            "Раз два три четыре ▌",
+            "Раз два три четыре\n\n(120 мс; модель: m)",
+        ]
+
+    @patch('main.chat_stream_failover')
+    @patch('main.bot.edit_message_text')
+    @patch('main.bot.reply_to')
+    def test_cached_answer_is_marked(self, mock_reply, mock_edit, mock_stream, main_module):
+        """Тест: ответ из кэша помечается, показывается исходная задержка"""
+        main = main_module
+        from openrouter_client import Latency
+
+        mock_stream.return_value = self._stream(["Готовый ответ"], latency=Latency(850, cached=True))
+
+        main.stream_answer(self.message, [], ["m"])
+
+        assert mock_edit.call_args[0][0] == "Готовый ответ\n\n(из кэша, исходно 850 мс; модель: m)"
+
+    @patch('main.chat_stream_failover')
+    @patch('main.bot.edit_message_text')
+    @patch('main.bot.reply_to')
+    def test_error_replaces_placeholder(self, mock_reply, mock_edit, mock_stream, main_module):
+        """Тест: ошибка OpenRouter показывается в той же заглушке"""
+        main = main_module
+
+        mock_reply.return_value.chat.id = 1
+        mock_reply.return_value.message_id = 2
+        mock_stream.side_effect = main.OpenRouterError(429, "Превышены лимиты")
+
+        main.stream_answer(self.message, [], ["m"])
+
+        mock_edit.assert_called_once_with("Ошибка: [429] Превышены лимиты", 1, 2)
+
+    @patch('main.chat_stream_failover')
+    @patch('main.bot.edit_message_text')
+    @patch('main.bot.reply_to')
+    def test_fallback_model_is_named(self, mock_reply, mock_edit, mock_stream, main_module):
+        """Тест: если ответила запасная модель, в ответе видно какая и вместо чего"""
+        main = main_module
+
+        mock_stream.return_value = self._stream(["Ответ"], model="backup")
+
+        main.stream_answer(self.message, [], ["primary", "backup"], "как: Тьютор")
+
+        mock_stream.assert_called_once_with([], ["primary", "backup"], temperature=0.2, max_tokens=400,
+                                            priority=main.PRIORITY_HIGH)
+        assert mock_edit.call_args[0][0] == \
+            "Ответ\n\n(120 мс; модель: backup (вместо недоступной primary); как: Тьютор)"
+
+    @patch('main.chat_stream_failover')
+    @patch('main.bot.edit_message_text')
+    @patch('main.bot.reply_to')
+    def test_hedged_model_is_named(self, mock_reply, mock_edit, mock_stream, main_module):
+        """Тест: если дубль обогнал основную модель, так и пишем"""
+        main = main_module
+
+        mock_stream.return_value = self._stream(["Ответ"], model="fast", hedged=True)
+
+        main.stream_answer(self.message, [], ["slow", "fast"])
+
+        assert mock_edit.call_args[0][0] == "Ответ\n\n(120 мс; модель: fast (быстрее slow))"
+
+    @patch('main.chat_stream_failover')
+    @patch('main.bot.edit_message_text')
+    @patch('main.bot.reply_to')
+    def test_busy_queue_answers_busy(self, mock_reply, mock_edit, mock_stream, main_module):
+        """Тест: переполненная очередь к LLM — вежливый отказ вместо ошибки"""
+        main = main_module
+
+        mock_reply.return_value.chat.id = 1
+        mock_reply.return_value.message_id = 2
+        mock_stream.side_effect = main.QueueFullError()
+
+        main.stream_answer(self.message, [], ["m"], priority=main.PRIORITY_LOW)
+
+        assert mock_stream.call_args[1]["priority"] == main.PRIORITY_LOW
+        mock_edit.assert_called_once_with(
+            "⏳ Бот сейчас занят другими вопросами к модели. Попробуйте через минуту.", 1, 2)
+
+    @patch('main.chat_stream_failover')
+    @patch('main.bot.edit_message_text')
+    @patch('main.bot.reply_to')
+    def test_queue_wait_is_shown(self, mock_reply, mock_edit, mock_stream, main_module):
+        """Тест: время ожидания в очереди входит в показанную задержку"""
+        main = main_module
+        from openrouter_client import Latency
+
+        mock_stream.return_value = self._stream(["Ответ"], latency=Latency(1500, queue_ms=400))
+
+        main.stream_answer(self.message, [], ["m"])
+
+        assert mock_edit.call_args[0][0] == "Ответ\n\n(1500 мс, в очереди 400 мс; модель: m)"
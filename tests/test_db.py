@@ -278,4 +278,118 @@ def test_model_uniqueness(db_module):
 
     # Проверяем, что все ключи уникальны
     keys = [model['key'] for model in models]
-    assert len(keys) == len(set(keys)), "Все ключи моделей должны быть уникальными"
\ No newline at end of file
+    assert len(keys) == len(set(keys)), "Все ключи моделей должны быть уникальными"
+
+def test_count_notes_follows_add_and_delete(fresh_db):
+    """Тест счётчика заметок: поддерживается триггерами"""
+    db = fresh_db
+    uid = 321
+
+    assert db.count_notes(uid) == 0
+    first = db.add_note(uid, "первая")
+    db.add_note(uid, "вторая")
+    assert db.count_notes(uid) == 2
+
+    db.delete_note(uid, first)
+    assert db.count_notes(uid) == 1
+
+
+def test_add_note_limited_enforces_limit(fresh_db):
+    """Тест атомарной проверки лимита при добавлении"""
+    db = fresh_db
+    uid = 322
+
+    assert db.add_note_limited(uid, "раз", 2)[1] == 1
+    note_id, count = db.add_note_limited(uid, "два", 2)
+    assert note_id is not None and count == 2
+
+    note_id, count = db.add_note_limited(uid, "три", 2)
+    assert note_id is None
+    assert count == 2
+    assert len(db.list_notes(uid)) == 2
+
+
+def test_add_note_limited_is_race_free(fresh_db):
+    """Тест, что параллельные добавления не превышают лимит"""
+    import threading
+    db = fresh_db
+    uid = 323
+
+    def worker(i):
+        db.add_note_limited(uid, f"заметка {i}", 5)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert db.count_notes(uid) == 5
+    assert len(db.list_notes(uid)) == 5
+
+
+def test_update_and_delete_return_count_from_same_write(fresh_db):
+    """Тест: изменение и удаление возвращают число заметок; чужая или несуществующая — None"""
+    db = fresh_db
+    uid = 323
+    first = db.add_note(uid, "первая")
+    db.add_note(uid, "вторая")
+
+    assert db.update_note_counted(uid, first, "исправленная") == 2
+    assert db.update_note_counted(uid + 1, first, "чужая") is None
+    assert db.delete_note_counted(uid, first) == 1
+    assert db.delete_note_counted(uid, first) is None
+    assert [n["text"] for n in db.list_notes(uid)] == ["вторая"]
+
+
+def test_list_notes_page_keyset(fresh_db):
+    """Тест keyset-пагинации заметок в обе стороны"""
+    db = fresh_db
+    uid = 324
+    ids = [db.add_note(uid, f"заметка {i}") for i in range(7)]
+
+    page1, more = db.list_notes_page(uid, page_size=3)
+    assert [n['id'] for n in page1] == ids[::-1][:3]
+    assert more is True
+
+    page2, more = db.list_notes_page(uid, before_id=page1[-1]['id'], page_size=3)
+    assert [n['id'] for n in page2] == ids[::-1][3:6]
+    assert more is True
+
+    page3, more = db.list_notes_page(uid, before_id=page2[-1]['id'], page_size=3)
+    assert [n['id'] for n in page3] == [ids[0]]
+    assert more is False
+
+    back, more = db.list_notes_page(uid, after_id=page2[0]['id'], page_size=3)
+    assert [n['id'] for n in back] == [n['id'] for n in page1]
+    assert more is False
+
+
+def test_fallback_chain_starts_with_active_model(fresh_db):
+    """Тест цепочки запасных моделей: активная первая, дальше по fallback_order"""
+    db = fresh_db
+    db.set_active_model(7)
+
+    chain = db.get_fallback_chain()
+
+    assert chain[0]["id"] == 7
+    keys = [m["key"] for m in chain]
+    assert len(keys) == len(set(keys))
+    assert keys[1:] == [
+        "google/gemini-2.5-flash-lite-preview-06-17",
+        "mistralai/mistral-small-24b-instruct-2501:free",
+    ]
+
+
+def test_set_model_fallback(fresh_db):
+    """Тест изменения цепочки запасных моделей"""
+    db = fresh_db
+    db.set_model_fallback(10, 0)
+    db.set_model_fallback(3, None)
+
+    keys = [m["key"] for m in db.get_fallback_chain()[1:]]
+
+    assert keys[0] == "qwen/qwen3-coder-30b-a3b-instruct"
+    assert "mistralai/mistral-small-24b-instruct-2501:free" not in keys
+    with pytest.raises(ValueError):
+        db.set_model_fallback(999, 1)
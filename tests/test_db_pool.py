@@ -0,0 +1,86 @@
+import threading
+
+
+def test_pool_reuses_connection_in_same_thread(fresh_db):
+    """Тест, что в одном потоке переиспользуется одно соединение"""
+    db = fresh_db
+
+    with db._connect() as c1:
+        pass
+    with db._connect() as c2:
+        pass
+
+    assert c1 is c2
+    assert db._pool.size() == 1
+
+
+def test_pool_gives_each_thread_own_connection(fresh_db):
+    """Тест, что у каждого потока своё соединение"""
+    db = fresh_db
+    seen = []
+
+    def worker():
+        with db._connect() as conn:
+            seen.append(conn)
+        db.add_note(1, "из потока")
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len({id(c) for c in seen}) == 3
+    assert len(db.list_notes(1)) == 3
+
+
+def test_pool_overflow_connection_is_not_kept(fresh_db, monkeypatch):
+    """Тест, что при заполненном пуле соединение не сохраняется"""
+    db = fresh_db
+    monkeypatch.setattr(db._pool, "max_size", 0)
+    db.close_all()
+
+    note_id = db.add_note(7, "текст")
+
+    assert db.get_note(7, note_id)["text"] == "текст"
+    assert db._pool.size() == 0
+
+
+def test_pool_reopens_broken_connection(fresh_db, monkeypatch):
+    """Тест health-check: закрытое соединение заменяется новым"""
+    db = fresh_db
+    monkeypatch.setattr(db._pool, "health_check_s", 0)
+
+    with db._connect() as conn:
+        pass
+    conn.close()
+
+    with db._connect() as conn2:
+        assert conn2 is not conn
+        assert conn2.execute("SELECT 1").fetchone()[0] == 1
+
+
+def test_pool_rollback_on_error(fresh_db):
+    """Тест, что транзакция откатывается при исключении"""
+    db = fresh_db
+
+    try:
+        with db._connect() as conn:
+            conn.execute("INSERT INTO notes(user_id, text) VALUES (?, ?)", (5, "черновик"))
+            raise RuntimeError("сбой")
+    except RuntimeError:
+        pass
+
+    assert db.list_notes(5) == []
+
+
+def test_close_all_empties_pool(fresh_db):
+    """Тест закрытия всех соединений пула"""
+    db = fresh_db
+    db.list_notes(1)
+    assert db._pool.size() == 1
+
+    db.close_all()
+
+    assert db._pool.size() == 0
+    assert db.list_notes(1) == []
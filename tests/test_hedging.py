@@ -0,0 +1,244 @@
+import threading
+import time
+
+import pytest
+
+
+def _learn(openrouter, model, ms, n=20):
+    window = openrouter.model_first_token(model)
+    for _ in range(n):
+        window.add(ms)
+
+
+def _wait_idle(openrouter, timeout_s=5.0):
+    """Ждём, пока отменённый дубль закроет свой запрос"""
+    deadline = time.monotonic() + timeout_s
+    while openrouter.single_flight_stats()["in_flight"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def _drain(stream):
+    """Дочитываем поток в фоне; оборванный поток заканчивается ошибкой"""
+    try:
+        for _ in stream:
+            pass
+    except Exception:
+        pass
+
+
+def test_latency_window_percentile(openrouter_module):
+    """Тест: p90 считается по окну, пока данных мало — None"""
+    window = openrouter_module.LatencyWindow(size=100, min_samples=10)
+    for ms in range(1, 10):
+        window.add(ms * 100)
+    assert window.percentile(0.9) is None
+
+    for ms in range(10, 101):
+        window.add(ms * 100)
+    assert window.percentile(0.9) == 9100
+    assert len(window) == 100
+
+
+def test_hedge_budget_limits_extra_requests(openrouter_module):
+    """Тест: дублей не больше ratio от числа запросов"""
+    budget = openrouter_module.HedgeBudget(ratio=0.1)
+    for _ in range(9):
+        budget.note_request()
+    assert not budget.try_spend()
+
+    budget.note_request()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    assert budget.stats() == {"requests": 10, "hedges": 1, "ratio": 0.1}
+
+
+def test_slow_primary_is_hedged(openrouter_module, fake_openrouter):
+    """Тест: основная модель дольше своего p90 — отвечает дубль, основная отменяется"""
+    openrouter = openrouter_module
+    fake_openrouter.delays = {"slow": 1.0}
+    _learn(openrouter, "slow", 50)
+    budget = openrouter.HedgeBudget(ratio=1.0)
+
+    stream = openrouter.HedgedStream([{"role": "user", "content": "вопрос"}], "slow", "fast", budget=budget)
+    t0 = time.perf_counter()
+    text = "".join(stream)
+    elapsed = time.perf_counter() - t0
+
+    assert text == "Ответ модели fast: вопрос"
+    assert stream.model == "fast" and stream.hedged
+    assert stream.launched == ["slow", "fast"]
+    assert elapsed < 0.9
+    assert stream.latency >= 50
+    _wait_idle(openrouter)
+    # отменённая основная не считается ни удачей, ни сбоем
+    assert openrouter.get_breaker("slow").snapshot()["calls"] == 0
+
+
+def test_hedge_loser_frees_slot_at_once(openrouter_module, fake_openrouter, monkeypatch):
+    """Тест: проигравшая модель отдаёт место в очереди к LLM сразу, не дожидаясь своего ответа"""
+    openrouter = openrouter_module
+    d = openrouter.LLMDispatcher(max_concurrency=4, per_model=2, max_depth=4)
+    monkeypatch.setattr(openrouter, "dispatcher", d)
+    fake_openrouter.delays = {"slow": 1.0}
+    _learn(openrouter, "slow", 50)
+
+    stream = openrouter.HedgedStream([{"role": "user", "content": "?"}], "slow", "fast",
+                                     budget=openrouter.HedgeBudget(ratio=1.0))
+    "".join(stream)
+
+    assert stream.model == "fast"
+    assert d.stats()["active"] == 0
+    _wait_idle(openrouter)
+    assert openrouter.get_breaker("slow").snapshot()["calls"] == 0
+
+
+def test_cancel_interrupts_stream_between_chunks(openrouter_module, fake_openrouter, monkeypatch):
+    """Тест: cancel() из другого потока обрывает ответ, не дожидаясь следующего куска"""
+    openrouter = openrouter_module
+    d = openrouter.LLMDispatcher(max_concurrency=4, per_model=2, max_depth=4)
+    monkeypatch.setattr(openrouter, "dispatcher", d)
+    fake_openrouter.token_delay_s = 2.0
+    stream = openrouter.chat_stream([{"role": "user", "content": "долгий ответ"}], model="m")
+    reader = threading.Thread(target=_drain, args=(stream,), daemon=True)
+    reader.start()
+    deadline = time.monotonic() + 5
+    while stream.first_token_ms is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    t0 = time.perf_counter()
+    stream.cancel()
+    reader.join(1.5)
+
+    assert not reader.is_alive() and time.perf_counter() - t0 < 1.5
+    assert d.stats()["active"] == 0
+    assert openrouter.get_breaker("m").snapshot()["calls"] == 0
+
+
+def test_hedge_loser_with_followers_keeps_running(openrouter_module, fake_openrouter):
+    """Тест: к основной модели присоединился другой вызов — после победы дубля он получает полный ответ"""
+    openrouter = openrouter_module
+    fake_openrouter.delays = {"slow": 1.0}
+    _learn(openrouter, "slow", 50)
+    messages = [{"role": "user", "content": "общий вопрос"}]
+
+    stream = openrouter.HedgedStream(messages, "slow", "fast", budget=openrouter.HedgeBudget(ratio=1.0))
+    result = {}
+
+    def call(name, it):
+        try:
+            result[name] = "".join(it)
+        except Exception as e:
+            result[name] = e
+
+    hedged = threading.Thread(target=call, args=("hedged", stream), daemon=True)
+    hedged.start()
+    deadline = time.monotonic() + 5
+    while not openrouter.single_flight_stats()["in_flight"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    follower = threading.Thread(target=call, args=("follower", openrouter.chat_stream(messages, model="slow")),
+                                daemon=True)
+    follower.start()
+    hedged.join(5)
+    follower.join(5)
+
+    assert openrouter.single_flight_stats()["collapsed"] == 1
+    assert stream.model == "fast"
+    assert result == {"hedged": "Ответ модели fast: общий вопрос", "follower": "Ответ модели slow: общий вопрос"}
+
+
+def test_full_response_latency_does_not_set_hedge_threshold(openrouter_module, fake_openrouter):
+    """Тест: долгие полные ответы chat_once не поднимают порог дубля — он только по первому куску"""
+    openrouter = openrouter_module
+    fake_openrouter.delays = {"main": 1.0}
+    _learn(openrouter, "main", 50)
+    for _ in range(40):
+        openrouter.model_latency("main").add(5000)
+    budget = openrouter.HedgeBudget(ratio=1.0)
+
+    stream = openrouter.HedgedStream([{"role": "user", "content": "?"}], "main", "backup", budget=budget)
+    "".join(stream)
+
+    assert stream.model == "backup" and stream.hedged
+    _wait_idle(openrouter)
+
+
+def test_fast_primary_is_not_hedged(openrouter_module, fake_openrouter):
+    """Тест: основная уложилась в p90 — дубль не отправляется"""
+    openrouter = openrouter_module
+    _learn(openrouter, "main", 2000)
+    budget = openrouter.HedgeBudget(ratio=1.0)
+
+    stream = openrouter.HedgedStream([{"role": "user", "content": "?"}], "main", "backup", budget=budget)
+    "".join(stream)
+
+    assert stream.model == "main" and not stream.hedged
+    assert [r["model"] for r in fake_openrouter.requests] == ["main"]
+    assert budget.hedges == 0
+
+
+def test_no_hedge_without_latency_history(openrouter_module, fake_openrouter):
+    """Тест: пока p90 неизвестен, порога нет и дубль не отправляется"""
+    openrouter = openrouter_module
+    fake_openrouter.delays = {"main": 0.3}
+
+    stream = openrouter.HedgedStream([{"role": "user", "content": "?"}], "main", "backup",
+                                     budget=openrouter.HedgeBudget(ratio=1.0))
+    "".join(stream)
+
+    assert stream.model == "main" and not stream.hedged
+
+
+def test_exhausted_budget_waits_for_primary(openrouter_module, fake_openrouter):
+    """Тест: без бюджета ждём основную модель, даже если она медленная"""
+    openrouter = openrouter_module
+    fake_openrouter.delays = {"slow": 0.3}
+    _learn(openrouter, "slow", 10)
+
+    stream = openrouter.HedgedStream([{"role": "user", "content": "?"}], "slow", "fast",
+                                     budget=openrouter.HedgeBudget(ratio=0))
+    text = "".join(stream)
+
+    assert text == "Ответ модели slow: ?"
+    assert stream.launched == ["slow"]
+
+
+def test_stream_success_feeds_latency_stats(openrouter_module, fake_openrouter):
+    """Тест: потоки пополняют окно времени до первого куска, chat_once — окно полных ответов"""
+    openrouter = openrouter_module
+
+    for i in range(3):
+        list(openrouter.chat_stream([{"role": "user", "content": f"q{i}"}], model="m"))
+    openrouter.chat_once([{"role": "user", "content": "q"}], model="m")
+
+    assert len(openrouter.model_first_token("m")) == 3
+    assert len(openrouter.model_latency("m")) == 1
+
+
+def test_failover_with_hedging_skips_to_backup(openrouter_module, fake_openrouter, monkeypatch):
+    """Тест: основная упала до порога — цепочка переходит к запасной как обычно"""
+    openrouter = openrouter_module
+    monkeypatch.setattr(openrouter, "_sleep", lambda s: None)
+    fake_openrouter.statuses = [503, 503, 503]
+
+    stream = openrouter.chat_stream_failover([{"role": "user", "content": "?"}], ["main", "backup"], hedge=True)
+    text = "".join(stream)
+
+    assert text == "Ответ модели backup: ?"
+    assert stream.model == "backup" and not stream.hedged
+    assert stream.failed == ["main"]
+
+
+@pytest.mark.parametrize("hedge", [False, True])
+def test_failover_reports_hedge_winner(openrouter_module, fake_openrouter, monkeypatch, hedge):
+    """Тест: FailoverStream помечает ответ дубля только в режиме хеджирования"""
+    openrouter = openrouter_module
+    fake_openrouter.delays = {"slow": 0.6}
+    _learn(openrouter, "slow", 20)
+    monkeypatch.setattr(openrouter, "hedge_budget", openrouter.HedgeBudget(ratio=1.0))
+
+    stream = openrouter.chat_stream_failover([{"role": "user", "content": "?"}], ["slow", "fast"], hedge=hedge)
+    "".join(stream)
+
+    assert stream.model == ("fast" if hedge else "slow")
+    assert stream.hedged is hedge
+    _wait_idle(openrouter)
@@ -0,0 +1,77 @@
+from datetime import date, datetime
+
+import pytest
+
+import db3
+from horoscope3 import CANON_SIGNS, DailyTexts, make_daily_text
+from scheduler3 import DailyScheduler
+
+DAY = date(2026, 10, 18)
+
+
+@pytest.fixture
+def texts_db(tmp_path, monkeypatch):
+    """Фикстура: чистая база db3 для сохранённых текстов"""
+    monkeypatch.setattr(db3, "DB_PATH", str(tmp_path / "zodiac.db"))
+    db3.init_db()
+    return db3
+
+
+def test_texts_match_make_daily_text(texts_db):
+    """Тест: кэш отдаёт те же тексты, что и make_daily_text"""
+    texts = DailyTexts()
+
+    assert all(texts.get(sign, DAY) == make_daily_text(sign, DAY) for sign in CANON_SIGNS)
+
+
+def test_all_signs_rendered_once_per_date(texts_db):
+    """Тест: 12 текстов рендерятся один раз на дату, дальше — чтение из памяти"""
+    calls = []
+
+    def render(sign, for_date):
+        calls.append((sign, for_date))
+        return make_daily_text(sign, for_date)
+
+    texts = DailyTexts(render=render)
+    for _ in range(3):
+        for sign in CANON_SIGNS:
+            texts.get(sign, DAY)
+
+    assert len(calls) == 12
+    assert texts.stats()["renders"] == 1
+
+
+def test_persisted_texts_survive_restart(texts_db):
+    """Тест: после перезапуска тексты берутся из базы без рендера"""
+    DailyTexts().warm_ahead(DAY)
+
+    restarted = DailyTexts(render=lambda sign, for_date: pytest.fail("не должен рендерить"))
+    assert restarted.get("лев", DAY) == make_daily_text("лев", DAY)
+    assert restarted.stats()["disk_loads"] == 1
+
+
+def test_old_dates_are_pruned(texts_db):
+    """Тест: в базе и в памяти не копятся тексты за старые даты"""
+    texts = DailyTexts(keep_days=2)
+    for day in (date(2026, 10, 1), date(2026, 10, 16), date(2026, 10, 17), DAY):
+        texts.for_date(day)
+
+    assert texts.stats()["dates"] == ["2026-10-17", "2026-10-18"]
+    assert texts_db.get_daily_texts("2026-10-01") == {}
+    assert len(texts_db.get_daily_texts("2026-10-16")) == 12
+
+
+def test_unknown_sign_falls_back_to_render(texts_db):
+    """Тест: знак не из справочника рендерится на лету"""
+    assert DailyTexts().get("змееносец", DAY) == make_daily_text("змееносец", DAY)
+
+
+def test_scheduler_warms_texts_before_first_hour(texts_db):
+    """Тест: при смене даты планировщик прогревает тексты на сегодня и завтра"""
+    texts = DailyTexts()
+    scheduler = DailyScheduler(lambda user, day: None, iter_due=lambda now_ts: [],
+                               next_fire_at=lambda: None, on_new_day=texts.warm_ahead)
+
+    scheduler.run_pending(datetime(2026, 10, 18, 12, 0).astimezone())
+
+    assert texts.stats()["dates"] == ["2026-10-18", "2026-10-19"]
@@ -0,0 +1,131 @@
+import pytest
+
+
+def test_cache_key_is_canonical(openrouter_module):
+    """Тест: ключ не зависит от порядка полей и различает параметры выборки"""
+    openrouter = openrouter_module
+    a = [{"role": "user", "content": "Привет"}]
+    b = [{"content": "Привет", "role": "user"}]
+
+    assert openrouter.cache_key(a, "m", 0.2, 400) == openrouter.cache_key(b, "m", 0.2, 400)
+    assert openrouter.cache_key(a, "m", 0.2, 400) != openrouter.cache_key(a, "m", 0.7, 400)
+    assert openrouter.cache_key(a, "m", 0.2, 400) != openrouter.cache_key(a, "m", 0.2, 200)
+    assert openrouter.cache_key(a, "m", 0.2, 400) != openrouter.cache_key(a, "other", 0.2, 400)
+
+
+def test_chat_once_served_from_cache(openrouter_module, fake_openrouter):
+    """Тест: повторный одинаковый запрос не уходит в OpenRouter"""
+    openrouter = openrouter_module
+    messages = [{"role": "user", "content": "Что такое SQLite?"}]
+
+    text1, latency1 = openrouter.chat_once(messages, model="m")
+    text2, latency2 = openrouter.chat_once(messages, model="m")
+
+    assert text2 == text1
+    assert len(fake_openrouter.requests) == 1
+    assert not latency1.cached
+    assert latency2.cached and int(latency2) == int(latency1)
+    stats = openrouter.cache_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_errors_are_not_cached(openrouter_module, fake_openrouter):
+    """Тест: ошибка не попадает в кэш, следующий запрос идёт к модели"""
+    openrouter = openrouter_module
+    fake_openrouter.statuses = [502]
+    messages = [{"role": "user", "content": "?"}]
+
+    with pytest.raises(openrouter.OpenRouterError):
+        openrouter.chat_once(messages, model="m", retry=openrouter.RetryPolicy(max_attempts=1))
+    text, latency = openrouter.chat_once(messages, model="m")
+
+    assert text == "Ответ модели m: ?"
+    assert not latency.cached
+    assert len(fake_openrouter.requests) == 2
+
+
+def test_use_cache_false_bypasses_cache(openrouter_module, fake_openrouter):
+    """Тест: use_cache=False всегда идёт к модели"""
+    openrouter = openrouter_module
+    messages = [{"role": "user", "content": "x"}]
+
+    openrouter.chat_once(messages, model="m")
+    openrouter.chat_once(messages, model="m", use_cache=False)
+
+    assert len(fake_openrouter.requests) == 2
+
+
+def test_stream_fills_and_hits_cache(openrouter_module, fake_openrouter):
+    """Тест: дочитанный поток кладётся в кэш, повтор приходит одним куском"""
+    openrouter = openrouter_module
+    messages = [{"role": "user", "content": "раз два три"}]
+
+    first = openrouter.chat_stream(messages, model="m")
+    full = "".join(first)
+    second = openrouter.chat_stream(messages, model="m")
+    deltas = list(second)
+
+    assert deltas == [full]
+    assert second.latency.cached and int(second.latency) == int(first.latency)
+    assert len(fake_openrouter.requests) == 1
+    # chat_once с теми же параметрами тоже попадает в кэш
+    assert openrouter.chat_once(messages, model="m")[0] == full
+
+
+def test_unfinished_stream_is_not_cached(openrouter_module, fake_openrouter):
+    """Тест: брошенный на середине поток не кэшируется"""
+    openrouter = openrouter_module
+    messages = [{"role": "user", "content": "раз два три"}]
+
+    stream = iter(openrouter.chat_stream(messages, model="m"))
+    next(stream)
+    stream.close()
+
+    assert openrouter.cache_stats()["stores"] == 0
+
+
+def test_memory_tier_is_bounded_lru(openrouter_module):
+    """Тест: LRU вытесняет самую давно использованную запись"""
+    cache = openrouter_module.ResponseCache(max_size=2, ttl_s=60)
+    cache.put("a", "A", 10)
+    cache.put("b", "B", 20)
+    cache.get("a")
+    cache.put("c", "C", 30)
+
+    assert cache.get("b") is None
+    assert cache.get("a")[0] == "A"
+    assert cache.get("c")[0] == "C"
+    assert cache.stats()["size"] == 2
+
+
+def test_ttl_expires_entries(openrouter_module, monkeypatch):
+    """Тест: запись старше TTL считается промахом"""
+    openrouter = openrouter_module
+    cache = openrouter.ResponseCache(max_size=10, ttl_s=60)
+    now = [1000.0]
+    monkeypatch.setattr(openrouter.time, "time", lambda: now[0])
+
+    cache.put("k", "текст", 1500)
+    now[0] += 59
+    assert cache.get("k")[0] == "текст"
+    now[0] += 2
+    assert cache.get("k") is None
+
+
+def test_sqlite_tier_survives_restart(openrouter_module, tmp_path):
+    """Тест: постоянный уровень отдаёт ответ новому экземпляру кэша"""
+    openrouter = openrouter_module
+    path = str(tmp_path / "llm_cache.db")
+    cache = openrouter.ResponseCache(max_size=10, ttl_s=60, db_path=path)
+    cache.put("k", "сохранённый ответ", 2345)
+    cache.close()
+
+    restarted = openrouter.ResponseCache(max_size=10, ttl_s=60, db_path=path)
+    text, latency = restarted.get("k")
+    assert text == "сохранённый ответ"
+    assert int(latency) == 2345 and latency.cached
+    assert restarted.stats()["disk_hits"] == 1
+    # после подъёма с диска запись живёт и в памяти
+    restarted.get("k")
+    assert restarted.stats()["memory_hits"] == 1
+    restarted.close()
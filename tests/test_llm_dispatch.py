@@ -0,0 +1,195 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+
+def _hold(dispatcher, model, priority, started, release, order, name):
+    with dispatcher.slot(model, priority):
+        order.append(name)
+        started.set()
+        release.wait(5)
+
+
+def test_global_and_per_model_limits(openrouter_module):
+    """Тест: не больше max_concurrency всего и per_model к одной модели"""
+    openrouter = openrouter_module
+    d = openrouter.LLMDispatcher(max_concurrency=3, per_model=2, max_depth=0)
+
+    with d.slot("a"), d.slot("a"):
+        with pytest.raises(openrouter.QueueFullError):
+            with d.slot("a"):
+                pass
+        with d.slot("b"):
+            assert d.stats()["active"] == 3
+            with pytest.raises(openrouter.QueueFullError):
+                with d.slot("c"):
+                    pass
+    stats = d.stats()
+    assert stats["active"] == 0 and stats["rejected"] == 2
+
+
+def test_priority_order_and_wait_time(openrouter_module):
+    """Тест: освободившееся место получает более приоритетный запрос, ожидание измеряется"""
+    openrouter = openrouter_module
+    d = openrouter.LLMDispatcher(max_concurrency=1, per_model=1, max_depth=10)
+    order = []
+    release = threading.Event()
+    first = threading.Event()
+    holder = threading.Thread(target=_hold, args=(d, "m", openrouter.PRIORITY_HIGH, first, release, order, "first"))
+    holder.start()
+    first.wait(5)
+
+    threads = []
+    for name, priority in [("low", openrouter.PRIORITY_LOW), ("high", openrouter.PRIORITY_HIGH)]:
+        t = threading.Thread(target=_hold, args=(d, "m", priority, threading.Event(), release, order, name))
+        t.start()
+        threads.append(t)
+        while d.stats()["waiting"] < len(threads):
+            time.sleep(0.01)
+
+    time.sleep(0.1)
+    release.set()
+    for t in [holder] + threads:
+        t.join(5)
+
+    assert order == ["first", "high", "low"]
+    assert d.stats()["wait_ms"] >= 100
+
+
+def test_busy_model_does_not_block_other_models(openrouter_module):
+    """Тест: ожидание места у одной модели не задерживает запрос к другой"""
+    openrouter = openrouter_module
+    d = openrouter.LLMDispatcher(max_concurrency=3, per_model=1, max_depth=5)
+    release = threading.Event()
+    started = threading.Event()
+    t1 = threading.Thread(target=_hold, args=(d, "a", 0, started, release, [], "a1"))
+    t1.start()
+    started.wait(5)
+    t2 = threading.Thread(target=_hold, args=(d, "a", 0, threading.Event(), release, [], "a2"))
+    t2.start()
+    while d.stats()["waiting"] < 1:
+        time.sleep(0.01)
+
+    with d.slot("b", timeout_s=1) as waited_ms:
+        assert waited_ms < 500
+
+    release.set()
+    t1.join(5)
+    t2.join(5)
+
+
+def test_low_priority_rejected_earlier(openrouter_module):
+    """Тест: для PRIORITY_LOW очередь вдвое короче"""
+    openrouter = openrouter_module
+    d = openrouter.LLMDispatcher(max_concurrency=1, per_model=1, max_depth=2)
+    release = threading.Event()
+    started = threading.Event()
+    threads = [threading.Thread(target=_hold, args=(d, "m", 0, started, release, [], "h"))]
+    threads[0].start()
+    started.wait(5)
+    threads.append(threading.Thread(target=_hold, args=(d, "m", 0, threading.Event(), release, [], "q")))
+    threads[1].start()
+    while d.stats()["waiting"] < 1:
+        time.sleep(0.01)
+
+    with pytest.raises(openrouter.QueueFullError):
+        with d.slot("m", openrouter.PRIORITY_LOW):
+            pass
+
+    release.set()
+    for t in threads:
+        t.join(5)
+
+
+def test_wait_timeout(openrouter_module):
+    """Тест: слишком долгое ожидание — ошибка 408, место в очереди освобождается"""
+    openrouter = openrouter_module
+    d = openrouter.LLMDispatcher(max_concurrency=1, per_model=1, max_depth=5)
+
+    with d.slot("m"):
+        with pytest.raises(openrouter.QueueTimeoutError) as exc_info:
+            with d.slot("m", timeout_s=0.05):
+                pass
+
+    assert exc_info.value.status == 408
+    assert d.stats()["waiting"] == 0 and d.stats()["timeouts"] == 1
+
+
+def test_queue_wait_is_part_of_latency(openrouter_module, fake_openrouter, monkeypatch):
+    """Тест: время в очереди входит в Latency запроса"""
+    openrouter = openrouter_module
+    d = openrouter.LLMDispatcher(max_concurrency=1, per_model=1, max_depth=5)
+    monkeypatch.setattr(openrouter, "dispatcher", d)
+    fake_openrouter.delay_s = 0.2
+    results = {}
+
+    def ask(name):
+        stream = openrouter.chat_stream([{"role": "user", "content": name}], model="m")
+        "".join(stream)
+        results[name] = stream.latency
+
+    threads = [threading.Thread(target=ask, args=(n,)) for n in ("a", "b")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+
+    queued = max(results.values(), key=lambda lat: lat.queue_ms)
+    assert queued.queue_ms >= 150
+    assert int(queued) >= queued.queue_ms + 150
+
+
+def test_queue_full_does_not_trip_breaker(openrouter_module, fake_openrouter, monkeypatch):
+    """Тест: отказ очереди — не сбой модели, и на запасную модель не переключаемся"""
+    openrouter = openrouter_module
+    monkeypatch.setattr(openrouter, "dispatcher", openrouter.LLMDispatcher(0, 0, 0))
+
+    for _ in range(6):
+        with pytest.raises(openrouter.QueueFullError):
+            list(openrouter.chat_stream_failover([{"role": "user", "content": "?"}], ["m", "backup"]))
+
+    assert openrouter.get_breaker("m").state == "closed"
+    assert fake_openrouter.requests == []
+
+
+def test_queue_timeout_does_not_trip_breaker(openrouter_module, fake_openrouter, monkeypatch):
+    """Тест: не дождались очереди — не сбой модели, на запасную модель не переключаемся"""
+    openrouter = openrouter_module
+    d = openrouter.LLMDispatcher(max_concurrency=1, per_model=1, max_depth=5)
+    monkeypatch.setattr(openrouter, "dispatcher", d)
+
+    with d.slot("m"):
+        for _ in range(6):
+            with pytest.raises(openrouter.QueueTimeoutError):
+                list(openrouter.chat_stream_failover([{"role": "user", "content": "?"}], ["m", "backup"],
+                                                     timeout_s=0.02))
+
+    assert openrouter.get_breaker("m").state == "closed"
+    assert fake_openrouter.requests == []
+
+
+def test_queue_wait_is_not_charged_to_model(openrouter_module, monkeypatch):
+    """Тест: предохранитель получает задержку без очереди, а на HTTP остаётся timeout_s минус ожидание"""
+    openrouter = openrouter_module
+
+    class Waited:
+        @contextmanager
+        def slot(self, model, priority, timeout_s):
+            yield 5000  # будто 5 с простояли в очереди
+
+    attempt_timeouts, recorded = [], []
+    monkeypatch.setattr(openrouter, "OPENROUTER_API_KEY", "test-api-key")
+    monkeypatch.setattr(openrouter, "dispatcher", Waited())
+    monkeypatch.setattr(openrouter, "_post_once",
+                        lambda headers, payload, timeout_s, attempt_s: attempt_timeouts.append(attempt_s) or "ok")
+    breaker = openrouter.get_breaker("m")
+    monkeypatch.setattr(breaker, "record", lambda ok, latency_ms=None: recorded.append((ok, latency_ms)))
+
+    text, latency = openrouter.chat_once([{"role": "user", "content": "?"}], model="m", timeout_s=30,
+                                         use_cache=False)
+
+    assert text == "ok" and latency.queue_ms == 5000 and int(latency) >= 5000
+    assert recorded == [(True, int(latency) - 5000)]
+    assert 24 < attempt_timeouts[0] <= 25
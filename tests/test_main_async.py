@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+
+
+@pytest.fixture
+def main_async_module(main_module):
+    """Фикстура для asyncio-версии бота"""
+    import main_async
+    return main_async
+
+
+class TestAsyncBot:
+    """Тесты asyncio-режима бота"""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом"""
+        self.message = Mock()
+        self.message.from_user.id = 12345
+        self.message.chat.id = 67890
+
+    def test_same_commands_as_sync_bot(self, main_async_module, main_module):
+        """Тест: asyncio-бот обрабатывает те же команды, что и main.bot"""
+        def commands(handlers):
+            return sorted(c for h in handlers for c in h["filters"].get("commands") or [])
+
+        assert commands(main_async_module.bot.message_handlers) == commands(main_module.bot.message_handlers)
+        assert len(main_async_module.bot.callback_query_handlers) == len(main_module.bot.callback_query_handlers)
+
+    @patch('main_async.get_fallback_chain', return_value=[{"key": "main"}, {"key": "backup"}])
+    @patch('main_async.chat_once_failover_async', new_callable=AsyncMock)
+    @patch('main_async.send_chat_action', new_callable=AsyncMock)
+    @patch('main_async.reply_to', new_callable=AsyncMock)
+    def test_ask_replies_once_with_footer(self, mock_reply, mock_action, mock_chat, mock_chain, main_async_module):
+        """Тест: /ask отвечает одним сообщением с той же подписью, что и синхронный бот"""
+        mock_chat.return_value = ("Ответ", 250, "backup")
+        self.message.text = "/ask Что такое SQLite?"
+
+        with patch('main_async.main.build_messages', return_value=[{"role": "user", "content": "?"}]):
+            asyncio.run(main_async_module.cmd_ask(self.message))
+
+        mock_chat.assert_awaited_once()
+        assert mock_chat.call_args[0][1] == ["main", "backup"]
+        mock_reply.assert_awaited_once_with(
+            self.message, "Ответ\n\n(250 мс; модель: backup (вместо недоступной main))")
+
+    @patch('main_async.reply_to', new_callable=AsyncMock)
+    def test_ask_without_question_shows_usage(self, mock_reply, main_async_module):
+        """Тест: /ask без вопроса подсказывает использование"""
+        self.message.text = "/ask"
+
+        asyncio.run(main_async_module.cmd_ask(self.message))
+
+        mock_reply.assert_awaited_once_with(self.message, "Использование: /ask <вопрос>")
+
+    def test_reply_goes_through_send_queue(self, main_async_module, main_module):
+        """Тест: ответ async-команды ставится в очередь отправки main.bot, а не уходит мимо неё"""
+        self.message.message_id = 5
+        sent = Future()
+        sent.set_result("отправлено")
+
+        with patch.object(main_module.bot, "send_message_nowait", return_value=sent) as mock_send:
+            assert asyncio.run(main_async_module.reply_to(self.message, "текст")) == "отправлено"
+
+        args, kwargs = mock_send.call_args
+        assert args == (67890, "текст")
+        assert kwargs["reply_parameters"].message_id == 5
+
+    def test_sync_handler_runs_in_handler_executor(self, main_async_module):
+        """Тест: обработчик из main.py выполняется в своём пуле и не занимает потоки БД"""
+        handler = next(h["function"] for h in main_async_module.bot.message_handlers
+                       if h["filters"].get("commands") == ["start"])
+        self.message.text = "/start"
+        threads = []
+
+        with patch('main.bot.reply_to', side_effect=lambda *a, **kw: threads.append(threading.current_thread().name)):
+            asyncio.run(handler(self.message))
+
+        assert len(threads) == 1 and threads[0].startswith("sync-handler")
+
+    def test_shutdown_drains_send_queue(self, main_async_module, main_module):
+        """Тест: shutdown() останавливает полосы и закрывает очередь отправки main.bot, как main.py"""
+        with patch.object(main_module.bot, "outbox") as outbox, \
+                patch.object(main_module.bot, "lanes") as lanes, \
+                patch.object(main_async_module, "handler_executor") as handlers, \
+                patch.object(main_async_module, "db_executor"), \
+                patch.object(main_async_module.bot, "close_session", new_callable=AsyncMock), \
+                patch('main_async.openrouter_client.aclose', new_callable=AsyncMock), \
+                patch('main_async.close_all'):
+            order = Mock()
+            order.attach_mock(handlers.shutdown, "handlers")
+            order.attach_mock(outbox.close, "outbox")
+            asyncio.run(main_async_module.shutdown())
+
+        lanes.stop.assert_called_once()
+        assert [c[0] for c in order.mock_calls] == ["handlers", "outbox"]
@@ -0,0 +1,88 @@
+import sqlite3
+import threading
+
+
+def _trace(db):
+    statements = []
+    with db._connect() as conn:
+        conn.set_trace_callback(statements.append)
+    return statements
+
+
+def _untrace(db):
+    with db._connect() as conn:
+        conn.set_trace_callback(None)
+
+
+def test_model_lookups_hit_cache(fresh_db):
+    """Тест, что повторные обращения к реестру моделей не ходят в таблицу models"""
+    db = fresh_db
+    db.get_active_model()
+    loads = db._models_cache.loads
+
+    statements = _trace(db)
+    try:
+        for _ in range(5):
+            db.get_active_model()
+            db.get_model_by_id(1)
+            db.list_models()
+    finally:
+        _untrace(db)
+
+    assert db._models_cache.loads == loads
+    assert all(s.strip().upper() == "PRAGMA DATA_VERSION" for s in statements)
+
+
+def test_set_active_model_invalidates_cache(fresh_db):
+    """Тест сброса кэша при смене активной модели"""
+    db = fresh_db
+
+    db.set_active_model(1)
+    assert db.get_active_model()["id"] == 1
+    db.set_active_model(2)
+
+    assert db.get_active_model()["id"] == 2
+    assert [m["id"] for m in db.list_models() if m["active"]] == [2]
+
+
+def test_cache_reloads_after_external_change(fresh_db):
+    """Тест: изменение таблицы другим процессом (соединением) видно через data_version"""
+    db = fresh_db
+    db.set_active_model(1)
+    assert db.get_active_model()["id"] == 1
+
+    other = sqlite3.connect(db.DB_PATH)
+    other.execute("UPDATE models SET active=0 WHERE active=1")
+    other.execute("UPDATE models SET active=1 WHERE id=3")
+    other.commit()
+    other.close()
+
+    assert db.get_active_model()["id"] == 3
+
+
+def test_cache_not_reloaded_by_unrelated_writes(fresh_db):
+    """Тест: запись в другие таблицы не заставляет перечитывать models"""
+    db = fresh_db
+    db.get_active_model()
+    loads = db._models_cache.loads
+
+    t = threading.Thread(target=db.add_note, args=(1, "заметка из другого потока"))
+    t.start()
+    t.join()
+
+    db.get_active_model()
+    assert db._models_cache.loads == loads
+
+
+def test_get_active_model_assigns_first_when_none(fresh_db):
+    """Тест: если активной модели нет, назначается первая и это сохраняется в БД"""
+    db = fresh_db
+    with db._connect() as conn:
+        conn.execute("UPDATE models SET active=0")
+    db._models_cache.invalidate()
+
+    active = db.get_active_model()
+
+    assert active["id"] == db.list_models()[0]["id"]
+    with db._connect() as conn:
+        assert conn.execute("SELECT id FROM models WHERE active=1").fetchone()[0] == active["id"]
@@ -0,0 +1,113 @@
+import sqlite3
+
+
+def test_find_notes_uses_fts_and_ranks(fresh_db):
+    """Тест полнотекстового поиска: ранжирование BM25 и подсветка"""
+    db = fresh_db
+    uid = 11
+
+    db.add_note(uid, "купить молоко")
+    best = db.add_note(uid, "молоко, молоко и ещё раз молоко")
+    db.add_note(uid, "позвонить маме")
+
+    found = db.find_notes(uid, "молоко")
+
+    assert [n["id"] for n in found][0] == best
+    assert len(found) == 2
+    assert "[молоко]" in found[0]["snippet"]
+
+
+def test_find_notes_yo_and_prefix(fresh_db):
+    """Тест, что ё и е не различаются, а слово ищется по префиксу"""
+    db = fresh_db
+    uid = 12
+
+    note_id = db.add_note(uid, "Нарядить ёлку к празднику")
+
+    assert [n["id"] for n in db.find_notes(uid, "елк")] == [note_id]
+    assert [n["id"] for n in db.find_notes(uid, "ЁЛКУ")] == [note_id]
+
+
+def test_find_notes_isolated_by_user(fresh_db):
+    """Тест, что поиск не возвращает чужие заметки"""
+    db = fresh_db
+
+    db.add_note(1, "секретный план")
+
+    assert db.find_notes(2, "план") == []
+
+
+def test_fts_follows_update_and_delete(fresh_db):
+    """Тест синхронизации индекса триггерами"""
+    db = fresh_db
+    uid = 13
+
+    note_id = db.add_note(uid, "старый текст")
+    db.update_note(uid, note_id, "новый текст")
+
+    assert db.find_notes(uid, "старый") == []
+    assert [n["id"] for n in db.find_notes(uid, "новый")] == [note_id]
+
+    db.delete_note(uid, note_id)
+    assert db.find_notes(uid, "новый") == []
+
+
+def test_find_notes_without_words_falls_back_to_like(fresh_db):
+    """Тест запроса без слов: работает поиск подстроки"""
+    db = fresh_db
+    uid = 14
+
+    note_id = db.add_note(uid, "итог: 100%!")
+
+    assert [n["id"] for n in db.find_notes(uid, "%!")] == [note_id]
+
+
+def test_backfill_indexes_pre_migration_notes(db_module, tmp_db_path, monkeypatch):
+    """Тест миграции: старые заметки индексируются порциями"""
+    db = db_module
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_db_path))
+
+    # база «старой версии»: только таблица notes без FTS
+    conn = sqlite3.connect(str(tmp_db_path))
+    conn.execute("""CREATE TABLE notes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
+    conn.executemany("INSERT INTO notes(user_id, text) VALUES (?, ?)",
+                     [(1, f"заметка номер {i}") for i in range(25)])
+    conn.commit()
+    conn.close()
+
+    try:
+        db.init_db()
+        # пока backfill не завершён, поиск идёт через LIKE и ничего не теряет
+        assert len(db.find_notes(1, "заметка")) == 25
+
+        new_id = db.add_note(1, "заметка после миграции")
+        indexed = db.backfill_notes_fts(chunk_size=10, pause_s=0)
+
+        assert indexed == 25
+        assert db.backfill_notes_fts() == 0
+        found = db.find_notes(1, "заметка")
+        assert len(found) == 26
+        assert new_id in {n["id"] for n in found}
+        assert all("[" in n["snippet"] for n in found)
+    finally:
+        db.close_all()
+
+
+def test_snippet_keeps_original_yo(fresh_db):
+    """Тест: фрагмент в выдаче — исходный текст с «ё», хотя индекс хранит свёрнутый"""
+    db = fresh_db
+    uid = 14
+    words = " ".join(f"слово{i}" for i in range(30))
+    db.add_note(uid, f"Ёжик купил ёлку. {words} Ещё одна ёлка в конце")
+
+    found = db.find_notes(uid, "елка")
+
+    assert "[ёлка]" in found[0]["snippet"] and "елка" not in found[0]["snippet"]
+    assert found[0]["snippet"].startswith("…") and found[0]["snippet"].endswith("конце")
+
+    db.add_note(uid + 1, "Ёлка [зелёная]")
+    assert db.find_notes(uid + 1, "елка")[0]["snippet"] == "[Ёлка] [зелёная]"
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+
+def _run(openrouter, coro):
+    """Выполняет корутину в новом event loop и закрывает aiohttp-сессию клиента"""
+    async def main():
+        try:
+            return await coro
+        finally:
+            await openrouter.aclose()
+
+    return asyncio.run(main())
+
+
+def test_chat_once_async_returns_answer_and_caches(openrouter_module, fake_openrouter):
+    """Тест: chat_once_async отвечает как chat_once и делит с ним кэш"""
+    openrouter = openrouter_module
+    messages = [{"role": "user", "content": "Что такое asyncio?"}]
+
+    text, latency = _run(openrouter, openrouter.chat_once_async(messages, model="m"))
+
+    assert text == "Ответ модели m: Что такое asyncio?"
+    assert not latency.cached and latency.attempts == 1
+    assert openrouter.chat_once(messages, model="m")[1].cached
+    assert len(fake_openrouter.requests) == 1
+
+
+def test_many_concurrent_asks_without_threads(openrouter_module, fake_openrouter):
+    """Тест: сотня одновременных запросов укладывается примерно в одну задержку модели"""
+    openrouter = openrouter_module
+    fake_openrouter.delay_s = 0.3
+
+    async def ask_all():
+        return await asyncio.gather(*(
+            openrouter.chat_once_async([{"role": "user", "content": f"вопрос {i}"}], model="m")
+            for i in range(100)
+        ))
+
+    results = _run(openrouter, ask_all())
+
+    assert len(fake_openrouter.requests) == 100
+    assert {text for text, _ in results} == {f"Ответ модели m: вопрос {i}" for i in range(100)}
+    assert max(int(latency) for _, latency in results) < 3000
+
+
+def test_identical_async_calls_share_one_request(openrouter_module, fake_openrouter):
+    """Тест: одинаковые одновременные запросы склеиваются в один"""
+    openrouter = openrouter_module
+    fake_openrouter.delay_s = 0.2
+    before = openrouter.single_flight_stats()
+    messages = [{"role": "user", "content": "Популярный вопрос"}]
+
+    async def ask_all():
+        return await asyncio.gather(*(
+            openrouter.chat_once_async(messages, model="m", use_cache=False) for _ in range(5)
+        ))
+
+    results = _run(openrouter, ask_all())
+
+    assert len(fake_openrouter.requests) == 1
+    assert {text for text, _ in results} == {"Ответ модели m: Популярный вопрос"}
+    after = openrouter.single_flight_stats()
+    assert after["leaders"] - before["leaders"] == 1
+    assert after["collapsed"] - before["collapsed"] == 4
+
+
+def test_async_retries_transient_errors(openrouter_module, fake_openrouter, monkeypatch):
+    """Тест: 502 повторяется по RetryPolicy, число попыток попадает в Latency"""
+    openrouter = openrouter_module
+    fake_openrouter.statuses = [502, 200]
+
+    async def no_sleep(_):
+        pass
+
+    monkeypatch.setattr(openrouter, "_async_sleep", no_sleep)
+    text, latency = _run(openrouter, openrouter.chat_once_async([{"role": "user", "content": "?"}], model="m"))
+
+    assert text == "Ответ модели m: ?"
+    assert latency.attempts == 2
+
+
+def test_async_error_is_raised_and_not_cached(openrouter_module, fake_openrouter):
+    """Тест: ошибка без повторов доходит до вызывающего и не кэшируется"""
+    openrouter = openrouter_module
+    fake_openrouter.statuses = [401]
+
+    with pytest.raises(openrouter.OpenRouterError) as exc:
+        _run(openrouter, openrouter.chat_once_async([{"role": "user", "content": "?"}], model="m"))
+
+    assert exc.value.status == 401
+    assert openrouter.cache_stats()["stores"] == 0
+
+
+def test_async_failover_uses_next_model(openrouter_module, fake_openrouter, monkeypatch):
+    """Тест: когда основная модель так и не ответила, отвечает запасная"""
+    openrouter = openrouter_module
+    fake_openrouter.statuses = [503] * openrouter.DEFAULT_RETRY.max_attempts
+
+    async def no_sleep(_):
+        pass
+
+    monkeypatch.setattr(openrouter, "_async_sleep", no_sleep)
+    text, latency, model = _run(openrouter, openrouter.chat_once_failover_async(
+        [{"role": "user", "content": "?"}], ["main", "backup"]))
+
+    assert model == "backup"
+    assert text == "Ответ модели backup: ?"
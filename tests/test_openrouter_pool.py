@@ -0,0 +1,69 @@
+import threading
+
+
+def test_session_is_shared(openrouter_module):
+    """Тест, что сессия с пулом соединений одна на процесс"""
+    openrouter = openrouter_module
+
+    assert openrouter.get_session() is openrouter.get_session()
+
+
+def test_keep_alive_reuses_connection(openrouter_module, fake_openrouter):
+    """Тест: повторные запросы идут по уже открытому соединению"""
+    openrouter = openrouter_module
+    messages = [{"role": "user", "content": "Привет"}]
+    before = openrouter.connection_stats()["connections"]
+
+    text, first = openrouter.chat_once(messages, model="test-model")
+    _, second = openrouter.chat_once(messages, model="test-model")
+    _, third = openrouter.chat_once(messages, model="test-model")
+
+    assert text == "Ответ модели test-model: Привет"
+    assert openrouter.connection_stats()["connections"] - before == 1
+    assert second.connect_ms == 0 and third.connect_ms == 0
+
+
+def test_latency_breakdown_is_int_compatible(openrouter_module, fake_openrouter):
+    """Тест: задержка остаётся int, но содержит разбивку"""
+    openrouter = openrouter_module
+
+    _, ms = openrouter.chat_once([{"role": "user", "content": "?"}], model="m")
+
+    assert isinstance(ms, int)
+    assert ms.connect_ms + ms.model_ms == ms
+    assert f"{ms}" == str(int(ms))
+
+
+def test_pool_is_thread_safe(openrouter_module, fake_openrouter):
+    """Тест: параллельные запросы из нескольких потоков"""
+    openrouter = openrouter_module
+    fake_openrouter.delay_s = 0.05
+    results = []
+
+    def worker(i):
+        text, _ = openrouter.chat_once([{"role": "user", "content": str(i)}], model="m")
+        results.append(text)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(results) == sorted(f"Ответ модели m: {i}" for i in range(8))
+
+
+def test_warm_up_and_close(openrouter_module, fake_openrouter):
+    """Тест прогрева и закрытия пула"""
+    openrouter = openrouter_module
+    before = openrouter.connection_stats()["connections"]
+
+    assert openrouter.warm_up() is True
+    _, ms = openrouter.chat_once([{"role": "user", "content": "?"}], model="m")
+
+    assert openrouter.connection_stats()["connections"] - before == 1
+    assert ms.connect_ms == 0
+
+    session = openrouter.get_session()
+    openrouter.close()
+    assert openrouter.get_session() is not session
@@ -0,0 +1,132 @@
+import pytest
+
+
+@pytest.fixture
+def sleeps(openrouter_module, monkeypatch):
+    """Фикстура: паузы между попытками не ждём, а записываем"""
+    recorded = []
+    monkeypatch.setattr(openrouter_module, "_sleep", recorded.append)
+    return recorded
+
+
+def test_transient_error_is_retried(openrouter_module, fake_openrouter, sleeps):
+    """Тест: 502 повторяется, пользователь получает ответ и число попыток"""
+    openrouter = openrouter_module
+    fake_openrouter.statuses = [502, 503]
+
+    text, latency = openrouter.chat_once([{"role": "user", "content": "?"}], model="m")
+
+    assert text == "Ответ модели m: ?"
+    assert latency.attempts == 3
+    assert len(sleeps) == 2
+    assert 0 <= latency.retry_ms <= latency
+
+
+def test_non_retryable_status_fails_at_once(openrouter_module, fake_openrouter, sleeps):
+    """Тест: 401/400 не повторяются"""
+    openrouter = openrouter_module
+    fake_openrouter.statuses = [401]
+
+    with pytest.raises(openrouter.OpenRouterError) as exc_info:
+        openrouter.chat_once([{"role": "user", "content": "?"}], model="m")
+
+    assert exc_info.value.status == 401
+    assert exc_info.value.attempts == 1
+    assert sleeps == []
+    assert len(fake_openrouter.requests) == 1
+
+
+def test_gives_up_after_max_attempts(openrouter_module, fake_openrouter, sleeps):
+    """Тест: после max_attempts пробрасывается последняя ошибка"""
+    openrouter = openrouter_module
+    fake_openrouter.statuses = [500, 500, 500, 500]
+    policy = openrouter.RetryPolicy(max_attempts=3)
+
+    with pytest.raises(openrouter.OpenRouterError) as exc_info:
+        openrouter.chat_once([{"role": "user", "content": "?"}], model="m", retry=policy)
+
+    assert exc_info.value.status == 500
+    assert exc_info.value.attempts == 3
+    assert len(fake_openrouter.requests) == 3
+
+
+def test_retry_after_header_is_honoured(openrouter_module, fake_openrouter, sleeps):
+    """Тест: пауза берётся из Retry-After, а не из джиттера"""
+    openrouter = openrouter_module
+    fake_openrouter.statuses = [429]
+    fake_openrouter.retry_after = "2"
+
+    openrouter.chat_once([{"role": "user", "content": "?"}], model="m")
+
+    assert sleeps == [2.0]
+
+
+def test_retry_after_beyond_deadline_is_not_awaited(openrouter_module, fake_openrouter, sleeps):
+    """Тест: если Retry-After не укладывается в timeout_s, сразу отдаём ошибку"""
+    openrouter = openrouter_module
+    fake_openrouter.statuses = [429]
+    fake_openrouter.retry_after = "60"
+
+    with pytest.raises(openrouter.OpenRouterError) as exc_info:
+        openrouter.chat_once([{"role": "user", "content": "?"}], model="m", timeout_s=10)
+
+    assert exc_info.value.status == 429
+    assert sleeps == []
+
+
+def test_full_jitter_backoff_bounds(openrouter_module, monkeypatch):
+    """Тест: пауза — случайная в [0, min(max_delay, base * 2^n)]"""
+    openrouter = openrouter_module
+    policy = openrouter.RetryPolicy(max_attempts=10, base_s=0.5, max_delay_s=4.0, min_attempt_s=0)
+    error = openrouter.OpenRouterError(503, "x")
+    bounds = []
+    monkeypatch.setattr(openrouter.random, "uniform", lambda a, b: bounds.append((a, b)) or b)
+
+    delays = [policy.next_delay(n, error, remaining_s=100) for n in range(1, 6)]
+
+    assert bounds == [(0, 0.5), (0, 1.0), (0, 2.0), (0, 4.0), (0, 4.0)]
+    assert delays == [0.5, 1.0, 2.0, 4.0, 4.0]
+
+
+def test_classification(openrouter_module):
+    """Тест: какие ошибки считаются временными"""
+    openrouter = openrouter_module
+    policy = openrouter.RetryPolicy()
+
+    assert policy.is_retryable(openrouter.OpenRouterError(429, "x"))
+    assert policy.is_retryable(openrouter.OpenRouterError(408, "x"))
+    assert not policy.is_retryable(openrouter.OpenRouterError(403, "x"))
+    assert not policy.is_retryable(openrouter.OpenRouterError(500, "x", retryable=False))
+
+
+def test_stream_retries_before_first_token(openrouter_module, fake_openrouter, sleeps):
+    """Тест: поток повторяется, пока не пришёл первый кусок"""
+    openrouter = openrouter_module
+    fake_openrouter.statuses = [503]
+
+    stream = openrouter.chat_stream([{"role": "user", "content": "раз два"}], model="m")
+    text = "".join(stream)
+
+    assert text == "Ответ модели m: раз два"
+    assert stream.latency.attempts == 2
+    assert len(sleeps) == 1
+
+
+def test_stream_not_retried_after_first_token(openrouter_module, monkeypatch, sleeps):
+    """Тест: ошибка посреди потока не повторяется — текст уже показан"""
+    openrouter = openrouter_module
+    monkeypatch.setattr(openrouter, "OPENROUTER_API_KEY", "test-api-key")
+    stream = openrouter.chat_stream([{"role": "user", "content": "?"}], model="m")
+
+    def broken_once(t0, attempt_timeout_s):
+        stream.first_token_ms = 1
+        yield "начало"
+        raise openrouter.OpenRouterError(502, "обрыв")
+
+    monkeypatch.setattr(stream, "_fetch_once", broken_once)
+
+    with pytest.raises(openrouter.OpenRouterError) as exc_info:
+        list(stream)
+
+    assert exc_info.value.attempts == 1
+    assert sleeps == []
@@ -0,0 +1,56 @@
+import pytest
+
+
+def test_chat_stream_yields_deltas(openrouter_module, fake_openrouter):
+    """Тест потокового ответа: куски приходят по очереди и складываются в ответ"""
+    openrouter = openrouter_module
+
+    stream = openrouter.chat_stream([{"role": "user", "content": "раз два три"}], model="m")
+    deltas = list(stream)
+
+    assert len(deltas) > 1
+    assert "".join(deltas) == "Ответ модели m: раз два три"
+    assert fake_openrouter.requests[-1]["stream"] is True
+    assert isinstance(stream.latency, int)
+    assert stream.first_token_ms is not None and stream.first_token_ms <= stream.latency
+
+
+def test_chat_stream_http_error(openrouter_module, fake_openrouter):
+    """Тест: ошибка HTTP до начала потока превращается в OpenRouterError"""
+    openrouter = openrouter_module
+    fake_openrouter.statuses = [429]
+
+    with pytest.raises(openrouter.OpenRouterError) as exc_info:
+        list(openrouter.chat_stream([{"role": "user", "content": "?"}], model="m",
+                                    retry=openrouter.RetryPolicy(max_attempts=1)))
+
+    assert "429" in str(exc_info.value)
+
+
+def test_chat_stream_reuses_connection(openrouter_module, fake_openrouter):
+    """Тест: после потока соединение возвращается в пул"""
+    openrouter = openrouter_module
+    before = openrouter.connection_stats()["connections"]
+
+    list(openrouter.chat_stream([{"role": "user", "content": "a"}], model="m"))
+    list(openrouter.chat_stream([{"role": "user", "content": "b"}], model="m"))
+
+    assert openrouter.connection_stats()["connections"] - before == 1
+
+
+def test_parse_skips_comments_and_reports_midstream_error(openrouter_module):
+    """Тест разбора SSE: комментарии пропускаются, ошибка в потоке — исключение"""
+    openrouter = openrouter_module
+    lines = [
+        ": OPENROUTER PROCESSING",
+        "",
+        'data: {"choices": [{"delta": {"content": "Привет"}}]}',
+        'data: {"error": {"code": 502, "message": "upstream"}}',
+    ]
+
+    parsed = openrouter.ChatStream._parse(iter(lines))
+
+    assert next(parsed) == "Привет"
+    with pytest.raises(openrouter.OpenRouterError) as exc_info:
+        next(parsed)
+    assert "502" in str(exc_info.value)
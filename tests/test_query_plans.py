@@ -0,0 +1,125 @@
+"""
+Регрессионные тесты планов запросов db.py.
+
+Прогоняем все функции db.py на временной базе, перехватываем каждый
+выполненный SQL-запрос и проверяем EXPLAIN QUERY PLAN: горячие запросы
+не должны уходить в полное сканирование таблицы или сортировку через TEMP B-TREE.
+"""
+import pytest
+
+# Маленькие справочники: выдать «весь список» полным проходом — нормально
+# служебная таблица FTS5 из одной строки: FTS5 сам перечитывает её после смены схемы
+SMALL_TABLES = {"models", "characters", "main.notes_fts_config"}
+
+
+def _run_workload(db):
+    uid = 1
+    note_id = db.add_note(uid, "купить ёлку")
+    db.add_note_limited(uid, "вторая заметка", 50)
+    db.count_notes(uid)
+    db.list_notes(uid)
+    db.list_note_dates(uid)
+    page, _ = db.list_notes_page(uid, page_size=1)
+    db.list_notes_page(uid, before_id=page[-1]["id"], page_size=1)
+    db.list_notes_page(uid, after_id=note_id, page_size=1)
+    db.find_notes(uid, "елку")
+    db.find_notes(uid, "%")
+    db.get_note(uid, note_id)
+    db.update_note(uid, note_id, "купить две ёлки")
+    db.delete_note(uid, note_id)
+    db.backfill_notes_fts(pause_s=0)
+
+    db.list_models()
+    db.get_active_model()
+    db.get_model_by_id(1)
+    db.set_active_model(2)
+    db.get_fallback_chain()
+    db.set_model_fallback(2, 4)
+    db.list_characters()
+    db.get_character_by_id(1)
+    db.set_user_character(uid, 2)
+    db.get_user_character(uid)
+    db.get_user_character(999)
+
+
+@pytest.fixture
+def traced_statements(fresh_db):
+    db = fresh_db
+    statements = []
+    with db._connect() as conn:
+        conn.set_trace_callback(statements.append)
+    try:
+        _run_workload(db)
+    finally:
+        with db._connect() as conn:
+            conn.set_trace_callback(None)
+
+    unique = []
+    for sql in statements:
+        first = sql.lstrip().split(None, 1)[0].upper()
+        if first in ("SELECT", "UPDATE", "DELETE", "INSERT") and sql not in unique:
+            unique.append(sql)
+    return db, unique
+
+
+def _plan(conn, sql):
+    return [row["detail"] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+
+def test_workload_covers_all_note_queries(traced_statements):
+    """Тест, что перехват действительно видит запросы к заметкам"""
+    _, statements = traced_statements
+    joined = "\n".join(statements)
+
+    assert "FROM notes_fts" in joined
+    assert "note_counts" in joined
+    assert "id < " in joined and "id > " in joined
+
+
+def test_no_full_scans_or_temp_sorts(traced_statements):
+    """Тест, что ни один запрос не делает full scan большой таблицы и не сортирует во временном B-дереве"""
+    db, statements = traced_statements
+
+    problems = []
+    with db._connect() as conn:
+        for sql in statements:
+            for detail in _plan(conn, sql):
+                if "TEMP B-TREE" in detail:
+                    problems.append((sql, detail))
+                if detail.startswith("SCAN ") and "VIRTUAL TABLE" not in detail:
+                    table = detail.split()[1]
+                    if table not in SMALL_TABLES:
+                        problems.append((sql, detail))
+
+    assert not problems, "\n".join(f"{detail}: {' '.join(sql.split())}" for sql, detail in problems)
+
+
+def test_hot_note_queries_use_composite_indexes(traced_statements):
+    """Тест, что горячие запросы к notes используют составные индексы"""
+    db, statements = traced_statements
+
+    with db._connect() as conn:
+        plans = {sql: " | ".join(_plan(conn, sql)) for sql in statements}
+
+    listing = [p for sql, p in plans.items() if "ORDER BY id" in sql and "FROM notes" in sql]
+    assert listing
+    assert all("idx_notes_user_id_desc" in p for p in listing)
+
+    dates = [p for sql, p in plans.items() if sql.lstrip().startswith("SELECT created_at")]
+    assert dates
+    assert all("COVERING INDEX idx_notes_user_created" in p for p in dates)
+
+
+def test_single_column_indexes_dropped(fresh_db):
+    """Тест миграции: одиночные индексы удалены, составные созданы"""
+    db = fresh_db
+
+    with db._connect() as conn:
+        names = {r["name"] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'notes'")}
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+    assert "idx_user_id" not in names
+    assert "idx_created_at" not in names
+    assert {"idx_notes_user_id_desc", "idx_notes_user_created"} <= names
+    assert version == db.MIGRATIONS[-1][0]
@@ -0,0 +1,172 @@
+from unittest.mock import Mock, patch
+
+import pytest
+from telebot.handler_backends import CancelUpdate
+
+from rate_limit import RateLimiter, TokenBuckets
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_bucket_allows_burst_then_refills(clock):
+    """Тест: capacity запросов подряд, затем отказ с временем ожидания и пополнение"""
+    buckets = TokenBuckets(3, 60.0, clock=clock)
+
+    assert all(buckets.take(1).allowed for _ in range(3))
+    verdict = buckets.take(1)
+    assert not verdict.allowed
+    assert verdict.retry_after_s == pytest.approx(20.0)
+
+    clock.now += 20
+    assert buckets.take(1).allowed
+    assert not buckets.take(1).allowed
+
+
+def test_warn_only_on_first_denial(clock):
+    """Тест: предупреждаем только первый отказ серии"""
+    buckets = TokenBuckets(1, 10.0, clock=clock)
+    buckets.take(1)
+
+    assert buckets.take(1).warn
+    assert not buckets.take(1).warn
+    clock.now += 10
+    assert buckets.take(1).allowed
+    assert buckets.take(1).warn
+
+
+def test_users_are_independent(clock):
+    """Тест: у каждого пользователя своё ведро"""
+    buckets = TokenBuckets(1, 60.0, clock=clock)
+
+    assert buckets.take(1).allowed
+    assert not buckets.take(1).allowed
+    assert buckets.take(2).allowed
+
+
+def test_idle_buckets_are_evicted(clock):
+    """Тест: ведро, простоявшее период, выбрасывается из памяти"""
+    buckets = TokenBuckets(2, 60.0, clock=clock)
+    for uid in range(100):
+        buckets.take(uid)
+    assert len(buckets) == 100
+
+    clock.now += 61
+    buckets.take(999)
+    assert len(buckets) == 1
+
+
+def test_max_keys_bounds_memory(clock):
+    """Тест: число вёдер не превышает max_keys даже при активных пользователях"""
+    buckets = TokenBuckets(2, 60.0, max_keys=10, clock=clock)
+    for uid in range(50):
+        buckets.take(uid)
+
+    assert len(buckets) <= 10
+
+
+def test_command_classes(clock):
+    """Тест: классы команд ограничиваются независимо, неизвестные идут в default"""
+    limiter = RateLimiter({"llm": (1, 60), "default": (2, 60)}, {"ask": "llm", "ask_random": "llm"}, clock=clock)
+
+    assert limiter.check(1, "ask").allowed
+    assert not limiter.check(1, "ask_random").allowed
+    assert limiter.check(1, "help").allowed
+    assert limiter.check(1, "start").allowed
+    assert not limiter.check(1, "help").allowed
+    assert limiter.tracked() == {"llm": 1, "default": 1}
+
+
+def test_limits_from_env(monkeypatch):
+    """Тест: лимит класса переопределяется переменной окружения"""
+    monkeypatch.setenv("RATE_LIMIT_LLM", "1/30")
+    limiter = RateLimiter()
+
+    assert limiter.check(1, "ask").allowed
+    verdict = limiter.check(1, "ask")
+    assert not verdict.allowed and verdict.retry_after_s == pytest.approx(30.0)
+
+
+def test_command_limit_from_env_overrides_class(monkeypatch, clock):
+    """Тест: RATE_LIMIT_CMD_<КОМАНДА> важнее лимита класса и не тратит ведро остальных команд класса"""
+    monkeypatch.setenv("RATE_LIMIT_LLM", "5/60")
+    monkeypatch.setenv("RATE_LIMIT_CMD_ASK_RANDOM", "1/120")
+    monkeypatch.setenv("RATE_LIMIT_MAX_USERS", "10")
+    limiter = RateLimiter(clock=clock)
+
+    assert limiter.check(1, "ask_random").allowed
+    verdict = limiter.check(1, "ask_random")
+    assert not verdict.allowed and verdict.retry_after_s == pytest.approx(120.0)
+    assert all(limiter.check(1, "ask").allowed for _ in range(5))
+    assert not limiter.check(1, "ask").allowed
+    assert set(limiter.tracked()) == {"llm", "heavy", "notes", "default", "/ask_random"}
+
+
+def test_malformed_limit_is_skipped(monkeypatch, caplog):
+    """Тест: неразборчивый лимит в окружении пишется в лог и не мешает запуску"""
+    monkeypatch.setenv("RATE_LIMIT_CMD_FOO", "abc")
+    monkeypatch.setenv("RATE_LIMIT_CMD_BAR", "3/0")
+    monkeypatch.setenv("RATE_LIMIT_LLM", "пять/60")
+    limiter = RateLimiter()
+
+    assert set(limiter.tracked()) == {"llm", "heavy", "notes", "default"}
+    assert all(limiter.check(1, "ask").allowed for _ in range(5))
+    assert not limiter.check(1, "ask").allowed
+    assert "RATE_LIMIT_CMD_FOO" in caplog.text and "RATE_LIMIT_LLM" in caplog.text
+
+
+class TestRateLimitMiddleware:
+    """Тесты middleware ограничения частоты в main.py"""
+
+    def _message(self, text, user_id=12345):
+        message = Mock()
+        message.text = text
+        message.from_user.id = user_id
+        return message
+
+    @patch('main.bot.reply_to')
+    def test_throttled_command_is_cancelled(self, mock_reply, main_module, clock):
+        """Тест: превышение лимита отменяет обработку и предупреждает один раз"""
+        main = main_module
+        middleware = main.RateLimitMiddleware(RateLimiter({"llm": (1, 60)}, {"ask": "llm"}, clock=clock))
+
+        assert middleware.pre_process(self._message("/ask привет"), {}) is None
+        second = self._message("/ask@my_bot ещё")
+        assert isinstance(middleware.pre_process(second, {}), CancelUpdate)
+        assert isinstance(middleware.pre_process(self._message("/ask и ещё"), {}), CancelUpdate)
+
+        mock_reply.assert_called_once_with(second, "Слишком часто. Повторите через 61 с.")
+
+    @patch('main.bot.reply_to')
+    def test_plain_text_is_not_limited(self, mock_reply, main_module, clock):
+        """Тест: обычный текст (не команда) не проходит через лимитер"""
+        main = main_module
+        limiter = Mock()
+        middleware = main.RateLimitMiddleware(limiter)
+
+        assert middleware.pre_process(self._message("просто текст"), {}) is None
+        limiter.check.assert_not_called()
+
+    @patch('main.get_fallback_chain')
+    @patch('main.bot.reply_to')
+    def test_throttled_request_does_not_touch_db(self, mock_reply, mock_chain, main_module, clock):
+        """Тест: отказ обрабатывается без вызова обработчика и БД"""
+        main = main_module
+        middleware = main.RateLimitMiddleware(RateLimiter({"llm": (0, 60)}, {"ask": "llm"}, clock=clock))
+
+        with patch('db._connect') as mock_connect:
+            result = middleware.pre_process(self._message("/ask вопрос"), {})
+
+        assert isinstance(result, CancelUpdate)
+        mock_connect.assert_not_called()
+        mock_chain.assert_not_called()
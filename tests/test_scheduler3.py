@@ -0,0 +1,246 @@
+import sqlite3
+from datetime import date, datetime, timezone
+
+import pytest
+
+import db3
+from scheduler3 import DailyScheduler
+
+
+def _utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def users_db(tmp_path, monkeypatch):
+    """Фикстура: чистая база db3 без разброса внутри часа, пользователи заводятся 17.10.2026 в 15:00 UTC"""
+    monkeypatch.setattr(db3, "DB_PATH", str(tmp_path / "zodiac.db"))
+    monkeypatch.setattr(db3, "NOTIFY_SPREAD_S", 0)
+    monkeypatch.setattr(db3, "_utcnow", lambda: _utc(2026, 10, 17, 15, 0))
+    db3.init_db()
+    return db3
+
+
+def _add_user(db, user_id: int, hour: int = 9, tz: str = "Europe/Moscow", sign: str | None = "лев") -> None:
+    db.ensure_user(user_id)
+    if sign:
+        db.set_sign(user_id, sign)
+    db.set_timezone(user_id, tz)
+    db.set_notify_hour(user_id, hour)
+
+
+def _scheduler(sent: list, **kwargs) -> DailyScheduler:
+    return DailyScheduler(lambda user, day: sent.append((user["user_id"], day)), **kwargs)
+
+
+def test_next_fire_is_local_hour_in_utc(users_db):
+    """Тест: next_fire_utc — час пользователя по его поясу, с учётом перехода на летнее время"""
+    fire = users_db.next_fire_utc
+    moscow = fire(1, 9, "Europe/Moscow", _utc(2026, 10, 18, 0, 0))
+    assert moscow == _utc(2026, 10, 18, 6, 0).timestamp()
+    assert fire(1, 9, "Europe/Moscow", _utc(2026, 10, 18, 6, 0)) == moscow + 24 * 3600
+
+    # Нью-Йорк: 8 марта 2026 переход на летнее время, 9:00 — это 14:00, а затем 13:00 UTC
+    assert fire(1, 9, "America/New_York", _utc(2026, 3, 7, 15, 0)) == _utc(2026, 3, 8, 13, 0).timestamp()
+
+
+def test_spread_offset_is_stable_and_within_window(users_db, monkeypatch):
+    """Тест: сдвиг внутри часа постоянен для пользователя и не выходит за окно"""
+    monkeypatch.setattr(users_db, "NOTIFY_SPREAD_S", 3000)
+    base = _utc(2026, 10, 18, 6, 0).timestamp()
+    after = _utc(2026, 10, 18, 0, 0)
+
+    offsets = {uid: users_db.next_fire_utc(uid, 9, "Europe/Moscow", after) - base for uid in range(1, 200)}
+
+    assert all(0 <= o < 3000 for o in offsets.values())
+    assert len(set(offsets.values())) > 150
+    assert users_db.next_fire_utc(7, 9, "Europe/Moscow", after) - base == offsets[7]
+
+
+def test_users_fire_at_their_own_local_hour(users_db):
+    """Тест: каждый получает рассылку в свой час по своему поясу и за свою местную дату"""
+    _add_user(users_db, 1, 9, "Europe/Moscow")     # 06:00 UTC
+    _add_user(users_db, 2, 9, "Asia/Tokyo")        # 00:00 UTC
+    _add_user(users_db, 3, 9, "America/New_York")  # 13:00 UTC
+    sent = []
+    scheduler = _scheduler(sent)
+
+    wake = scheduler.run_pending(_utc(2026, 10, 18, 0, 0))
+    assert sent == [(2, date(2026, 10, 18))]
+    assert wake == _utc(2026, 10, 18, 0, 1)  # ближайший — Москва в 06:00, но не дольше минуты
+
+    scheduler.run_pending(_utc(2026, 10, 18, 6, 0))
+    scheduler.run_pending(_utc(2026, 10, 18, 13, 0))
+    assert [uid for uid, _ in sent] == [2, 1, 3]
+    assert users_db.get_user(2)["next_fire_utc"] == _utc(2026, 10, 19, 0, 0).timestamp()
+
+
+def test_due_query_is_single_index_range(users_db):
+    """Тест: выборка рассылки — диапазон по индексу next_fire_utc, без скана users"""
+    conn = sqlite3.connect(users_db.DB_PATH)
+    plan = " ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + users_db._DUE_USERS_SQL, (0,)))
+    conn.close()
+
+    assert "USING INDEX idx_users_next_fire (next_fire_utc<?)" in plan
+
+
+def test_downtime_is_caught_up_once(users_db):
+    """Тест: после трёх дней простоя пропущенное приходит одним сообщением за текущую дату"""
+    _add_user(users_db, 1, 9, "Europe/Moscow")
+    sent = []
+    scheduler = _scheduler(sent)
+
+    scheduler.run_pending(_utc(2026, 10, 21, 12, 0))
+    scheduler.run_pending(_utc(2026, 10, 21, 12, 5))
+
+    assert sent == [(1, date(2026, 10, 21))]
+    assert users_db.get_user(1)["next_fire_utc"] == _utc(2026, 10, 22, 6, 0).timestamp()
+
+
+def test_no_second_message_after_changing_hour(users_db, monkeypatch):
+    """Тест: получил сегодня, перенёс час на вечер — второго сообщения за день нет"""
+    _add_user(users_db, 1, 9, "Europe/Moscow")
+    sent = []
+    scheduler = _scheduler(sent)
+    scheduler.run_pending(_utc(2026, 10, 18, 6, 0))
+    users_db.record_deliveries("2026-10-18", [(1, "sent", None, None)])
+
+    monkeypatch.setattr(users_db, "_utcnow", lambda: _utc(2026, 10, 18, 6, 30))
+    users_db.set_notify_hour(1, 20)  # 20:00 по Москве сегодня — 17:00 UTC
+    scheduler.run_pending(_utc(2026, 10, 18, 17, 0))
+
+    assert len(sent) == 1
+    assert scheduler.stats()["skipped"] == 1
+
+
+def test_failed_delivery_is_skipped_until_tomorrow(users_db):
+    """Тест: failed — «пропущен за день»: сегодня повтора нет, завтра пользователь снова в рассылке"""
+    _add_user(users_db, 1, 9, "Europe/Moscow")
+    sent = []
+    scheduler = _scheduler(sent)
+    scheduler.run_pending(_utc(2026, 10, 18, 6, 0))
+    users_db.record_deliveries("2026-10-18", [(1, "failed", 400, "Bad Request: can't parse entities")])
+
+    scheduler.run_pending(_utc(2026, 10, 18, 20, 59))
+    assert sent == [(1, date(2026, 10, 18))]
+    assert users_db.get_user(1)["last_sent_date"] is None
+
+    scheduler.run_pending(_utc(2026, 10, 19, 6, 0))
+    assert sent == [(1, date(2026, 10, 18)), (1, date(2026, 10, 19))]
+
+
+def test_users_without_sign_are_moved_forward(users_db):
+    """Тест: подписчик без знака не получает сообщение, но и не застревает в начале диапазона"""
+    _add_user(users_db, 1, 9, "Europe/Moscow", sign=None)
+    sent = []
+    scheduler = _scheduler(sent)
+
+    scheduler.run_pending(_utc(2026, 10, 18, 6, 0))
+
+    assert sent == []
+    assert users_db.list_due_users(int(_utc(2026, 10, 18, 6, 0).timestamp())) == []
+
+
+def test_send_errors_do_not_stop_the_broadcast(users_db):
+    """Тест: ошибка отправки одному пользователю не мешает остальным"""
+    for uid in (1, 2):
+        _add_user(users_db, uid)
+    delivered = []
+
+    def send(user, day):
+        if user["user_id"] == 1:
+            raise RuntimeError("сбой")
+        delivered.append(user["user_id"])
+
+    scheduler = DailyScheduler(send)
+    scheduler.run_pending(_utc(2026, 10, 18, 6, 0))
+
+    assert delivered == [2]
+    assert scheduler.stats()["errors"] == 1
+
+
+def test_due_users_stream_in_chunks(users_db):
+    """Тест: iter_due_users отдаёт наступивших пачками, планировщик переносит их пачкой"""
+    for uid in range(1, 8):
+        _add_user(users_db, uid)
+    batches = []
+
+    def reschedule(updates):
+        batches.append(len(updates))
+        users_db.reschedule_users(updates)
+
+    scheduler = DailyScheduler(lambda user, day: None,
+                               iter_due=lambda now_ts: users_db.iter_due_users(now_ts, chunk_size=3),
+                               reschedule=reschedule)
+    scheduler.run_pending(_utc(2026, 10, 18, 6, 0))
+
+    assert batches == [3, 3, 1]
+
+
+def test_backlog_is_reported_per_chunk(users_db):
+    """Тест: планировщик сообщает, сколько наступивших осталось — в начале и после каждой пачки"""
+    for uid in range(1, 8):
+        _add_user(users_db, uid, sign=None if uid == 2 else "лев")
+    backlog = []
+
+    scheduler = DailyScheduler(lambda user, day: None,
+                               iter_due=lambda now_ts: users_db.iter_due_users(now_ts, chunk_size=3),
+                               on_backlog=backlog.append)
+    scheduler.run_pending(_utc(2026, 10, 18, 6, 0))
+
+    assert backlog == [7, 4, 1, 0]
+
+
+def test_due_count_is_index_range(users_db):
+    """Тест: подсчёт наступивших — тот же диапазон по idx_users_next_fire, без скана users"""
+    _add_user(users_db, 1)
+    conn = sqlite3.connect(users_db.DB_PATH)
+    plan = " ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + users_db._DUE_COUNT_SQL, (0,)))
+    conn.close()
+
+    assert "USING INDEX idx_users_next_fire (next_fire_utc<?)" in plan
+    assert users_db.count_due_users(int(_utc(2026, 10, 18, 6, 0).timestamp())) == 1
+
+
+def test_old_database_is_migrated(tmp_path, monkeypatch):
+    """Тест: база без часовых поясов получает tz и next_fire_utc, прежний индекс заменяется"""
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE users (user_id INTEGER PRIMARY KEY, sign TEXT, notify_hour INTEGER NOT NULL DEFAULT 9,
+                            subscribed INTEGER NOT NULL DEFAULT 1, last_sent_date TEXT,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE INDEX idx_users_due ON users(notify_hour, last_sent_date) WHERE subscribed=1;
+        INSERT INTO users(user_id, sign, notify_hour) VALUES (1, 'лев', 10);
+    """)
+    conn.close()
+    monkeypatch.setattr(db3, "DB_PATH", path)
+    monkeypatch.setattr(db3, "NOTIFY_SPREAD_S", 0)
+    monkeypatch.setattr(db3, "_utcnow", lambda: _utc(2026, 10, 18, 0, 0))
+
+    db3.init_db()
+
+    user = db3.get_user(1)
+    assert user["tz"] == db3.DEFAULT_TZ
+    assert user["next_fire_utc"] == db3.next_fire_utc(1, 10, db3.DEFAULT_TZ, _utc(2026, 10, 18, 0, 0))
+    with db3._connect() as conn:
+        indexes = {r["name"] for r in conn.execute("PRAGMA index_list(users)")}
+    assert "idx_users_next_fire" in indexes and "idx_users_due" not in indexes
+
+
+
+def test_new_user_gets_default_tz(users_db):
+    """Тест: пояс по умолчанию берётся из DEFAULT_TZ, а не из DEFAULT в схеме"""
+    users_db.ensure_user(1)
+
+    assert users_db.get_user(1)["tz"] == users_db.DEFAULT_TZ
+    with users_db._connect() as conn:
+        column = next(r for r in conn.execute("PRAGMA table_info(users)") if r["name"] == "tz")
+    assert column["dflt_value"] is None
+
+
+@pytest.mark.parametrize("name", ["Mars/Olympus_Mons", "Europe/Moscow' DEFAULT 'x", ""])
+def test_invalid_default_tz_is_rejected(name):
+    """Тест: неизвестный или подозрительный DEFAULT_TZ останавливает запуск"""
+    with pytest.raises(ValueError):
+        db3._zone_name(name)
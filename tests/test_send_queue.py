@@ -0,0 +1,233 @@
+import threading
+import time
+
+import pytest
+import requests
+from unittest.mock import patch
+from telebot.apihelper import ApiTelegramException
+
+from send_queue import SendQueue, QueuedTeleBot, is_transient, retry_after
+
+
+def _too_many_requests(seconds: int) -> ApiTelegramException:
+    body = {"ok": False, "error_code": 429, "description": "Too Many Requests",
+            "parameters": {"retry_after": seconds}}
+    return ApiTelegramException("sendMessage", None, body)
+
+
+@pytest.fixture
+def make_queue():
+    """Фикстура: SendQueue, которая закрывается после теста"""
+    queues = []
+
+    def make(**kwargs):
+        q = SendQueue(**kwargs)
+        queues.append(q)
+        return q
+
+    yield make
+    for q in queues:
+        q.close(drain_timeout_s=1)
+
+
+def test_retry_after_is_read_from_429():
+    """Тест: retry_after берётся из parameters ответа 429, прочие ошибки — не 429"""
+    assert retry_after(_too_many_requests(7)) == 7
+    assert retry_after(RuntimeError("сеть")) is None
+
+
+def test_submit_does_not_block_and_returns_result(make_queue):
+    """Тест: submit сразу возвращает Future, результат вызова приходит в нём"""
+    q = make_queue()
+    release = threading.Event()
+
+    t0 = time.monotonic()
+    future = q.submit(1, lambda: release.wait(5) and "ok")
+    assert time.monotonic() - t0 < 0.1
+    release.set()
+
+    assert future.result(5) == "ok"
+
+
+def test_messages_in_one_chat_keep_order_and_rate(make_queue):
+    """Тест: в один чат — по порядку и не чаще chat_per_s"""
+    q = make_queue(chat_per_s=5)
+    sent = []
+
+    futures = [q.submit(42, lambda i=i: sent.append((i, time.monotonic()))) for i in range(7)]
+    for f in futures:
+        f.result(5)
+
+    assert [i for i, _ in sent] == list(range(7))
+    # первые 5 — из полного ведра, дальше по одному в 0.2 с
+    assert sent[6][1] - sent[0][1] >= 0.3
+
+
+def test_global_limit_spans_chats(make_queue):
+    """Тест: общий лимит ограничивает отправку во все чаты вместе"""
+    q = make_queue(global_per_s=5, chat_per_s=100)
+    t0 = time.monotonic()
+
+    futures = [q.submit(chat_id, lambda: None) for chat_id in range(1, 9)]
+    for f in futures:
+        f.result(5)
+
+    assert time.monotonic() - t0 >= 0.5  # 5 сразу, ещё 3 по 0.2 с
+
+
+def test_group_per_minute_limit(make_queue):
+    """Тест: группам действует лимит в минуту, личным чатам — нет"""
+    q = make_queue(chat_per_s=100, group_per_min=2)
+
+    group = [q.submit(-100, lambda: None) for _ in range(3)]
+    private = [q.submit(100, lambda: None) for _ in range(3)]
+    for f in private + group[:2]:
+        f.result(2)
+
+    assert not group[2].done()
+    assert q.stats()["pending"] == 1
+
+
+def test_429_pauses_and_retries(make_queue):
+    """Тест: 429 не теряет сообщение — после retry_after оно уходит повторно, первым в чате"""
+    q = make_queue()
+    calls = []
+
+    def flaky():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise _too_many_requests(1)
+        return "доставлено"
+
+    first = q.submit(1, flaky)
+    second = q.submit(1, lambda: calls.append("второе"))
+
+    assert first.result(5) == "доставлено"
+    second.result(5)
+    assert calls[1] - calls[0] >= 1.0
+    assert calls[2] == "второе"
+    assert q.stats()["retried_429"] == 1
+
+
+def test_permanent_errors_reach_the_caller(make_queue):
+    """Тест: ошибка, отличная от 429, сразу приходит в Future"""
+    q = make_queue()
+
+    def blocked():
+        raise ApiTelegramException("sendMessage", None, {"error_code": 403, "description": "Forbidden"})
+
+    with pytest.raises(ApiTelegramException):
+        q.submit(1, blocked).result(5)
+    assert q.stats()["failed"] == 1
+
+
+def test_stats_show_lag(make_queue):
+    """Тест: метрики показывают, сколько сообщения ждали в очереди"""
+    q = make_queue(chat_per_s=2)
+    futures = [q.submit(1, lambda: None) for _ in range(4)]
+    for f in futures:
+        f.result(5)
+
+    stats = q.stats()
+    assert stats["sent"] == 4 and stats["pending"] == 0 and stats["in_flight"] == 0
+    assert stats["lag_ms_max"] >= 400
+
+
+def test_queued_bot_sends_through_outbox(make_queue):
+    """Тест: send_message бота идёт через очередь, nowait возвращает Future"""
+    bot = QueuedTeleBot("123:abc", outbox=make_queue())
+
+    with patch("telebot.TeleBot.send_message", return_value="msg") as send:
+        assert bot.send_message(5, "привет") == "msg"
+        assert bot.send_message_nowait(5, "ещё", parse_mode="Markdown").result(5) == "msg"
+
+    assert send.call_args_list[0][0] == (5, "привет")
+    assert send.call_args_list[1][1] == {"parse_mode": "Markdown"}
+    assert bot.outbox.stats()["sent"] == 2
+
+
+def test_transient_errors_are_retried_with_backoff(make_queue):
+    """Тест: 5xx и обрыв соединения повторяются через паузу, ReadTimeout — нет (возможен дубль)"""
+    q = make_queue()
+    calls = []
+
+    def flaky():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise ApiTelegramException("sendMessage", None, {"error_code": 502, "description": "Bad Gateway"})
+        if len(calls) == 2:
+            raise requests.exceptions.ConnectionError("reset")
+        return "доставлено"
+
+    assert q.submit(1, flaky).result(10) == "доставлено"
+    assert calls[2] - calls[1] >= 2.0  # паузы 1 с, затем 2 с
+    assert q.stats()["retried_transient"] == 2
+
+    def timeout():
+        raise requests.exceptions.ReadTimeout("read timed out")
+
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        q.submit(2, timeout).result(5)
+    assert not is_transient(requests.exceptions.ReadTimeout())
+
+
+def test_global_limit_does_not_rescan_queued_chats(make_queue):
+    """Тест: когда упираемся в общий лимит, диспетчер ждёт его, а не перебирает все чаты на каждое сообщение"""
+    q = make_queue(global_per_s=100, chat_per_s=100)
+    chats = 300
+
+    # каждая проверка головы очереди спрашивает бакет чата — считаем итерации диспетчера по нему
+    with patch.object(q._chat, "delay", wraps=q._chat.delay) as chat_delay:
+        futures = [q.submit(chat_id, lambda: None) for chat_id in range(1, chats + 1)]
+        for f in futures:
+            f.result(10)
+
+    assert chat_delay.call_count <= 2 * chats
+
+
+def test_other_chat_sends_go_through_outbox(make_queue):
+    """Тест: send_document и send_chat_action идут через очередь, answer_callback_query — напрямую"""
+    bot = QueuedTeleBot("123:abc", outbox=make_queue())
+
+    with patch("telebot.TeleBot.send_document", return_value="doc") as send_document, \
+            patch("telebot.TeleBot.send_chat_action", return_value=True), \
+            patch("telebot.TeleBot.answer_callback_query", return_value=True):
+        assert bot.send_document(5, b"data", caption="заметки") == "doc"
+        assert bot.send_chat_action(5, "typing") is True
+        assert bot.answer_callback_query("cb-1") is True
+
+    assert send_document.call_args[0] == (5, b"data")
+    assert bot.outbox.stats()["enqueued"] == 2
+
+
+def test_chat_action_does_not_spend_message_limit(make_queue):
+    """Тест: chat action не тратит лимит чата — сообщение после него уходит сразу"""
+    q = make_queue(chat_per_s=1)
+    t0 = time.monotonic()
+
+    q.submit_action(7, lambda: None).result(5)
+    q.submit(7, lambda: None).result(5)
+
+    assert time.monotonic() - t0 < 0.5
+
+
+def test_retry_after_close_fails_the_future(make_queue):
+    """Тест: попытка, упавшая уже после close(), не повторяется, а завершает Future ошибкой"""
+    q = make_queue()
+    started, release = threading.Event(), threading.Event()
+
+    def flaky():
+        started.set()
+        release.wait(5)
+        raise ApiTelegramException("sendMessage", None, {"error_code": 502, "description": "Bad Gateway"})
+
+    future = q.submit(1, flaky)
+    started.wait(5)
+    closer = threading.Thread(target=q.close, kwargs={"drain_timeout_s": 0.1})
+    closer.start()
+    closer.join(2)
+    release.set()
+
+    with pytest.raises(ApiTelegramException):
+        future.result(5)
+    assert q.stats()["failed"] == 1 and q.stats()["retried_transient"] == 0
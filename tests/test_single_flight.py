@@ -0,0 +1,110 @@
+import threading
+
+import pytest
+
+
+def _run_concurrently(n, fn):
+    """Запускает fn в n потоках одновременно, возвращает результаты/исключения"""
+    barrier = threading.Barrier(n)
+    results = [None] * n
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = fn()
+        except Exception as e:  # noqa: BLE001 — проверяем, что ошибка дошла до каждого
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+    return results
+
+
+def test_identical_calls_share_one_request(openrouter_module, fake_openrouter):
+    """Тест: одновременные одинаковые chat_once делают один запрос к модели"""
+    openrouter = openrouter_module
+    fake_openrouter.delay_s = 0.3
+    before = openrouter.single_flight_stats()
+    messages = [{"role": "user", "content": "Популярный вопрос"}]
+
+    results = _run_concurrently(5, lambda: openrouter.chat_once(messages, model="m", use_cache=False))
+
+    assert len(fake_openrouter.requests) == 1
+    assert {r[0] for r in results} == {"Ответ модели m: Популярный вопрос"}
+    after = openrouter.single_flight_stats()
+    assert after["leaders"] - before["leaders"] == 1
+    assert after["collapsed"] - before["collapsed"] == 4
+    assert after["in_flight"] == 0
+
+
+def test_different_calls_are_not_collapsed(openrouter_module, fake_openrouter):
+    """Тест: разные вопросы идут к модели отдельно"""
+    openrouter = openrouter_module
+    fake_openrouter.delay_s = 0.1
+    counter = iter(range(100))
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            i = next(counter)
+        return openrouter.chat_once([{"role": "user", "content": f"вопрос {i}"}], model="m")
+
+    _run_concurrently(3, call)
+
+    assert len(fake_openrouter.requests) == 3
+
+
+def test_error_reaches_every_waiter(openrouter_module, fake_openrouter):
+    """Тест: ошибка единственного запроса получают все ожидающие"""
+    openrouter = openrouter_module
+    fake_openrouter.delay_s = 0.3
+    fake_openrouter.statuses = [502]
+    messages = [{"role": "user", "content": "?"}]
+
+    no_retry = openrouter.RetryPolicy(max_attempts=1)
+
+    results = _run_concurrently(4, lambda: openrouter.chat_once(messages, model="m", retry=no_retry))
+
+    assert len(fake_openrouter.requests) == 1
+    assert all(isinstance(r, openrouter.OpenRouterError) and r.status == 502 for r in results)
+    # полёт завершён: следующий вызов снова идёт к модели и получает ответ
+    assert openrouter.chat_once(messages, model="m")[0] == "Ответ модели m: ?"
+
+
+def test_stream_followers_receive_leader_deltas(openrouter_module, fake_openrouter):
+    """Тест: ведомые потоки получают те же куски, что и лидер"""
+    openrouter = openrouter_module
+    fake_openrouter.delay_s = 0.2
+    fake_openrouter.token_delay_s = 0.01
+    messages = [{"role": "user", "content": "раз два три"}]
+
+    def call():
+        stream = openrouter.chat_stream(messages, model="m", use_cache=False)
+        return "".join(stream), stream.latency
+
+    results = _run_concurrently(3, call)
+
+    assert len(fake_openrouter.requests) == 1
+    assert {r[0] for r in results} == {"Ответ модели m: раз два три"}
+    assert all(isinstance(r[1], int) for r in results)
+
+
+def test_abandoned_leader_releases_followers(openrouter_module):
+    """Тест: если лидер бросил поток, ведомые получают ошибку, а не зависают"""
+    openrouter = openrouter_module
+    flight, leader = openrouter._single_flight.join("k")
+    follower, is_leader = openrouter._single_flight.join("k")
+    assert leader and not is_leader and follower is flight
+
+    flight.publish("начало")
+    flight.finish(error=openrouter._aborted())
+    openrouter._single_flight.leave("k", flight)
+
+    chunks = flight.follow()
+    assert next(chunks) == "начало"
+    with pytest.raises(openrouter.OpenRouterError):
+        next(chunks)
+    assert openrouter._single_flight.in_flight() == 0
@@ -0,0 +1,137 @@
+import json
+import threading
+
+import pytest
+import requests
+
+from webhook import WebhookServer, SECRET_HEADER
+
+SECRET = "s3cret-token"
+
+
+def _update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "u"},
+            "text": f"/start {update_id}",
+        },
+    }
+
+
+@pytest.fixture
+def make_server():
+    """Фикстура: WebhookServer на свободном порту, останавливается после теста"""
+    servers = []
+
+    def make(process, **kwargs):
+        server = WebhookServer(process, SECRET, host="127.0.0.1", port=0, path="/hook", **kwargs).start()
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.stop(drain_timeout_s=5)
+
+
+def _post(server, body, secret=SECRET, path="/hook"):
+    host, port = server.address
+    headers = {SECRET_HEADER: secret} if secret is not None else {}
+    return requests.post(f"http://{host}:{port}{path}", data=json.dumps(body), headers=headers, timeout=5)
+
+
+def test_update_is_acked_and_processed(make_server):
+    """Тест: обновление подтверждается 200 и доходит до обработчика"""
+    received = []
+    done = threading.Event()
+
+    def process(updates):
+        received.extend(u.update_id for u in updates)
+        done.set()
+
+    server = make_server(process)
+    assert _post(server, _update(7)).status_code == 200
+    assert done.wait(5)
+    assert received == [7]
+
+
+@pytest.mark.parametrize("secret", [None, "wrong"])
+def test_wrong_secret_is_rejected(make_server, secret):
+    """Тест: запрос без секрета или с чужим секретом отклоняется и не обрабатывается"""
+    process = []
+    server = make_server(process.append)
+
+    assert _post(server, _update(1), secret=secret).status_code == 403
+    assert server.stats()["forbidden"] == 1
+    assert process == []
+
+
+def test_unknown_path_and_malformed_body(make_server):
+    """Тест: чужой путь — 404, битое тело — 400"""
+    server = make_server(lambda updates: None)
+
+    assert _post(server, _update(1), path="/other").status_code == 404
+    host, port = server.address
+    r = requests.post(f"http://{host}:{port}/hook", data="{не json", headers={SECRET_HEADER: SECRET}, timeout=5)
+    assert r.status_code == 400
+
+
+def test_full_queue_answers_503(make_server):
+    """Тест: сверх глубины очереди вебхук отвечает 503, чтобы Telegram повторил доставку"""
+    release = threading.Event()
+    started = threading.Event()
+
+    def process(updates):
+        started.set()
+        release.wait(5)
+
+    server = make_server(process, queue_depth=2, workers=1)
+    assert _post(server, _update(1)).status_code == 200
+    assert started.wait(5)  # первое обновление занято в обработчике
+    statuses = [_post(server, _update(i)).status_code for i in range(2, 5)]
+    release.set()
+
+    assert statuses == [200, 200, 503]
+    assert server.stats()["overflow"] == 1
+
+
+def test_stop_drains_accepted_updates(make_server):
+    """Тест: при остановке уже принятые обновления дорабатываются, новые не принимаются"""
+    release = threading.Event()
+    processed = []
+
+    def process(updates):
+        release.wait(5)
+        processed.extend(u.update_id for u in updates)
+
+    server = WebhookServer(process, SECRET, host="127.0.0.1", port=0, path="/hook", workers=1).start()
+    for i in range(3):
+        assert _post(server, _update(i)).status_code == 200
+
+    threading.Timer(0.2, release.set).start()
+    assert server.stop(drain_timeout_s=5)
+
+    assert sorted(processed) == [0, 1, 2]
+    assert server.stats()["depth"] == 0
+    with pytest.raises(requests.ConnectionError):
+        _post(server, _update(9))
+
+
+def test_handler_errors_do_not_stop_workers(make_server):
+    """Тест: исключение в обработчике считается, а пул продолжает работу"""
+    done = threading.Event()
+
+    def process(updates):
+        if updates[0].update_id == 1:
+            raise RuntimeError("сбой")
+        done.set()
+
+    server = make_server(process, workers=1)
+    _post(server, _update(1))
+    _post(server, _update(2))
+
+    assert done.wait(5)
+    assert server.stats()["errors"] == 1
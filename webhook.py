@@ -0,0 +1,175 @@
+"""
+webhook.py — приём обновлений Telegram через webhook вместо long polling.
+
+HTTP-сервер на стандартной библиотеке: проверяет секрет из заголовка
+X-Telegram-Bot-Api-Secret-Token, сразу отвечает 200 и кладёт обновление в
+ограниченную очередь, которую разбирает пул обработчиков. Переполненная очередь
+отвечает 503 — Telegram повторит доставку позже, а бот не копит работу без предела.
+При остановке сервер перестаёт принимать запросы и дорабатывает то, что уже принял.
+
+Режим выбирается переменной BOT_MODE=webhook (по умолчанию polling), остальное:
+    WEBHOOK_URL          публичный адрес, который получит Telegram (без него — polling)
+    WEBHOOK_SECRET       секрет для заголовка; если не задан, генерируется при запуске
+    WEBHOOK_HOST/PORT    где слушать (0.0.0.0:8443)
+    WEBHOOK_QUEUE_DEPTH  сколько принятых обновлений может ждать обработки (100)
+    WEBHOOK_WORKERS      потоков-обработчиков (4; main.py берёт один и отдаёт обновления в ChatLanes)
+    WEBHOOK_DRAIN_S      сколько ждать доработки очереди при остановке (30)
+"""
+
+from __future__ import annotations
+import hmac
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List
+from urllib.parse import urlsplit
+
+from telebot import types
+
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_QUEUE_DEPTH = int(os.getenv("WEBHOOK_QUEUE_DEPTH", "100"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_DRAIN_S = float(os.getenv("WEBHOOK_DRAIN_S", "30"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+MAX_BODY_BYTES = 1 << 20  # обновление Telegram на порядки меньше
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def log_message(self, format, *args):  # noqa: A002 — сигнатура базового класса
+        pass
+
+    def do_POST(self):
+        webhook = self.server.webhook
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True  # тело не читаем — соединение дальше не годится
+            self._reply(413)
+            return
+        body = self.rfile.read(length)
+        if urlsplit(self.path).path != webhook.path:
+            self._reply(404)
+            return
+        if not hmac.compare_digest(self.headers.get(SECRET_HEADER, ""), webhook.secret_token):
+            webhook.count("forbidden")
+            self._reply(403)
+            return
+        try:
+            update = types.Update.de_json(json.loads(body))
+        except (ValueError, TypeError, KeyError):
+            webhook.count("malformed")
+            self._reply(400)
+            return
+        self._reply(200 if webhook.submit(update) else 503)
+
+    def _reply(self, status: int) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    webhook: "WebhookServer"
+
+
+class WebhookServer:
+    """
+    Принимает обновления по HTTP и передаёт их в process пачками по одному
+    (обычно bot.process_new_updates) из workers потоков. queue_depth — сколько
+    принятых, но ещё не обработанных обновлений допускается; сверх этого 503.
+    """
+
+    def __init__(self, process: Callable[[List[types.Update]], None], secret_token: str,
+                 host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT, path: str = "/",
+                 queue_depth: int = WEBHOOK_QUEUE_DEPTH, workers: int = WEBHOOK_WORKERS):
+        self.process = process
+        self.secret_token = secret_token
+        self.path = path or "/"
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_depth)
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {"accepted": 0, "overflow": 0, "forbidden": 0, "malformed": 0, "processed": 0, "errors": 0}
+        self._server = _Server((host, port), _Handler)
+        self._server.webhook = self
+        self._workers = [threading.Thread(target=self._work, name=f"webhook-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        self._http_thread: threading.Thread | None = None
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self._server.server_address[:2]
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def submit(self, update: types.Update) -> bool:
+        """Ставит обновление в очередь; False — очередь полна или сервер останавливается."""
+        with self._lock:
+            # под той же блокировкой, что и _stopping.set(): после остановки в очередь ничего не попадёт
+            try:
+                if self._stopping.is_set():
+                    raise queue.Full
+                self._queue.put_nowait(update)
+            except queue.Full:
+                self._stats["overflow"] += 1
+                return False
+            self._stats["accepted"] += 1
+            return True
+
+    def _work(self) -> None:
+        while True:
+            try:
+                update = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            try:
+                self.process([update])
+                self.count("processed")
+            except Exception as e:
+                self.count("errors")
+                print(f"Ошибка обработки обновления {update.update_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def start(self) -> "WebhookServer":
+        for worker in self._workers:
+            worker.start()
+        self._http_thread = threading.Thread(target=self._server.serve_forever, name="webhook-http", daemon=True)
+        self._http_thread.start()
+        return self
+
+    def stop(self, drain_timeout_s: float = WEBHOOK_DRAIN_S) -> bool:
+        """
+        Перестаёт принимать запросы и ждёт, пока пул доработает принятые обновления.
+        True — очередь разобрана полностью, False — не уложились в drain_timeout_s.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            self._stopping.set()
+        deadline = time.monotonic() + drain_timeout_s
+        for worker in self._workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+        drained = not any(w.is_alive() for w in self._workers)
+        if not drained:
+            print(f"Не дождались обработки {self._queue.qsize()} обновлений за {drain_timeout_s} с")
+        return drained
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, depth=self._queue.qsize())
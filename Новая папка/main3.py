@@ -4,45 +4,47 @@ main.py — DailyZodiakBot (развлекательный контент без
 Команды:
   /start                  — регистрация, выбор знака и часа
   /set_sign <знак>        — установить знак (или нажать кнопку с названием)
-  /set_time <0..23>       — час утра/дня для рассылки (по времени сервера)
+  /set_time <0..23>       — час рассылки по своему часовому поясу
+  /set_tz <пояс>          — часовой пояс IANA, например Europe/Moscow или Asia/Yekaterinburg
   /subscribe              — включить подписку
   /unsubscribe            — выключить подписку
   /me                     — мои настройки
   /today                  — выслать «гороскоп дня» прямо сейчас
   /signs                  — показать список знаков
 
-Рассылка:
-  - фоновый поток проверяет раз в минуту: кому отправить сейчас;
-  - условие: subscribed=1, notify_hour == now.hour, last_sent_date != today.
+Рассылка (scheduler3.DailyScheduler):
+  - у каждого подписчика хранится next_fire_utc — его час по его часовому поясу
+    (со сдвигом внутри часа, чтобы не слать всем разом);
+  - фоновый поток спит до ближайшего next_fire_utc, наступивших читает пачками по индексу
+    и переносит им next_fire_utc на следующие сутки; пропущенное за время простоя догоняется.
+Доставка (broadcast3.Broadcaster):
+  - сообщения идут через очередь отправки с лимитами Telegram, временные сбои повторяются;
+  - отправка отмечается только после доставки; заблокировавшие бота и удалённые чаты
+    попадают в dead_letters и отписываются (снова подписаться — /subscribe).
 """
 
 from __future__ import annotations
 import logging
 import threading
-import time
-import hashlib
-from datetime import datetime, date
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
 
-import telebot
 from telebot import types
 
 import db3 as db
 from config3 import TOKEN, DEFAULT_NOTIFY_HOUR
+from send_queue import QueuedTeleBot
+from scheduler3 import DailyScheduler
+from broadcast3 import Broadcaster
+from horoscope3 import CANON_SIGNS, SIGN_EMOJI, DailyTexts
 
 log = logging.getLogger(__name__)
 
-bot = telebot.TeleBot(TOKEN)
+# ответы и рассылка идут через общую очередь отправки с лимитами Telegram
+bot = QueuedTeleBot(TOKEN)
 db.init_db()  # создаём схемы, если их нет
 
-# ---------- справочник знаков: канон, синонимы, эмодзи ----------
-CANON_SIGNS = [
-    "овен", "телец", "близнецы", "рак", "лев", "дева",
-    "весы", "скорпион", "стрелец", "козерог", "водолей", "рыбы"
-]
-SIGN_EMOJI = {
-    "овен":"♈", "телец":"♉", "близнецы":"♊", "рак":"♋", "лев":"♌", "дева":"♍",
-    "весы":"♎", "скорпион":"♏", "стрелец":"♐", "козерог":"♑", "водолей":"♒", "рыбы":"♓"
-}
+# ---------- справочник знаков: канон (CANON_SIGNS, SIGN_EMOJI — в horoscope3), синонимы ----------
 # Примитивные англ. синонимы — чтобы не спотыкались:
 SIGN_ALIASES = {
     "aries":"овен", "taurus":"телец", "gemini":"близнецы", "cancer":"рак", "leo":"лев", "virgo":"дева",
@@ -72,49 +74,8 @@ def sign_keyboard() -> types.ReplyKeyboardMarkup:
 # Используем ReplyKeyboard для быстрого выбора (паттерн из занятий по кнопкам) [oai_citation:7‡L2_Текст к лекции.pdf](file-service://file-6kQEVmhZuKhD1nBDo1XNnq)
 
 
-# ---------- генерация «гороскопа» без API (детерминированно на (sign, date)) ----------
-INTRO = [
-    "Сегодня вас ждёт", "День сулит", "Утро принесёт", "В первой половине дня вероятно",
-    "Хорошее время для", "Подходящий момент для"
-]
-FOCUS = ["работы", "личных дел", "общения", "обучения", "творчества", "маленьких поездок"]
-ADVICE = [
-    "действуйте спокойно и без спешки", "обратите внимание на детали", "держите курс и не отвлекайтесь",
-    "не спорьте из принципа", "подумайте о пользе привычек", "не бойтесь попросить помощи"
-]
-LUCK = [
-    "удача на вашей стороне", "окружающие настроены дружелюбно", "случай поможет тем, кто готов",
-    "небольшой риск себя оправдает", "поддержка придёт вовремя", "день подойдёт для новых начал"
-]
-COLOR = ["синий", "зелёный", "жёлтый", "красный", "фиолетовый", "белый", "оранжевый"]
-NUMBER = [3, 4, 5, 6, 7, 8, 9]
-
-def _pick(seq: list, seed: bytes, salt: str) -> str:
-    h = hashlib.md5(seed + salt.encode("utf-8")).hexdigest()
-    idx = int(h, 16) % len(seq)
-    return str(seq[idx])
-
-def make_daily_text(sign: str, for_date: date) -> str:
-    """
-    Генерирует 3–4 коротких фразы и пару «фишек» (цвет, число).
-    Детерминированно для (sign, date) — без внешних API.
-    """
-    iso = for_date.isoformat().encode("utf-8")
-    sgn = sign.encode("utf-8")
-    intro = _pick(INTRO, sgn+iso, ":intro")
-    focus = _pick(FOCUS, sgn+iso, ":focus")
-    advice = _pick(ADVICE, sgn+iso, ":advice")
-    luck = _pick(LUCK, sgn+iso, ":luck")
-    color = _pick(COLOR, sgn+iso, ":color")
-    number = _pick(NUMBER, sgn+iso, ":num")
-
-    emoji = SIGN_EMOJI.get(sign, "")
-    return (
-        f"{emoji} *{sign.capitalize()}* — {for_date.strftime('%Y-%m-%d')}\n"
-        f"{intro} акцент на *{focus}*; {luck}. Советы: {advice}.\n\n"
-        f"Счастливый цвет: *{color}*, число дня: *{number}*.\n"
-        f"_Развлекательный контент._"
-    )
+# ---------- тексты гороскопа: horoscope3.make_daily_text, кэш на (знак, дата) ----------
+daily_texts = DailyTexts()
 
 
 # ---------- вспомогательные утилиты ----------
@@ -129,6 +90,16 @@ def parse_hour(token: str) -> int | None:
     except Exception:
         return None
 
+def parse_timezone(token: str) -> str | None:
+    # «UTC» и имена IANA вида Europe/Moscow; регистр первой буквы не важен (europe/moscow, utc)
+    name = "/".join(part[:1].upper() + part[1:] for part in token.strip().split("/"))
+    for candidate in (token.strip(), name, name.upper()):
+        try:
+            return ZoneInfo(candidate).key
+        except Exception:
+            continue
+    return None
+
 
 # ---------- команды ----------
 @bot.message_handler(commands=["start", "help"])
@@ -138,7 +109,8 @@ def cmd_start(message: types.Message) -> None:
         "Привет! Я пришлю *гороскоп дня* без всяких API — для настроения.\n\n"
         "Сначала выбери знак и час отправки:\n"
         "• /set_sign <знак>  или нажми кнопку со знаком\n"
-        "• /set_time <0..23> час (по времени сервера)\n\n"
+        "• /set_time <0..23> час (по твоему часовому поясу)\n"
+        "• /set_tz <пояс> часовой пояс, например Europe/Moscow\n\n"
         "Полезное:\n"
         "• /today — прислать на сегодня\n"
         "• /subscribe и /unsubscribe\n"
@@ -178,7 +150,21 @@ def cmd_set_time(message: types.Message) -> None:
         return
     db.ensure_user(message.from_user.id)
     db.set_notify_hour(message.from_user.id, hour)
-    bot.reply_to(message, f"Час отправки сохранён: {hour}:00")
+    row = db.get_user(message.from_user.id)
+    bot.reply_to(message, f"Час отправки сохранён: {hour}:00 ({row['tz']})")
+
+
+@bot.message_handler(commands=["set_tz"])
+def cmd_set_tz(message: types.Message) -> None:
+    parts = message.text.split(maxsplit=1)
+    tz = parse_timezone(parts[1]) if len(parts) == 2 else None
+    if tz is None:
+        bot.reply_to(message, "Формат: /set_tz <часовой пояс>  (например: /set_tz Europe/Moscow)")
+        return
+    db.ensure_user(message.from_user.id)
+    db.set_timezone(message.from_user.id, tz)
+    local_now = datetime.now(ZoneInfo(tz)).strftime("%H:%M")
+    bot.reply_to(message, f"Часовой пояс сохранён: {tz} (сейчас там {local_now})")
 
 
 @bot.message_handler(commands=["subscribe"])
@@ -199,14 +185,14 @@ def cmd_unsubscribe(message: types.Message) -> None:
 def cmd_me(message: types.Message) -> None:
     row = db.get_user(message.from_user.id)
     if not row:
-        bot.reply_to(message, "Ещё не настроено. Используй /set_sign и /set_time.")
+        bot.reply_to(message, "Ещё не настроено. Используй /set_sign, /set_time и /set_tz.")
         return
     sign = row["sign"] or "не задан"
     hour = row["notify_hour"]
     sub = "включена" if row["subscribed"] else "выключена"
     bot.reply_to(
         message,
-        f"Мои настройки:\nЗнак: {sign}\nЧас: {hour}:00\nПодписка: {sub}"
+        f"Мои настройки:\nЗнак: {sign}\nЧас: {hour}:00\nЧасовой пояс: {row['tz']}\nПодписка: {sub}"
     )
 
 
@@ -217,7 +203,7 @@ def cmd_today(message: types.Message) -> None:
     if not row or not row["sign"]:
         bot.reply_to(message, "Сначала /set_sign <знак>.")
         return
-    txt = make_daily_text(row["sign"], date.today())
+    txt = daily_texts.get(row["sign"], db.local_date(row["tz"], datetime.now().astimezone()))
     bot.send_message(message.chat.id, txt, parse_mode="Markdown")
 
 
@@ -231,31 +217,22 @@ def kb_pick_sign(message: types.Message) -> None:
 
 
 # ---------- планировщик ежедневной отправки ----------
-def scheduler_loop() -> None:
-    log.info("Scheduler started")
-    while True:
-        now = datetime.now()               # время сервера
-        today_str = now.strftime("%Y-%m-%d")
-        hour = now.hour
-        try:
-            due = db.list_due_users(today_str, hour)
-            for u in due:
-                # Сгенерировать текст и отправить:
-                txt = make_daily_text(u["sign"], now.date())
-                try:
-                    bot.send_message(u["user_id"], txt, parse_mode="Markdown")
-                except Exception as e:
-                    log.warning("Send failed to %s: %r", u["user_id"], e)
-                # Отметить отправку за сегодня:
-                db.mark_sent_today(u["user_id"], today_str)
-        except Exception as e:
-            log.exception("Scheduler error: %r", e)
-        time.sleep(60)  # проверяем раз в минуту
-
-
-def start_scheduler() -> None:
-    t = threading.Thread(target=scheduler_loop, name="daily-scheduler", daemon=True)
+broadcaster = Broadcaster(lambda chat_id, text: bot.send_message_nowait(chat_id, text, parse_mode="Markdown"))
+
+
+def send_daily(user: dict, for_date: date) -> None:
+    # ставим в очередь отправки и не ждём: итог доставки запишет broadcaster
+    broadcaster.submit(user["user_id"], daily_texts.get(user["sign"], for_date), for_date)
+
+
+scheduler = DailyScheduler(send_daily, on_new_day=daily_texts.warm_ahead, on_backlog=broadcaster.set_backlog)
+scheduler_stop = threading.Event()
+
+
+def start_scheduler() -> threading.Thread:
+    t = threading.Thread(target=scheduler.run, args=(scheduler_stop,), name="daily-scheduler", daemon=True)
     t.start()
+    return t
 
 
 # ---------- меню команд в клиенте (см. Л2) ----------
@@ -264,6 +241,7 @@ def setup_bot_commands() -> None:
         types.BotCommand("start", "Начало и помощь"),
         types.BotCommand("set_sign", "Установить знак зодиака"),
         types.BotCommand("set_time", "Установить час отправки"),
+        types.BotCommand("set_tz", "Установить часовой пояс"),
         types.BotCommand("today", "Прислать на сегодня"),
         types.BotCommand("subscribe", "Включить подписку"),
         types.BotCommand("unsubscribe", "Выключить подписку"),
@@ -276,5 +254,12 @@ def setup_bot_commands() -> None:
 # ---------- точка входа ----------
 if __name__ == "__main__":
     setup_bot_commands()        # удобство для пользователей [oai_citation:8‡L2_Текст к лекции.pdf](file-service://file-6kQEVmhZuKhD1nBDo1XNnq)
-    start_scheduler()           # запускаем фоновую проверку
-    bot.infinity_polling(skip_pending=True)  # запуск long polling (паттерн Л2/Л3) [oai_citation:9‡L2_Текст к лекции.pdf](file-service://file-6kQEVmhZuKhD1nBDo1XNnq) [oai_citation:10‡L3.pdf](file-service://file-TzQZFVK22mksuAGPBby5ME)
+    scheduler_thread = start_scheduler()  # запускаем фоновую проверку
+    try:
+        bot.infinity_polling(skip_pending=True)  # запуск long polling (паттерн Л2/Л3) [oai_citation:9‡L2_Текст к лекции.pdf](file-service://file-6kQEVmhZuKhD1nBDo1XNnq) [oai_citation:10‡L3.pdf](file-service://file-TzQZFVK22mksuAGPBby5ME)
+    finally:
+        scheduler_stop.set()
+        scheduler_thread.join(timeout=10)
+        bot.outbox.close()
+        broadcaster.flush()  # итоги доставки, которые ещё не записаны
+        log.info("Broadcast stats: %s", broadcaster.stats())